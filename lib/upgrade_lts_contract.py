@@ -66,8 +66,9 @@ def process_contract_delta_after_apt_lock() -> None:
         sys.exit(1)
 
     past_release = current_codename_to_past_codename[current_release]
-    past_entitlements = UAConfig(series=past_release).entitlements
-    new_entitlements = UAConfig(series=current_release).entitlements
+    cfg = UAConfig()
+    past_entitlements = cfg.entitlements_for_series(past_release)
+    new_entitlements = cfg.entitlements_for_series(current_release)
 
     retry_count = 0
     while out:
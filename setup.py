@@ -3,8 +3,9 @@
 
 import glob
 import setuptools
+from setuptools.command.build_py import build_py
 
-from uaclient import defaults, util, version
+from uaclient import defaults, help_index, manifest, util, version
 
 NAME = "ubuntu-advantage-tools"
 
@@ -37,9 +38,24 @@ def _get_version():
     return major_minor
 
 
+class BuildPyCommand(build_py):
+    """Generate the package data derived from the sources while building."""
+
+    def run(self):
+        # Ship help text precompiled so that ua help does not parse YAML
+        help_index.write_help_index("help_data.yaml", "help_data.json")
+        # Let maintainer scripts list services without importing them all
+        manifest.write_manifest("entitlements.json")
+        super().run()
+
+
 def _get_data_files():
     data_files = [
         ("/etc/ubuntu-advantage", ["uaclient.conf", "help_data.yaml"]),
+        (
+            "/usr/share/ubuntu-advantage",
+            ["help_data.json", "entitlements.json"],
+        ),
         ("/usr/lib/ubuntu-advantage", glob.glob("lib/[!_]*")),
         ("/usr/share/keyrings", glob.glob("keyrings/*")),
         (
@@ -73,6 +89,7 @@ setuptools.setup(
         ]
     ),
     data_files=_get_data_files(),
+    cmdclass={"build_py": BuildPyCommand},
     install_requires=INSTALL_REQUIRES,
     dependency_links=TEST_LINKS,
     extras_require=dict(test=TEST_REQUIRES),
@@ -0,0 +1,240 @@
+"""
+Stable Python API for querying UA client status.
+
+Callers embedding UA client logic should use these functions instead of
+running "ua status --format json" or calling UAConfig internals. The API
+has no side effects: it never writes caches or contacts the contract server
+beyond what computing a status needs, and never changes system state.
+
+Results are immutable namedtuples:
+
+    from uaclient import api
+
+    status = api.get_status(cache=api.CachePolicy.MAX_AGE, max_age=300)
+    if status.attached:
+        print(status.subscription, status.expires)
+    esm = api.get_service_status("esm-infra")
+    print(esm.status)
+
+The cache policy selects where results come from:
+
+    CachePolicy.FRESH    always compute the status now.
+    CachePolicy.CACHED   use the status cache written by the last ua
+                         command run by root, computing it when missing.
+    CachePolicy.MAX_AGE  use the status cache when it was written at most
+                         max_age seconds ago, else compute it.
+
+Computing a status needs root. Other users are answered from the status
+cache with CachePolicy.CACHED and MAX_AGE, and CachePolicy.FRESH raises
+NonRootUserError for them rather than returning cached results.
+"""
+
+import enum
+import os
+import time
+from collections import namedtuple
+
+from uaclient import config, exceptions, util
+
+try:
+    from typing import Any, Dict, Optional  # noqa: F401
+except ImportError:
+    # typing isn't available on trusty, so ignore its absence
+    pass
+
+
+class CachePolicy(enum.Enum):
+    """Where get_status and get_service_status take results from."""
+
+    FRESH = "fresh"
+    CACHED = "cached"
+    MAX_AGE = "max-age"
+
+
+Status = namedtuple(
+    "Status",
+    (
+        "attached",
+        "account",
+        "account_id",
+        "subscription",
+        "subscription_id",
+        "origin",
+        "expires",
+        "tech_support_level",
+        "config_status",
+        "config_status_details",
+        "services",
+    ),
+)
+Status.__doc__ = """\
+Status of this machine. expires is a datetime when the contract sets an
+expiry, else "n/a". services is a tuple of ServiceStatus sorted by name.
+Account and subscription fields are None when unattached."""
+
+ServiceStatus = namedtuple(
+    "ServiceStatus",
+    (
+        "name",
+        "description",
+        "entitled",
+        "status",
+        "status_details",
+        "available",
+    ),
+)
+ServiceStatus.__doc__ = """\
+Status of one service. On attached machines entitled, status and
+status_details are set and available is None. On unattached machines only
+available is set: "yes", "no", or "unknown" for local-only queries without
+cached availability."""
+
+
+class _ReadOnlyConfig(config.UAConfig):
+    """A UAConfig whose caches are never written."""
+
+    def write_cache(self, key: str, content: "Any") -> None:
+        pass
+
+
+def _read_only(cfg: "Optional[config.UAConfig]") -> "config.UAConfig":
+    if cfg is None:
+        return _ReadOnlyConfig()
+    return _ReadOnlyConfig(cfg.cfg, series=cfg.series)
+
+
+def _cached_status(
+    cfg: "config.UAConfig", cache: CachePolicy, max_age: "Optional[float]"
+) -> "Optional[Dict[str, Any]]":
+    """Return the status cache when cache allows its use, else None.
+
+    :raise NonRootUserError: when a non-root user asks for a fresh status.
+    """
+    if cache == CachePolicy.FRESH:
+        if os.getuid() != 0:
+            raise exceptions.NonRootUserError()
+        return None
+    if cache == CachePolicy.MAX_AGE and os.getuid() == 0:
+        if max_age is None:
+            raise ValueError("CachePolicy.MAX_AGE requires max_age")
+        try:
+            mtime = os.stat(cfg.data_path("status-cache")).st_mtime
+        except OSError:
+            return None
+        if time.time() - mtime > max_age:
+            return None
+    response = cfg.read_cache("status-cache", silent=True)
+    if not isinstance(response, dict):
+        return None
+    response.update(cfg.get_config_status())
+    return response
+
+
+def _service_status(service: "Dict[str, Any]") -> ServiceStatus:
+    return ServiceStatus(
+        name=service["name"],
+        description=service.get("description_override")
+        or service.get("description"),
+        entitled=service.get("entitled"),
+        status=service.get("status"),
+        status_details=service.get("statusDetails"),
+        available=service.get("available"),
+    )
+
+
+def get_status(
+    cfg: "Optional[config.UAConfig]" = None,
+    *,
+    cache: CachePolicy = CachePolicy.CACHED,
+    max_age: "Optional[float]" = None,
+    show_beta: bool = False,
+    local_only: bool = False
+) -> Status:
+    """Return the Status of this machine and its services.
+
+    :param cfg: UAConfig to read configuration from, defaults to the system
+        configuration. It is never written through.
+    :param cache: CachePolicy selecting where the status is taken from.
+    :param max_age: Seconds the status cache stays usable with
+        CachePolicy.MAX_AGE.
+    :param show_beta: Include beta services, as ua status --all does.
+    :param local_only: Never contact the contract server when computing the
+        status, see UAConfig.status.
+
+    :raise NonRootUserError: for CachePolicy.FRESH when not run as root.
+    """
+    cfg = _read_only(cfg)
+    response = _cached_status(cfg, cache, max_age)
+    if response is None:
+        response = cfg.status(show_beta=True, local_only=local_only)
+    show_beta |= util.is_config_value_true(
+        config=cfg.cfg, path_to_value="features.allow_beta"
+    )
+    if not show_beta:
+        response = cfg.remove_beta_resources(response)
+    services = sorted(
+        (_service_status(service) for service in response["services"]),
+        key=lambda service: service.name,
+    )
+    return Status(
+        attached=bool(response.get("attached")),
+        account=response.get("account"),
+        account_id=response.get("account-id"),
+        subscription=response.get("subscription"),
+        subscription_id=response.get("subscription-id"),
+        origin=response.get("origin"),
+        expires=response.get("expires"),
+        tech_support_level=response.get("techSupportLevel"),
+        config_status=response.get("configStatus"),
+        config_status_details=response.get("configStatusDetails"),
+        services=tuple(services),
+    )
+
+
+def get_service_status(
+    name: str,
+    cfg: "Optional[config.UAConfig]" = None,
+    *,
+    cache: CachePolicy = CachePolicy.CACHED,
+    max_age: "Optional[float]" = None,
+    local_only: bool = False
+) -> ServiceStatus:
+    """Return the ServiceStatus of the service name.
+
+    When computing the status of an attached machine, only this service
+    is evaluated.
+
+    :raise UserFacingError: when name is not a known service.
+    :raise NonRootUserError: for CachePolicy.FRESH when not run as root.
+    """
+    from uaclient.entitlements import ENTITLEMENT_CLASS_BY_NAME
+
+    ent_cls = ENTITLEMENT_CLASS_BY_NAME.get(name)
+    if ent_cls is None:
+        raise exceptions.UserFacingError(
+            "Unknown service '{}'. Known services: {}".format(
+                name, ", ".join(sorted(ENTITLEMENT_CLASS_BY_NAME))
+            )
+        )
+    cfg = _read_only(cfg)
+    response = _cached_status(cfg, cache, max_age)
+    if response is None and os.getuid() == 0 and cfg.is_attached:
+        return _service_status(
+            cfg.attached_service_status(
+                ent_cls(cfg), cfg.inapplicable_resources(local_only)
+            )
+        )
+    if response is None:
+        response = cfg.status(show_beta=True, local_only=local_only)
+    for service in response.get("services", []):
+        if service["name"] == name:
+            return _service_status(service)
+    # Not reported by the contract server or missing from an old cache
+    return ServiceStatus(
+        name=name,
+        description=ent_cls.description,
+        entitled=None,
+        status=None,
+        status_details=None,
+        available=None,
+    )
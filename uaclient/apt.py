@@ -1,17 +1,20 @@
+import contextlib
 import glob
 import logging
 import os
 import re
 import subprocess
 import tempfile
+import threading
 
+from uaclient import events
 from uaclient import exceptions
 from uaclient import gpg
 from uaclient import status
 from uaclient import util
 
 try:
-    from typing import Dict, List, Optional  # noqa
+    from typing import Callable, Dict, List, Optional, Set, Tuple  # noqa
 except ImportError:
     # typing isn't available on trusty, so ignore its absence
     pass
@@ -25,6 +28,7 @@ APT_KEYS_DIR = "/etc/apt/trusted.gpg.d"
 KEYRINGS_DIR = "/usr/share/keyrings"
 APT_METHOD_HTTPS_FILE = "/usr/lib/apt/methods/https"
 CA_CERTIFICATES_FILE = "/usr/sbin/update-ca-certificates"
+DPKG_STATUS_FILE = "/var/lib/dpkg/status"
 
 # Since we generally have a person at the command line prompt. Don't loop
 # for 5 minutes like charmhelpers because we expect the human to notice and
@@ -32,6 +36,10 @@ CA_CERTIFICATES_FILE = "/usr/sbin/update-ca-certificates"
 # Hope for an optimal first try.
 APT_RETRIES = [1.0, 5.0, 10.0]
 
+# Held while running apt commands so that services whose contract deltas are
+# processed concurrently never contend for the dpkg lock
+apt_lock = threading.RLock()
+
 
 def assert_valid_apt_credentials(repo_url, username, password):
     """Validate apt credentials for a PPA.
@@ -142,9 +150,10 @@ def run_apt_command(
     :raise UserFacingError: on issues running apt-cache policy.
     """
     try:
-        out, _err = util.subp(
-            cmd, capture=True, retry_sleeps=APT_RETRIES, env=env
-        )
+        with apt_lock:
+            out, _err = util.subp(
+                cmd, capture=True, retry_sleeps=APT_RETRIES, env=env
+            )
     except util.ProcessExecutionError as e:
         if "Could not get lock /var/lib/dpkg/lock" in str(e.stderr):
             error_msg += " Another process is running APT."
@@ -160,6 +169,130 @@ def run_apt_command(
     return out
 
 
+class _AptUpdateBatch:
+    """Book-keeping for apt-get update calls deferred by batched_apt_update.
+
+    :param pending: True when an apt-get update was requested and deferred.
+    :param rollbacks: Callables undoing the apt config of each deferred
+        requester, called in reverse order when the deferred update fails.
+    :param flush_lock: Held while flushing, so a lane flushing its deferred
+        update waits for an update another lane took it into.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = False
+        self.rollbacks = []  # type: List[Callable[[], None]]
+
+    def take(self) -> "Optional[List[Callable[[], None]]]":
+        """Return and clear deferred rollbacks, None when nothing pends."""
+        with self.lock:
+            if not self.pending:
+                return None
+            rollbacks, self.rollbacks = self.rollbacks, []
+            self.pending = False
+            return rollbacks
+
+
+_apt_update_batch = None  # type: Optional[_AptUpdateBatch]
+
+
+def _run_apt_update_with_rollbacks(
+    rollbacks: "List[Callable[[], None]]"
+) -> None:
+    print(status.MESSAGE_APT_UPDATING_LISTS)
+    try:
+        with events.phase("apt-update"):
+            run_apt_command(
+                ["apt-get", "update"], status.MESSAGE_APT_UPDATE_FAILED
+            )
+    except exceptions.UserFacingError:
+        for rollback in reversed(rollbacks):
+            try:
+                rollback()
+            except Exception as e:
+                logging.warning("Failed to roll back apt config: %s", str(e))
+        raise
+
+
+def run_apt_update(on_failure: "Optional[Callable[[], None]]" = None) -> None:
+    """Run apt-get update, or defer it when inside batched_apt_update.
+
+    :param on_failure: Optional callable removing the apt config the caller
+        just wrote, called when the apt-get update fails.
+
+    :raise UserFacingError: when apt-get update fails. When deferred, the
+        failure is raised by flush_apt_update or batched_apt_update instead.
+    """
+    batch = _apt_update_batch
+    if batch is not None:
+        with batch.lock:
+            batch.pending = True
+            if on_failure:
+                batch.rollbacks.append(on_failure)
+        return
+    _run_apt_update_with_rollbacks([on_failure] if on_failure else [])
+
+
+def flush_apt_update() -> None:
+    """Run any apt-get update deferred by the active batched_apt_update.
+
+    Call this before installing packages from a repository configured
+    within the batch.
+
+    :raise UserFacingError: when apt-get update fails, after rolling back the
+        apt config of every deferred requester.
+    """
+    batch = _apt_update_batch
+    if batch is None:
+        return
+    with batch.flush_lock:
+        rollbacks = batch.take()
+        if rollbacks is not None:
+            _run_apt_update_with_rollbacks(rollbacks)
+
+
+@contextlib.contextmanager
+def batched_apt_update():
+    """Collapse apt-get update calls made within the context into one.
+
+    Calls to run_apt_update made inside the context are deferred and a
+    single apt-get update is run when the context exits. When that update
+    fails, every deferred requester's on_failure callable rolls back its apt
+    config before the UserFacingError is raised. Nested contexts join the
+    outermost batch.
+    """
+    global _apt_update_batch
+
+    if _apt_update_batch is not None:
+        yield
+        return
+    _apt_update_batch = _AptUpdateBatch()
+    try:
+        yield
+    except Exception:
+        try:
+            flush_apt_update()
+        except exceptions.UserFacingError as e:
+            logging.warning(e.msg)
+        raise
+    else:
+        flush_apt_update()
+    finally:
+        _apt_update_batch = None
+
+
+def _split_credentials(credentials: str) -> "Tuple[str, str]":
+    """Return (username, password) of user:password or bearer credentials."""
+    try:
+        username, password = credentials.split(":")
+    except ValueError:  # Then we have a bearer token
+        username = "bearer"
+        password = credentials
+    return username, password
+
+
 def add_auth_apt_repo(
     repo_filename: str,
     repo_url: str,
@@ -172,11 +305,7 @@ def add_auth_apt_repo(
     @raises: InvalidAPTCredentialsError when the token provided can't access
         the repo PPA.
     """
-    try:
-        username, password = credentials.split(":")
-    except ValueError:  # Then we have a bearer token
-        username = "bearer"
-        password = credentials
+    username, password = _split_credentials(credentials)
     series = util.get_platform_info()["series"]
     if repo_url.endswith("/"):
         repo_url = repo_url[:-1]
@@ -264,6 +393,17 @@ def add_apt_auth_conf_entry(repo_url, login, password):
     util.write_file(apt_auth_file, "\n".join(new_lines), mode=0o600)
 
 
+def update_apt_auth_credentials(repo_url: str, credentials: str) -> None:
+    """Replace the apt auth entry of repo_url with new credentials.
+
+    The sources list, keyring and pins of the repo are left untouched.
+    """
+    username, password = _split_credentials(credentials)
+    if repo_url.endswith("/"):
+        repo_url = repo_url[:-1]
+    add_apt_auth_conf_entry(repo_url, username, password)
+
+
 def remove_repo_from_apt_auth_file(repo_url):
     """Remove a repo from the shared apt auth file"""
     _protocol, repo_path = repo_url.split("://")
@@ -362,21 +502,25 @@ def clean_apt_files(*, _entitlements=None):
     """
     Clean apt files written by uaclient
 
+    The apt files are read from the entitlement manifest, so this does not
+    import the entitlement classes when the manifest has been built.
+
     :param _entitlements:
         The uaclient.entitlements module to use, defaults to
         uaclient.entitlements. (This is only present for testing, because the
         import happens within the function to avoid circular imports.)
     """
-    from uaclient.entitlements.repo import RepoEntitlement
+    from uaclient import manifest
 
     if _entitlements is None:
-        from uaclient import entitlements as _entitlements
+        entries = manifest.get_manifest()
+    else:
+        entries = manifest.compile_manifest(_entitlements.ENTITLEMENT_CLASSES)
 
-    for ent_cls in _entitlements.ENTITLEMENT_CLASSES:
-        if not issubclass(ent_cls, RepoEntitlement):
+    for entry in entries.values():
+        if not entry["files"]:
             continue
-        repo_file = ent_cls.repo_list_file_tmpl.format(name=ent_cls.name)
-        pref_file = ent_cls.repo_pref_file_tmpl.format(name=ent_cls.name)
+        repo_file, pref_file = entry["files"]
 
         if os.path.exists(repo_file):
             logging.info("Removing apt source file: %s", repo_file)
@@ -390,3 +534,21 @@ def clean_apt_files(*, _entitlements=None):
 def get_installed_packages() -> "List[str]":
     out, _ = util.subp(["dpkg-query", "-W", "--showformat=${Package}\\n"])
     return out.splitlines()
+
+
+def get_dpkg_installed_packages() -> "Set[str]":
+    """Return names of installed packages read from the dpkg database.
+
+    Unlike get_installed_packages, this forks no dpkg-query process.
+    """
+    installed = set()
+    package = None
+    for line in util.load_file(DPKG_STATUS_FILE).splitlines():
+        if not line:
+            package = None
+        elif line.startswith("Package:"):
+            package = line.split(":", 1)[1].strip()
+        elif line.startswith("Status:") and package:
+            if line.split()[-1] == "installed":
+                installed.add(package)
+    return installed
@@ -0,0 +1,185 @@
+"""
+Offline contract bundles for attaching machines without network access.
+
+A contract bundle is a JSON document carrying everything an online attach
+fetches from the contract server: the machine-token response, including its
+resourceTokens, and the list of available resources. A sha256 digest of that
+content guards against corruption only. What proves the bundle's origin is
+a detached GPG signature stored next to it as <bundle>.gpg, which must
+verify against the configured keyring. Unsigned bundles are refused unless
+the caller explicitly allows them.
+
+Attaching from a bundle performs no network requests. The next online
+refresh replaces the bundled machine token with the contract server's.
+"""
+
+from datetime import datetime
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from uaclient import exceptions, status, util
+
+try:
+    from typing import Any, Dict, List, Optional  # noqa: F401
+except ImportError:
+    # typing isn't available on trusty, so ignore its absence
+    pass
+
+
+BUNDLE_VERSION = 1
+SIGNATURE_SUFFIX = ".gpg"
+
+
+def _bundle_digest(content: "Dict[str, Any]") -> str:
+    """Return the sha256 hexdigest of the canonical bundle content."""
+    canonical = json.dumps(content, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+def create_contract_bundle(
+    machine_token: "Dict[str, Any]",
+    available_resources: "Optional[List[Dict[str, Any]]]" = None,
+) -> "Dict[str, Any]":
+    """Return a contract bundle for machine_token and available_resources.
+
+    :param machine_token: Dict of a machine-token contract server response.
+    :param available_resources: List of resources as returned by
+        /v1/resources. Defaults to the machine token's availableResources.
+    """
+    if available_resources is None:
+        available_resources = machine_token.get("availableResources", [])
+    content = {
+        "machineToken": machine_token,
+        "availableResources": available_resources,
+    }
+    return {
+        "bundleVersion": BUNDLE_VERSION,
+        "content": content,
+        "sha256": _bundle_digest(content),
+    }
+
+
+def _verify_signature(bundle_path: str, data: bytes, keyring: str) -> None:
+    """Verify the detached signature of bundle_path over data against keyring.
+
+    data is the content read from bundle_path. It is verified from a private
+    copy, so the bundle file cannot change between verification and use.
+
+    :raise UserFacingError: if the signature is missing or does not verify.
+    """
+    signature_path = bundle_path + SIGNATURE_SUFFIX
+    if not os.path.exists(signature_path):
+        raise exceptions.UserFacingError(
+            status.MESSAGE_INVALID_CONTRACT_BUNDLE_TMPL.format(
+                path=bundle_path,
+                reason="missing signature {}".format(signature_path),
+            )
+        )
+    with tempfile.TemporaryDirectory() as tmpd:
+        data_path = os.path.join(tmpd, os.path.basename(bundle_path))
+        with open(data_path, "wb") as stream:
+            stream.write(data)
+        try:
+            util.subp(
+                [
+                    "gpg",
+                    "--batch",
+                    "--no-default-keyring",
+                    "--keyring",
+                    keyring,
+                    "--verify",
+                    signature_path,
+                    data_path,
+                ]
+            )
+        except util.ProcessExecutionError as e:
+            with util.disable_log_to_console():
+                logging.error(str(e))
+            raise exceptions.UserFacingError(
+                status.MESSAGE_INVALID_CONTRACT_BUNDLE_TMPL.format(
+                    path=bundle_path, reason="signature verification failed"
+                )
+            )
+
+
+def _machine_token_error(machine_token: "Any") -> "Optional[str]":
+    """Return why machine_token cannot be attached with, or None."""
+    if not isinstance(machine_token, dict):
+        return "missing machineToken"
+    token_info = machine_token.get("machineTokenInfo")
+    if not isinstance(token_info, dict):
+        return "missing machineTokenInfo"
+    if not isinstance(token_info.get("accountInfo"), dict):
+        return "missing machineTokenInfo accountInfo"
+    contract_info = token_info.get("contractInfo")
+    if not isinstance(contract_info, dict) or not contract_info.get("id"):
+        return "missing machineTokenInfo contractInfo"
+    effective_to = contract_info.get("effectiveTo")
+    if effective_to is not None:
+        try:
+            datetime.strptime(effective_to, "%Y-%m-%dT%H:%M:%SZ")
+        except (TypeError, ValueError):
+            return "invalid contractInfo effectiveTo"
+    return None
+
+
+def read_contract_bundle(
+    bundle_path: str,
+    keyring: "Optional[str]" = None,
+    allow_unsigned: bool = False,
+) -> "Dict[str, Any]":
+    """Load and verify the contract bundle at bundle_path.
+
+    :param bundle_path: Path of the contract bundle JSON file.
+    :param keyring: GPG keyring path. When set, bundle_path must have a
+        detached signature made by a key in the keyring.
+    :param allow_unsigned: Boolean set True to accept the bundle without a
+        signature when no keyring is set.
+
+    :return: Dict with machineToken and availableResources keys.
+    :raise UserFacingError: if the bundle is unreadable, malformed,
+        corrupted, or its signature is missing or does not verify.
+    """
+
+    def invalid(reason):
+        return exceptions.UserFacingError(
+            status.MESSAGE_INVALID_CONTRACT_BUNDLE_TMPL.format(
+                path=bundle_path, reason=reason
+            )
+        )
+
+    try:
+        with open(bundle_path, "rb") as stream:
+            data = stream.read()
+    except (IOError, OSError) as e:
+        raise invalid(str(e))
+    try:
+        bundle = json.loads(data.decode("utf-8"))
+    except ValueError:
+        raise invalid("invalid JSON")
+    if not isinstance(bundle, dict):
+        raise invalid("invalid JSON")
+    if bundle.get("bundleVersion") != BUNDLE_VERSION:
+        raise invalid(
+            "unsupported bundleVersion {}".format(bundle.get("bundleVersion"))
+        )
+    content = bundle.get("content")
+    if not isinstance(content, dict):
+        raise invalid("missing machineToken")
+    error = _machine_token_error(content.get("machineToken"))
+    if error:
+        raise invalid(error)
+    if not isinstance(content.get("availableResources"), list):
+        raise invalid("missing availableResources")
+    if bundle.get("sha256") != _bundle_digest(content):
+        raise invalid("sha256 mismatch")
+    if keyring:
+        _verify_signature(bundle_path, data, keyring)
+    elif not allow_unsigned:
+        raise invalid(
+            "no contract_bundle_keyring configured to verify its signature"
+        )
+    return content
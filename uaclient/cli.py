@@ -3,26 +3,36 @@
 """Client to manage Ubuntu Advantage services on a machine."""
 
 import argparse
+import atexit
+from collections import OrderedDict
 from functools import wraps
 import json
 import logging
+import logging.handlers
 import os
-import pathlib
+import queue
+import stat
 import sys
 import textwrap
 import time
 
 try:
-    from typing import List  # noqa
+    from typing import Any, Dict, List, Optional  # noqa
 except ImportError:
     # typing isn't available on trusty, so ignore its absence
     pass
 
 
+from uaclient import apt
 from uaclient import config
 from uaclient import contract
+from uaclient import daemon
 from uaclient import entitlements
+from uaclient import events
 from uaclient import exceptions
+from uaclient import journal
+from uaclient import metrics
+from uaclient import profiling
 from uaclient import status as ua_status
 from uaclient import util
 from uaclient import version
@@ -54,6 +64,7 @@ STATUS_FORMATS = ["tabular", "json"]
 # UAConfig in order to determine dynamic data_path exception handling of
 # main_error_handler
 _LOCK_FILE = None
+_log_listener = None  # type: Optional[logging.handlers.QueueListener]
 
 
 class UAArgumentParser(argparse.ArgumentParser):
@@ -203,7 +214,8 @@ def attach_parser(parser):
     parser.usage = USAGE_TMPL.format(name=NAME, command="attach <token>")
     parser.prog = "attach"
     parser._optionals.title = "Flags"
-    parser.add_argument(
+    source = parser.add_mutually_exclusive_group()
+    source.add_argument(
         "token",
         nargs="?",  # action_attach asserts this required argument
         help="token obtained for Ubuntu Advantage authentication: {}".format(
@@ -216,6 +228,21 @@ def attach_parser(parser):
         dest="auto_enable",
         help="do not enable any recommended services automatically",
     )
+    source.add_argument(
+        "--bundle",
+        help=(
+            "attach offline from the contract bundle at this path instead"
+            " of a token"
+        ),
+    )
+    parser.add_argument(
+        "--allow-unsigned",
+        action="store_true",
+        help=(
+            "attach from a contract bundle without a signature when no"
+            " contract_bundle_keyring is configured"
+        ),
+    )
     return parser
 
 
@@ -233,6 +260,57 @@ def detach_parser(parser):
     return parser
 
 
+def refresh_parser(parser):
+    """Build or extend an arg parser for refresh subcommand."""
+    usage = USAGE_TMPL.format(name=NAME, command="refresh")
+    parser.usage = usage
+    parser.prog = "refresh"
+    parser._optionals.title = "Flags"
+    parser.add_argument(
+        "--scheduled",
+        action="store_true",
+        help=(
+            "only refresh when this machine's scheduled refresh is due,"
+            " backing off after failures. Used by ua-refresh.timer"
+        ),
+    )
+    return parser
+
+
+def daemon_parser(parser):
+    """Build or extend an arg parser for daemon subcommand."""
+    usage = USAGE_TMPL.format(name=NAME, command="daemon")
+    parser.usage = usage
+    parser.prog = "daemon"
+    parser.description = (
+        "Answer ua status and ua help from memory over a Unix socket,"
+        " until terminated. ua status and ua help use it when it runs."
+    )
+    parser._optionals.title = "Flags"
+    return parser
+
+
+def journal_parser(parser):
+    """Build or extend an arg parser for journal subcommand."""
+    usage = USAGE_TMPL.format(name=NAME, command="journal")
+    parser.usage = usage
+    parser.prog = "journal"
+    parser.description = (
+        "Summarise the operations recorded in the journal: runs, failures"
+        " and durations of each operation and of the phases they went"
+        " through."
+    )
+    parser._optionals.title = "Flags"
+    parser.add_argument(
+        "--format",
+        action="store",
+        choices=["tabular", "json"],
+        default="tabular",
+        help=("output summary in the specified format (default: tabular)"),
+    )
+    return parser
+
+
 def help_parser(parser):
     """Build or extend an arg parser for help subcommand."""
     usage = USAGE_TMPL.format(name=NAME, command="help [service]")
@@ -356,8 +434,15 @@ def status_parser(parser):
         of:
 
         * AVAILABLE: whether this service would be available if this machine
-          were attached. The possible values are yes or no.
-        """
+          were attached. The possible values are yes or no, or unknown
+          with --local-only when availability has never been fetched.
+
+        When run by root while "ua daemon" is running, the status is served
+        from the daemon's memory. Changes to FIPS mode and to livepatch may
+        then take up to {max_age} seconds to show.
+        """.format(
+            max_age=daemon.DAEMON_CACHE_MAX_AGE
+        )
     )
 
     parser.add_argument(
@@ -382,24 +467,38 @@ def status_parser(parser):
         action="store_true",
         help="Allow the visualization of beta services",
     )
+    parser.add_argument(
+        "--local-only",
+        action="store_true",
+        help=(
+            "Report status from local data only, without contacting the"
+            " contract server"
+        ),
+    )
     parser._optionals.title = "Flags"
     return parser
 
 
-def _perform_disable(entitlement_name, cfg, *, assume_yes):
+def _perform_disable(entitlement_name, cfg, *, assume_yes, update_status=True):
     """Perform the disable action on a named entitlement.
 
     :param entitlement_name: the name of the entitlement to enable
     :param cfg: the UAConfig to pass to the entitlement
     :param assume_yes:
         Assume a yes response for any prompts during service enable
+    :param update_status: Boolean set False when the caller updates the
+        status cache itself.
 
     @return: True on success, False otherwise
     """
     ent_cls = entitlements.ENTITLEMENT_CLASS_BY_NAME[entitlement_name]
     entitlement = ent_cls(cfg, assume_yes=assume_yes)
-    ret = entitlement.disable()
-    cfg.status()  # Update the status cache
+    with events.phase("disable", service=entitlement_name) as result:
+        ret = entitlement.disable()
+        if not ret:
+            result["outcome"] = events.OUTCOME_FAILED
+    if update_status:
+        cfg.update_status_cache([entitlement_name])
     return ret
 
 
@@ -435,8 +534,19 @@ def action_disable(args, cfg, **kwargs):
     tmpl = ua_status.MESSAGE_INVALID_SERVICE_OP_FAILURE_TMPL
     ret = True
 
-    for entitlement in entitlements_found:
-        ret &= _perform_disable(entitlement, cfg, assume_yes=args.assume_yes)
+    try:
+        # Remove all apt config first, then run a single apt-get update
+        with apt.batched_apt_update():
+            for entitlement in entitlements_found:
+                ret &= _perform_disable(
+                    entitlement,
+                    cfg,
+                    assume_yes=args.assume_yes,
+                    update_status=False,
+                )
+    finally:
+        if entitlements_found:
+            cfg.update_status_cache(entitlements_found)
 
     if entitlements_not_found:
         valid_names = "Try " + entitlements.ALL_ENTITLEMENTS_STR
@@ -460,7 +570,8 @@ def _perform_enable(
     *,
     assume_yes: bool = False,
     silent_if_inapplicable: bool = False,
-    allow_beta: bool = False
+    allow_beta: bool = False,
+    update_status: bool = True
 ) -> bool:
     """Perform the enable action on a named entitlement.
 
@@ -475,6 +586,8 @@ def _perform_enable(
         don't output messages when determining if an entitlement can be
         enabled on this system
     :param allow_beta: Allow enabling beta services
+    :param update_status: Boolean set False when the caller updates the
+        status cache itself.
 
     @return: True on success, False otherwise
     """
@@ -494,8 +607,12 @@ def _perform_enable(
         )
 
     entitlement = ent_cls(cfg, assume_yes=assume_yes)
-    ret = entitlement.enable(silent_if_inapplicable=silent_if_inapplicable)
-    cfg.status()  # Update the status cache
+    with events.phase("enable", service=entitlement_name) as result:
+        ret = entitlement.enable(silent_if_inapplicable=silent_if_inapplicable)
+        if not ret:
+            result["outcome"] = events.OUTCOME_FAILED
+    if update_status:
+        cfg.update_status_cache([entitlement_name])
     return ret
 
 
@@ -518,20 +635,44 @@ def action_enable(args, cfg, **kwargs):
     entitlements_found, entitlements_not_found = get_valid_entitlement_names(
         names
     )
-    ret = True
+    results = {}  # type: Dict[str, Any]
+
+    def enable_lane(lane):
+        for entitlement in lane:
+            try:
+                results[entitlement] = _perform_enable(
+                    entitlement,
+                    cfg,
+                    assume_yes=args.assume_yes,
+                    allow_beta=args.beta,
+                    update_status=False,
+                )
+            except exceptions.BetaServiceError:
+                results[entitlement] = None
+            except exceptions.UserFacingError as e:
+                print(e)
+                results[entitlement] = True
+            except Exception:
+                results[entitlement] = sys.exc_info()
 
+    try:
+        # Snap-based services install alongside apt-based ones
+        util.run_in_lanes(
+            entitlements.package_system_lanes(entitlements_found), enable_lane
+        )
+    finally:
+        if entitlements_found:
+            cfg.update_status_cache(entitlements_found)
+
+    ret = True
     for entitlement in entitlements_found:
-        try:
-            ret &= _perform_enable(
-                entitlement,
-                cfg,
-                assume_yes=args.assume_yes,
-                allow_beta=args.beta,
-            )
-        except exceptions.BetaServiceError:
+        result = results.get(entitlement)
+        if isinstance(result, tuple):
+            raise result[1].with_traceback(result[2])
+        elif result is None:
             entitlements_not_found.append(entitlement)
-        except exceptions.UserFacingError as e:
-            print(e)
+        else:
+            ret &= result
 
     if entitlements_not_found:
         if args.beta:
@@ -588,8 +729,12 @@ def _detach(cfg: config.UAConfig, assume_yes: bool) -> int:
             print("    {}".format(ent.name))
     if not util.prompt_for_confirmation(assume_yes=assume_yes):
         return 1
-    for ent in to_disable:
-        ent.disable(silent=True)
+    # Remove all apt config first, then run a single apt-get update
+    with apt.batched_apt_update():
+        for ent in to_disable:
+            with events.phase("disable", service=ent.name) as result:
+                if not ent.disable(silent=True):
+                    result["outcome"] = events.OUTCOME_FAILED
     contract_client = contract.UAContractClient(cfg)
     machine_token = cfg.machine_token["machineToken"]
     contract_id = cfg.machine_token["machineTokenInfo"]["contractInfo"]["id"]
@@ -600,13 +745,22 @@ def _detach(cfg: config.UAConfig, assume_yes: bool) -> int:
 
 
 def _attach_with_token(
-    cfg: config.UAConfig, token: str, allow_enable: bool
+    cfg: config.UAConfig, token: str, allow_enable: bool, reattach=False
 ) -> int:
-    """Common functionality to take a token and attach via contract backend"""
+    """Common functionality to take a token and attach via contract backend
+
+    :param reattach: Boolean set True to swap the machine token of an
+        attached machine in place, keeping its enabled services.
+    """
     try:
-        contract.request_updated_contract(
-            cfg, token, allow_enable=allow_enable
-        )
+        if reattach:
+            contract.reattach_with_contract_token(
+                cfg, token, allow_enable=allow_enable
+            )
+        else:
+            contract.request_updated_contract(
+                cfg, token, allow_enable=allow_enable
+            )
     except util.UrlError as exc:
         with util.disable_log_to_console():
             logging.exception(exc)
@@ -630,6 +784,39 @@ def _attach_with_token(
     return 0
 
 
+def _attach_with_bundle(
+    cfg: config.UAConfig,
+    bundle_path: str,
+    allow_enable: bool,
+    allow_unsigned: bool = False,
+) -> int:
+    """Attach from an offline contract bundle without network access"""
+    try:
+        contract.attach_with_contract_bundle(
+            cfg,
+            bundle_path,
+            allow_enable=allow_enable,
+            allow_unsigned=allow_unsigned,
+        )
+    except exceptions.UserFacingError as exc:
+        if not cfg.is_attached:
+            raise exc
+        logging.warning(exc.msg)
+        cfg.status()  # Persist updated status in the event of partial attach
+        return 1
+    contract_name = cfg.machine_token["machineTokenInfo"]["contractInfo"][
+        "name"
+    ]
+    print(
+        ua_status.MESSAGE_ATTACH_SUCCESS_TMPL.format(
+            contract_name=contract_name
+        )
+    )
+
+    action_status(args=None, cfg=cfg)
+    return 0
+
+
 def _get_contract_token_from_cloud_identity(cfg: config.UAConfig) -> str:
     """Detect cloud_type and request a contract token from identity info.
 
@@ -659,10 +846,6 @@ def _get_contract_token_from_cloud_identity(cfg: config.UAConfig) -> str:
         if current_iid == prev_iid:
             raise exceptions.AlreadyAttachedError(cfg)
         print("Re-attaching Ubuntu Advantage subscription on new instance")
-        if _detach(cfg, assume_yes=True) != 0:
-            raise exceptions.UserFacingError(
-                ua_status.MESSAGE_DETACH_AUTOMATION_FAILURE
-            )
     contract_client = contract.UAContractClient(cfg)
     try:
         tokenResponse = contract_client.request_auto_attach_contract_token(
@@ -691,8 +874,19 @@ def action_auto_attach(args, cfg):
         logging.debug(msg)
         print(msg)
         return 0
+    orig_token = cfg.machine_token
+    prev_iid = cfg.read_cache("instance-id", silent=True)
     token = _get_contract_token_from_cloud_identity(cfg)
-    return _attach_with_token(cfg, token=token, allow_enable=True)
+    ret = _attach_with_token(
+        cfg, token=token, allow_enable=True, reattach=bool(orig_token)
+    )
+    if orig_token and cfg.machine_token == orig_token:
+        # The new instance was refused a machine token: retry on next boot
+        if prev_iid:
+            cfg.write_cache("instance-id", prev_iid)
+        else:
+            cfg.delete_cache_key("instance-id")
+    return ret
 
 
 @assert_not_attached
@@ -700,6 +894,14 @@ def action_auto_attach(args, cfg):
 @assert_lock_file("ua attach")
 def action_attach(args, cfg):
     if not args.token:
+        bundle_path = args.bundle or cfg.contract_bundle
+        if bundle_path:
+            return _attach_with_bundle(
+                cfg,
+                bundle_path=bundle_path,
+                allow_enable=args.auto_enable,
+                allow_unsigned=args.allow_unsigned,
+            )
         raise exceptions.UserFacingError(
             ua_status.MESSAGE_ATTACH_REQUIRES_TOKEN
         )
@@ -751,6 +953,27 @@ def get_parser():
         action="store_true",
         help="show all debug log messages to console",
     )
+    parser.add_argument(
+        "--events-fd",
+        type=int,
+        metavar="FD",
+        help="write JSON progress events to the open file descriptor FD",
+    )
+    parser.add_argument(
+        "--events-file",
+        metavar="PATH",
+        help="append JSON progress events to the file PATH",
+    )
+    parser.add_argument(
+        "--profile", action="store_const", const="cpu", help=argparse.SUPPRESS
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_const",
+        const="memory",
+        dest="profile",
+        help=argparse.SUPPRESS,
+    )
     parser.add_argument(
         "--version",
         action="version",
@@ -801,11 +1024,22 @@ def get_parser():
         "refresh",
         help="refresh Ubuntu Advantage services from contracts server",
     )
+    refresh_parser(parser_refresh)
     parser_refresh.set_defaults(action=action_refresh)
     parser_version = subparsers.add_parser(
         "version", help="show version of {}".format(NAME)
     )
     parser_version.set_defaults(action=print_version)
+    parser_daemon = subparsers.add_parser(
+        "daemon", help="serve status and help queries from memory"
+    )
+    daemon_parser(parser_daemon)
+    parser_daemon.set_defaults(action=action_daemon)
+    parser_journal = subparsers.add_parser(
+        "journal", help="summarise the journal of past operations"
+    )
+    journal_parser(parser_journal)
+    parser_journal.set_defaults(action=action_journal)
     parser_help = subparsers.add_parser(
         "help", help="show this help message and exit"
     )
@@ -815,25 +1049,55 @@ def get_parser():
     return parser
 
 
+def _daemon_serves(cfg) -> bool:
+    """Return True when the ua daemon reads the same configuration as cfg.
+
+    The daemon reads the default uaclient.conf without UA_* overrides, so
+    queries for any other configuration are answered in-process.
+    """
+    if any(key.startswith("UA_") for key in os.environ):
+        return False
+    default_path = config.DEFAULT_CONFIG_FILE
+    local_path = os.path.join(os.getcwd(), os.path.basename(default_path))
+    if os.path.exists(local_path) and local_path != default_path:
+        return False  # parse_config prefers it to the default file
+    return cfg.data_dir == config.CONFIG_DEFAULTS["data_dir"]
+
+
+def _query_status(cfg, show_beta: bool, local_only: bool):
+    """Return status from the ua daemon when it serves cfg, else compute it."""
+    if _daemon_serves(cfg):
+        try:
+            return daemon.query(
+                "status", {"show_beta": show_beta, "local_only": local_only}
+            )
+        except daemon.DaemonUnavailable:
+            pass
+    return cfg.status(show_beta=show_beta, local_only=local_only)
+
+
 def action_status(args, cfg):
     if not cfg:
         cfg = config.UAConfig()
-    status = cfg.status()
+    json_format = bool(args and args.format == "json")
+    # Beta services are only listed in tabular output with --all
+    show_beta = bool(args and args.all and not json_format)
+    local_only = bool(args and args.local_only)
+    status = _query_status(cfg, show_beta, local_only)
     active_value = ua_status.UserFacingConfigStatus.ACTIVE.value
     config_active = bool(status["configStatus"] == active_value)
     if args and args.wait and config_active:
         while status["configStatus"] == active_value:
             print(".", end="")
             time.sleep(1)
-            status = cfg.status()
+            status = _query_status(cfg, show_beta, local_only)
         print("")
-    if args and args.format == "json":
+    if json_format:
         if status["expires"] != ua_status.UserFacingStatus.INAPPLICABLE.value:
             status["expires"] = str(status["expires"])
         print(json.dumps(status))
     else:
-        show_beta = args.all if args else False
-        output = ua_status.format_tabular(cfg.status(show_beta))
+        output = ua_status.format_tabular(status)
         # Replace our Unicode dash with an ASCII dash if we aren't going to be
         # writing to a utf-8 output; see
         # https://github.com/CanonicalLtd/ubuntu-advantage-client/issues/859
@@ -862,7 +1126,13 @@ def print_version(_args=None, _cfg=None):
 @assert_lock_file("ua refresh")
 def action_refresh(args, cfg):
     try:
-        contract.request_updated_contract(cfg)
+        if args.scheduled:
+            if not contract.scheduled_refresh(cfg):
+                # Not an actual refresh: main neither times nor journals it
+                args.skipped = True
+                return 0
+        else:
+            contract.request_updated_contract(cfg)
     except util.UrlError as exc:
         with util.disable_log_to_console():
             logging.exception(exc)
@@ -871,6 +1141,21 @@ def action_refresh(args, cfg):
     return 0
 
 
+@assert_root
+def action_daemon(args, cfg):
+    daemon.serve(config.UAConfig)
+    return 0
+
+
+def action_journal(args, cfg):
+    summary = journal.summarise(journal.read_entries(cfg))
+    if args.format == "json":
+        print(json.dumps(summary, sort_keys=True))
+    else:
+        print(journal.format_summary(summary))
+    return 0
+
+
 def action_help(args, cfg):
     service = args.service
     show_all = args.all
@@ -882,7 +1167,16 @@ def action_help(args, cfg):
     if not cfg:
         cfg = config.UAConfig()
 
-    help_response = cfg.help(service)
+    help_response = None
+    if _daemon_serves(cfg):
+        try:
+            help_response = OrderedDict(
+                daemon.query("help", {"name": service})
+            )
+        except daemon.DaemonUnavailable:
+            pass
+    if help_response is None:
+        help_response = cfg.help(service)
 
     if args.format == "json":
         print(json.dumps(help_response))
@@ -919,14 +1213,52 @@ def setup_logging(console_level, log_level, log_file=None):
         root.addHandler(console)
     if os.getuid() == 0:
         # Setup readable-by-root-only debug file logging if running as root
-        log_file_path = pathlib.Path(log_file)
-        log_file_path.touch()
-        log_file_path.chmod(0o600)
-
-        filehandler = logging.FileHandler(log_file)
-        filehandler.setLevel(log_level)
+        _create_private_log_file(log_file)
+        filehandler = logging.FileHandler(log_file, delay=True)
         filehandler.setFormatter(log_formatter)
-        root.addHandler(filehandler)
+        _start_file_logging(root, filehandler, log_level)
+
+
+def _create_private_log_file(log_file: str) -> None:
+    """Create log_file readable by root only, fixing the mode when not."""
+    fd = os.open(log_file, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600)
+    try:
+        if stat.S_IMODE(os.fstat(fd).st_mode) != 0o600:
+            os.fchmod(fd, 0o600)
+    finally:
+        os.close(fd)
+
+
+def _start_file_logging(root, filehandler, log_level) -> None:
+    """Log to filehandler from a listener thread, through a queue.
+
+    Callers only format and enqueue records; writing the log file stays off
+    their path.
+    """
+    global _log_listener
+    stop_file_logging()
+    for handler in list(root.handlers):
+        if handler.get_name() == "file":
+            root.removeHandler(handler)
+    log_queue = queue.Queue()  # type: queue.Queue
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.setLevel(log_level)
+    queue_handler.set_name("file")
+    root.addHandler(queue_handler)
+    _log_listener = logging.handlers.QueueListener(log_queue, filehandler)
+    _log_listener.start()
+    atexit.unregister(stop_file_logging)
+    atexit.register(stop_file_logging)
+
+
+def stop_file_logging() -> None:
+    """Write out queued log records and close the log file."""
+    global _log_listener
+    listener, _log_listener = _log_listener, None
+    if listener is not None:
+        listener.stop()
+        for handler in listener.handlers:
+            handler.close()
 
 
 def main_error_handler(func):
@@ -984,7 +1316,27 @@ def main(sys_argv=None):
     console_level = logging.DEBUG if args.debug else logging.INFO
     setup_logging(console_level, log_level, cfg.log_file)
     logging.debug("Executed with sys.argv: %r", sys_argv)
-    return args.action(args, cfg)
+    events.start_stream(fd=args.events_fd, path=args.events_file)
+    events.start_recording()
+    started = events.timestamp()
+    result = {}  # type: Dict[str, Any]
+    try:
+        mode = profiling.profile_mode(args)
+        with profiling.profiled(cfg, args.command, mode):
+            with events.phase(args.command) as result:
+                ret = args.action(args, cfg)
+                if ret:
+                    result["outcome"] = events.OUTCOME_FAILED
+        return ret
+    finally:
+        events.stop_stream()
+        phases = events.stop_recording()
+        skipped = getattr(args, "skipped", False)
+        if os.getuid() == 0:
+            if args.command in metrics.TIMED_OPERATIONS and not skipped:
+                metrics.record_operation(cfg, args.command, result)
+            if args.command in journal.JOURNALED_OPERATIONS and not skipped:
+                journal.record_operation(cfg, args.command, started, phases)
 
 
 if __name__ == "__main__":
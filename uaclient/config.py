@@ -6,18 +6,24 @@ import os
 import yaml
 from collections import namedtuple, OrderedDict
 
-from uaclient import status, util
-from uaclient.defaults import CONFIG_DEFAULTS, DEFAULT_CONFIG_FILE
+from uaclient import metrics, status, util
+from uaclient.defaults import (
+    CONFIG_DEFAULTS,
+    DEFAULT_CONFIG_FILE,
+    DEFAULT_METRICS_FILE,
+)
 from uaclient import exceptions
 
 try:
-    from typing import Any, cast, Dict, Optional  # noqa: F401
+    from typing import Any, cast, Dict, Iterable, List, Optional  # noqa: F401
 except ImportError:
     # typing isn't available on trusty, so ignore its absence
     def cast(_, x):  # type: ignore
         return x
 
 
+DEFAULT_REFRESH_INTERVAL = 6 * 60 * 60  # seconds
+
 DEFAULT_STATUS = {
     "_doc": "Content provided in json response is currently considered"
     " Experimental and may change",
@@ -50,11 +56,17 @@ class UAConfig:
         "instance-id": DataPath("instance-id", True),
         "machine-id": DataPath("machine-id", True),
         "machine-token": DataPath("machine-token.json", True),
+        "available-resources": DataPath("available-resources.json", False),
+        "livepatch-status": DataPath("livepatch-status.json", False),
         "lock": DataPath("lock", True),
+        "operation-timings": DataPath("operation-timings.json", False),
+        "refresh-state": DataPath("refresh-state.json", False),
         "status-cache": DataPath("status.json", False),
     }  # type: Dict[str, DataPath]
 
-    _entitlements = None  # caching to avoid repetitive file reads
+    # Entitlement views of the loaded machine token keyed by series, None
+    # until the first view is compiled
+    _entitlement_views = None  # type: Optional[Dict[Optional[str], Any]]
     _machine_token = None  # caching to avoid repetitive file reading
 
     def __init__(
@@ -84,6 +96,32 @@ class UAConfig:
     def data_dir(self):
         return self.cfg["data_dir"]
 
+    @property
+    def contract_bundle(self) -> "Optional[str]":
+        """Path of an offline contract bundle used by ua attach."""
+        return self.cfg.get("contract_bundle")
+
+    @property
+    def contract_bundle_keyring(self) -> "Optional[str]":
+        """Path of the GPG keyring which must have signed contract bundles."""
+        return self.cfg.get("contract_bundle_keyring")
+
+    @property
+    def refresh_interval(self) -> int:
+        """Seconds between scheduled contract refreshes."""
+        try:
+            interval = int(self.cfg.get("refresh_interval", 0))
+        except (TypeError, ValueError):
+            interval = 0
+        if interval <= 0:
+            return DEFAULT_REFRESH_INTERVAL
+        return interval
+
+    @property
+    def metrics_file(self) -> "Optional[str]":
+        """Path of the Prometheus textfile collector file, None to disable."""
+        return self.cfg.get("metrics_file", DEFAULT_METRICS_FILE) or None
+
     @property
     def log_level(self):
         log_level = self.cfg.get("log_level")
@@ -100,32 +138,32 @@ class UAConfig:
     def entitlements(self):
         """Return a dictionary of entitlements keyed by entitlement name.
 
-        Return an empty dict if no entitlements are present.
+        Series overrides of self.series, or of this machine's series, are
+        applied. Return an empty dict if no entitlements are present.
+        """
+        return self.entitlements_for_series(self.series)
+
+    def entitlements_for_series(
+        self, series: "Optional[str]"
+    ) -> "Dict[str, Any]":
+        """Return the entitlements of the machine token as seen on series.
+
+        Views are compiled once per loaded machine token and series, and are
+        read-only: use copy.deepcopy for a dict which can be changed. The
+        machine token itself is never changed.
+
+        :param series: Series whose overrides apply, None for this machine.
         """
-        if self._entitlements:
-            return self._entitlements
         machine_token = self.machine_token
         if not machine_token:
             return {}
-
-        self._entitlements = {}
-        contractInfo = machine_token["machineTokenInfo"]["contractInfo"]
-        tokens_by_name = dict(
-            (e["type"], e["token"])
-            for e in machine_token.get("resourceTokens", [])
-        )
-        ent_by_name = dict(
-            (e["type"], e) for e in contractInfo["resourceEntitlements"]
-        )
-        for entitlement_name, ent_value in ent_by_name.items():
-            entitlement_cfg = {"entitlement": ent_value}
-            if entitlement_name in tokens_by_name:
-                entitlement_cfg["resourceToken"] = tokens_by_name[
-                    entitlement_name
-                ]
-            util.apply_series_overrides(entitlement_cfg, self.series)
-            self._entitlements[entitlement_name] = entitlement_cfg
-        return self._entitlements
+        if self._entitlement_views is None:
+            self._entitlement_views = {}
+        if series not in self._entitlement_views:
+            self._entitlement_views[series] = _compile_entitlements(
+                machine_token, series
+            )
+        return self._entitlement_views[series]
 
     @property
     def is_attached(self):
@@ -213,7 +251,7 @@ class UAConfig:
                 "Invalid or empty key provided to delete_cache_key"
             )
         if key == "machine-token":
-            self._entitlements = None
+            self._entitlement_views = None
             self._machine_token = None
         cache_path = self.data_path(key)
         self._perform_delete(cache_path)
@@ -245,7 +283,7 @@ class UAConfig:
                 os.chmod(data_dir, 0o700)
         if key == "machine-token":
             self._machine_token = None
-            self._entitlements = None
+            self._entitlement_views = None
         if not isinstance(content, str):
             content = json.dumps(content, cls=util.DatetimeAwareJSONEncoder)
         mode = 0o600
@@ -253,8 +291,10 @@ class UAConfig:
             if not self.data_paths[key].private:
                 mode = 0o644
         util.write_file(filepath, content, mode=mode)
+        if key in ("status-cache", "refresh-state"):
+            metrics.write_metrics(self)
 
-    def _remove_beta_resources(self, response) -> "Dict[str, Any]":
+    def remove_beta_resources(self, response) -> "Dict[str, Any]":
         """ Remove beta services from response dict"""
         from uaclient.entitlements import ENTITLEMENT_CLASS_BY_NAME
 
@@ -283,7 +323,7 @@ class UAConfig:
 
         return new_response
 
-    def _get_config_status(self) -> "Dict[str, str]":
+    def get_config_status(self) -> "Dict[str, str]":
         """Return a dict with configStatus and configStatusDetails keys.
 
             Values for configStatus will be one of UserFacingConfigStatus enum:
@@ -306,16 +346,45 @@ class UAConfig:
             )
         return {"configStatus": status_val, "configStatusDetails": status_desc}
 
-    def _unattached_status(self) -> "Dict[str, Any]":
-        """Return unattached status as a dict."""
+    def _available_resources(
+        self, local_only: bool = False
+    ) -> "Optional[List[Dict[str, Any]]]":
+        """Return the resources available to this machine.
+
+        :param local_only: Only return the resources cached by the last
+            query, or None when there are none, instead of contacting the
+            contract server.
+        """
         from uaclient.contract import get_available_resources
-        from uaclient.entitlements import ENTITLEMENT_CLASS_BY_NAME
+
+        if local_only:
+            return self.read_cache("available-resources", silent=True)
+        return get_available_resources(self)
+
+    def _unattached_status(self, local_only: bool = False) -> "Dict[str, Any]":
+        """Return unattached status as a dict.
+
+        :param local_only: Take availability from cached resources, marking
+            it unknown when none are cached, instead of contacting the
+            contract server.
+        """
+        from uaclient.entitlements import (
+            ENTITLEMENT_CLASSES,
+            ENTITLEMENT_CLASS_BY_NAME,
+        )
 
         response = copy.deepcopy(DEFAULT_STATUS)
-        resources = get_available_resources(self)
+        resources = self._available_resources(local_only)
+        if resources is None:
+            resources = [
+                {"name": ent_cls.name, "available": None}
+                for ent_cls in ENTITLEMENT_CLASSES
+            ]
 
         for resource in sorted(resources, key=lambda x: x["name"]):
-            if resource["available"]:
+            if resource["available"] is None:
+                available = status.UserFacingAvailability.UNKNOWN.value
+            elif resource["available"]:
                 available = status.UserFacingAvailability.AVAILABLE.value
             else:
                 available = status.UserFacingAvailability.UNAVAILABLE.value
@@ -338,9 +407,14 @@ class UAConfig:
             )
         return response
 
-    def _attached_service_status(
+    def attached_service_status(
         self, ent, inapplicable_resources
     ) -> "Dict[str, Optional[str]]":
+        """Return the status-cache entry of entitlement ent.
+
+        :param inapplicable_resources: Descriptions of unavailable resources
+            keyed by name, as returned by inapplicable_resources.
+        """
         details = ""
         description_override = None
         contract_status = ent.contract_status()
@@ -361,11 +435,8 @@ class UAConfig:
             "description_override": description_override,
         }
 
-    def _attached_status(self) -> "Dict[str, Any]":
-        """Return configuration of attached status as a dictionary."""
-        from uaclient.contract import get_available_resources
-        from uaclient.entitlements import ENTITLEMENT_CLASSES
-
+    def _attached_status_header(self) -> "Dict[str, Any]":
+        """Return attached status without any services as a dictionary."""
         response = copy.deepcopy(DEFAULT_STATUS)
         contractInfo = self.machine_token["machineTokenInfo"]["contractInfo"]
         response.update(
@@ -382,31 +453,66 @@ class UAConfig:
             response["expires"] = datetime.strptime(
                 contractInfo["effectiveTo"], "%Y-%m-%dT%H:%M:%SZ"
             )
+        support = self.entitlements.get("support", {}).get("entitlement")
+        if support:
+            supportLevel = support.get("affordances", {}).get("supportLevel")
+            if not supportLevel:
+                supportLevel = DEFAULT_STATUS["techSupportLevel"]
+            response["techSupportLevel"] = supportLevel
+        return response
+
+    def inapplicable_resources(
+        self, local_only: bool = False
+    ) -> "Dict[str, Optional[str]]":
+        """Return descriptions of unavailable resources keyed by name.
 
+        :param local_only: Never contact the contract server. Without
+            cached resources, no resource is reported unavailable.
+        """
         resources = self.machine_token.get("availableResources")
         if not resources:
-            resources = get_available_resources(self)
+            resources = self._available_resources(local_only) or []
 
-        inapplicable_resources = {
+        return {
             resource["name"]: resource.get("description")
             for resource in sorted(resources, key=lambda x: x["name"])
             if not resource["available"]
         }
 
+    def _attached_status(self, local_only: bool = False) -> "Dict[str, Any]":
+        """Return configuration of attached status as a dictionary."""
+        from uaclient.entitlements import ENTITLEMENT_CLASSES
+
+        response = self._attached_status_header()
+        inapplicable_resources = self.inapplicable_resources(local_only)
         for ent_cls in ENTITLEMENT_CLASSES:
             ent = ent_cls(self)
             response["services"].append(
-                self._attached_service_status(ent, inapplicable_resources)
+                self.attached_service_status(ent, inapplicable_resources)
             )
-        support = self.entitlements.get("support", {}).get("entitlement")
-        if support:
-            supportLevel = support.get("affordances", {}).get("supportLevel")
-            if not supportLevel:
-                supportLevel = DEFAULT_STATUS["techSupportLevel"]
-            response["techSupportLevel"] = supportLevel
         return response
 
-    def status(self, show_beta=False) -> "Dict[str, Any]":
+    def _finish_status(
+        self,
+        response: "Dict[str, Any]",
+        show_beta: bool,
+        write_cache: bool = True,
+    ) -> "Dict[str, Any]":
+        """Add config status to response, cache it as root and filter beta."""
+        response.update(self.get_config_status())
+        if write_cache and os.getuid() == 0:
+            self.write_cache("status-cache", response)
+
+        config_allow_beta = util.is_config_value_true(
+            config=self.cfg, path_to_value="features.allow_beta"
+        )
+        show_beta |= config_allow_beta
+        if not show_beta:
+            response = self.remove_beta_resources(response)
+
+        return response
+
+    def status(self, show_beta=False, local_only=False) -> "Dict[str, Any]":
         """Return status as a dict, using a cache for non-root users
 
         When unattached, get available resources from the contract service
@@ -414,27 +520,76 @@ class UAConfig:
         machine.
 
         Write the status-cache when called by root.
+
+        :param local_only: Never contact the contract server. Availability
+            is taken from the machine token or the resources cached by the
+            last online status, and is reported unknown without either. The
+            status-cache is left untouched.
         """
         if os.getuid() != 0:
             response = cast("Dict[str, Any]", self.read_cache("status-cache"))
             if not response:
-                response = self._unattached_status()
+                response = self._unattached_status(local_only)
         elif not self.is_attached:
-            response = self._unattached_status()
+            response = self._unattached_status(local_only)
         else:
-            response = self._attached_status()
-        response.update(self._get_config_status())
-        if os.getuid() == 0:
-            self.write_cache("status-cache", response)
+            response = self._attached_status(local_only)
+        return self._finish_status(
+            response, show_beta, write_cache=not local_only
+        )
 
-        config_allow_beta = util.is_config_value_true(
-            config=self.cfg, path_to_value="features.allow_beta"
+    def update_status_cache(
+        self, names: "Iterable[str]", show_beta=False
+    ) -> "Dict[str, Any]":
+        """Patch the status-cache entries of services names and return status.
+
+        Entitlement operations call this with the services they touched.
+        Services incompatible with a touched service, in either direction,
+        are evaluated again with it. The status of every other service is
+        kept from the status-cache. Falls back to a full status when the
+        cache does not describe this attached contract.
+        """
+        from uaclient.entitlements import (
+            ENTITLEMENT_CLASSES,
+            ENTITLEMENT_CLASS_BY_NAME,
         )
-        show_beta |= config_allow_beta
-        if not show_beta:
-            response = self._remove_beta_resources(response)
 
-        return response
+        if os.getuid() != 0 or not self.is_attached:
+            return self.status(show_beta=show_beta)
+        cached = self.read_cache("status-cache", silent=True)
+        response = self._attached_status_header()
+        if not isinstance(cached, dict) or not cached.get("attached"):
+            return self.status(show_beta=show_beta)
+        if cached.get("subscription-id") != response["subscription-id"]:
+            return self.status(show_beta=show_beta)
+        services = dict(
+            (service.get("name"), service)
+            for service in cached.get("services", [])
+        )
+        if set(services) != set(ENTITLEMENT_CLASS_BY_NAME):
+            return self.status(show_beta=show_beta)
+        touched = set(names)
+        names = set(touched)
+        for ent_cls in ENTITLEMENT_CLASSES:
+            if ent_cls.name in touched:
+                names.update(
+                    name
+                    for name in ent_cls.incompatible_services
+                    if name in services
+                )
+            elif touched.intersection(ent_cls.incompatible_services):
+                names.add(ent_cls.name)
+        if names:
+            inapplicable_resources = self.inapplicable_resources()
+            for name in names:
+                ent = ENTITLEMENT_CLASS_BY_NAME[name](self)
+                services[name] = self.attached_service_status(
+                    ent, inapplicable_resources
+                )
+        response["services"] = [
+            services[ent_cls.name] for ent_cls in ENTITLEMENT_CLASSES
+        ]
+        return self._finish_status(response, show_beta)
 
     def help(self, name):
         """Return help information from an uaclient service as a dict
@@ -443,10 +598,9 @@ class UAConfig:
 
         :raises: UserFacingError when no help is available.
         """
-        from uaclient.contract import get_available_resources
         from uaclient.entitlements import ENTITLEMENT_CLASS_BY_NAME
 
-        resources = get_available_resources(self)
+        resources = self._available_resources()
         help_resource = None
 
         # We are using an OrderedDict here to guarantee
@@ -468,7 +622,7 @@ class UAConfig:
             )
 
         if self.is_attached:
-            service_status = self._attached_service_status(help_ent, {})
+            service_status = self.attached_service_status(help_ent, {})
             status_msg = service_status["status"]
 
             response_dict["entitled"] = service_status["entitled"]
@@ -489,6 +643,30 @@ class UAConfig:
         return response_dict
 
 
+def _compile_entitlements(
+    machine_token: "Dict[str, Any]", series: "Optional[str]"
+) -> "Dict[str, Any]":
+    """Return the read-only entitlements of machine_token on series."""
+    contractInfo = machine_token["machineTokenInfo"]["contractInfo"]
+    ent_values = contractInfo["resourceEntitlements"]
+    if series is None and ent_values:
+        series = util.get_platform_info()["series"]
+    tokens_by_name = dict(
+        (e["type"], e["token"])
+        for e in machine_token.get("resourceTokens", [])
+    )
+    entitlements = {}
+    for ent_value in ent_values:
+        entitlement_name = ent_value["type"]
+        entitlement_cfg = {"entitlement": ent_value}
+        if entitlement_name in tokens_by_name:
+            entitlement_cfg["resourceToken"] = tokens_by_name[entitlement_name]
+        entitlements[entitlement_name] = util.freeze(
+            util.with_series_overrides(entitlement_cfg, series)
+        )
+    return util.ReadOnlyDict(entitlements)
+
+
 def parse_config(config_path=None):
     """Parse known UA config file
 
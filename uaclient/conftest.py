@@ -83,7 +83,8 @@ def logging_sandbox():
 def FakeConfig(tmpdir):
     class _FakeConfig(UAConfig):
         def __init__(self, features_override=None) -> None:
-            super().__init__({"data_dir": tmpdir.strpath})
+            # Never publish metrics of tests to a real textfile collector
+            super().__init__({"data_dir": tmpdir.strpath, "metrics_file": ""})
 
         @classmethod
         def for_attached_machine(
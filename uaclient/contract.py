@@ -1,15 +1,24 @@
-from datetime import datetime
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+import hashlib
 import logging
+import os
+import sys
+import threading
+import time
 import urllib
 
+from uaclient import apt
+from uaclient import bundle
 from uaclient import clouds
+from uaclient import events
 from uaclient import exceptions
 from uaclient import status
 from uaclient import serviceclient
 from uaclient import util
 
 try:
-    from typing import Any, Dict, List, Optional  # noqa: F401
+    from typing import Any, Dict, List, Optional, Tuple  # noqa: F401
 except ImportError:
     # typing isn't available on trusty, so ignore its absence
     pass
@@ -24,6 +33,46 @@ API_V1_TMPL_RESOURCE_MACHINE_ACCESS = (
 )
 API_V1_AUTO_ATTACH_CLOUD_TOKEN = "/v1/clouds/{cloud_type}/token"
 
+REFRESH_BACKOFF_BASE = 5 * 60  # seconds before the first scheduled retry
+REFRESH_REUSE_SECONDS = 60  # seconds a completed refresh is shared for
+
+
+class _RefreshFlight:
+    """One machine token refresh, shared by every caller in this process.
+
+    :param machine_token: The machineToken being refreshed. Callers holding
+        it, or the refreshed machineToken, share this refresh.
+    """
+
+    def __init__(self, machine_token: str) -> None:
+        self.machine_tokens = set([machine_token])
+        self.fetched = threading.Event()  # Set once the new token arrived
+        self.done = threading.Event()  # Set once its deltas were processed
+        self.done_at = None  # type: Optional[float]
+        self.error = None  # type: Optional[BaseException]
+
+    def shared_with(self, machine_token: str) -> bool:
+        """Return True when a caller holding machine_token can share it."""
+        if machine_token not in self.machine_tokens:
+            return False
+        if self.done_at is None:
+            return True  # Still in flight
+        return time.monotonic() - self.done_at < REFRESH_REUSE_SECONDS
+
+    def fetch(self, machine_token: str) -> None:
+        self.machine_tokens.add(machine_token)
+        self.fetched.set()
+
+    def finish(self, error: "Optional[BaseException]" = None) -> None:
+        self.error = error
+        self.done_at = time.monotonic()
+        self.done.set()
+
+
+# In-flight or recently completed refreshes keyed by data_dir
+_refresh_flights = {}  # type: Dict[str, _RefreshFlight]
+_refresh_flights_lock = threading.Lock()
+
 
 class ContractAPIError(util.UrlError):
     def __init__(self, e, error_response):
@@ -189,6 +238,39 @@ class UAContractClient(serviceclient.UAServiceClient):
         return {"machineId": machine_id, "architecture": arch, "os": platform}
 
 
+def _has_entitlement_delta(
+    orig_access: "Dict[str, Any]", new_access: "Dict[str, Any]"
+) -> bool:
+    """Return True when process_entitlement_delta may find any deltas.
+
+    Series overrides are not applied: those still pending in new_access
+    only make this report a delta where there may be none.
+    """
+    return bool(util.get_dict_deltas(orig_access, new_access))
+
+
+def _entitlement_delta_lanes(
+    past_entitlements: "Dict[str, Any]", new_entitlements: "Dict[str, Any]"
+) -> "List[List[str]]":
+    """Group entitlement names into lanes which can be processed concurrently.
+
+    Only entitlements with deltas are linked by their incompatible_services.
+    See entitlements.package_system_lanes.
+
+    :return: List of lanes, each a sorted list of entitlement names.
+    """
+    from uaclient.entitlements import package_system_lanes
+
+    changed = [
+        name
+        for name in new_entitlements
+        if _has_entitlement_delta(
+            past_entitlements.get(name, {}), new_entitlements[name]
+        )
+    ]
+    return package_system_lanes(new_entitlements, changed)
+
+
 def process_entitlements_delta(
     past_entitlements: "Dict[str, Any]",
     new_entitlements: "Dict[str, Any]",
@@ -198,6 +280,10 @@ def process_entitlements_delta(
     """Iterate over all entitlements in new_entitlement and apply any delta
     found according to past_entitlements.
 
+    Entitlements are grouped into lanes by _entitlement_delta_lanes and each
+    lane is processed in its own thread, so snap-based Livepatch deltas
+    overlap with apt-based ones.
+
     :param past_entitlements: dict containing the last valid information
         regarding service entitlements.
     :param new_entitlements: dict containing the current information regarding
@@ -208,30 +294,52 @@ def process_entitlements_delta(
     :param series_overrides: Boolean set True if series overrides should be
         applied to the new_access dict.
     """
+    failures = []  # type: List[Tuple[str, bool, Any]]
+
+    def process_lane(lane):
+        for name in lane:
+            try:
+                with events.phase("contract-delta", service=name):
+                    process_entitlement_delta(
+                        past_entitlements.get(name, {}),
+                        new_entitlements[name],
+                        allow_enable=allow_enable,
+                        series_overrides=series_overrides,
+                    )
+            except exceptions.UserFacingError:
+                failures.append((name, False, sys.exc_info()))
+            except Exception:
+                failures.append((name, True, sys.exc_info()))
+
     delta_error = False
     unexpected_error = False
-    for name, new_entitlement in sorted(new_entitlements.items()):
-        try:
-            process_entitlement_delta(
-                past_entitlements.get(name, {}),
-                new_entitlement,
-                allow_enable=allow_enable,
-                series_overrides=series_overrides,
+    try:
+        # Run a single apt-get update once all apt config is written
+        with apt.batched_apt_update():
+            lanes = _entitlement_delta_lanes(
+                past_entitlements, new_entitlements
             )
-        except exceptions.UserFacingError:
-            delta_error = True
-            with util.disable_log_to_console():
-                logging.exception(
-                    "Failed to process contract delta for {name}:"
-                    " {delta}".format(name=name, delta=new_entitlement)
-                )
-        except Exception:
-            unexpected_error = True
-            with util.disable_log_to_console():
-                logging.exception(
-                    "Unexpected error processing contract delta for {name}:"
-                    " {delta}".format(name=name, delta=new_entitlement)
-                )
+            util.run_in_lanes(lanes, process_lane)
+            for name, unexpected, exc_info in sorted(
+                failures, key=lambda failure: failure[0]
+            ):
+                if unexpected:
+                    unexpected_error = True
+                    msg = "Unexpected error processing contract delta for"
+                else:
+                    delta_error = True
+                    msg = "Failed to process contract delta for"
+                with util.disable_log_to_console():
+                    logging.error(
+                        "{msg} {name}: {delta}".format(
+                            msg=msg, name=name, delta=new_entitlements[name]
+                        ),
+                        exc_info=exc_info,
+                    )
+    except exceptions.UserFacingError:
+        delta_error = True
+        with util.disable_log_to_console():
+            logging.exception("Failed to update apt after contract deltas")
     if unexpected_error:
         raise exceptions.UserFacingError(status.MESSAGE_UNEXPECTED_ERROR)
     elif delta_error:
@@ -264,7 +372,7 @@ def process_entitlement_delta(
     from uaclient.entitlements import ENTITLEMENT_CLASS_BY_NAME
 
     if series_overrides:
-        util.apply_series_overrides(new_access)
+        new_access = util.with_series_overrides(new_access)
 
     deltas = util.get_dict_deltas(orig_access, new_access)
     if deltas:
@@ -298,6 +406,12 @@ def request_updated_contract(
 
     Compare original token to new token and react to entitlement deltas.
 
+    Refreshes of an attached machine are single-flight within a process:
+    callers asking while one is in flight share its outcome, including any
+    error processing its deltas. Callers asking within REFRESH_REUSE_SECONDS
+    of a successful refresh return without contacting the contract server
+    and processing deltas again. Failed refreshes are not reused.
+
     :param cfg: Instance of UAConfig for this machine.
     :param contract_token: String contraining an optional contract token.
     :param allow_enable: Boolean set True if allowed to perform the enable
@@ -315,32 +429,210 @@ def request_updated_contract(
             "Got unexpected contract_token on an already attached machine"
         )
     contract_client = UAContractClient(cfg)
+    flight = None  # type: Optional[_RefreshFlight]
     if contract_token:  # We are a mid ua-attach and need to get machinetoken
-        try:
-            new_token = contract_client.request_contract_machine_attach(
-                contract_token=contract_token
+        with events.phase("contract-request"):
+            new_token = _request_machine_attach(
+                contract_client, contract_token
             )
-        except util.UrlError as e:
-            if isinstance(e, ContractAPIError):
-                if hasattr(e, "code"):
-                    if e.code == 401:
-                        raise exceptions.UserFacingError(
-                            status.MESSAGE_ATTACH_INVALID_TOKEN
-                        )
-                    elif e.code == 403:
-                        raise exceptions.UserFacingError(
-                            status.MESSAGE_ATTACH_EXPIRED_TOKEN
-                        )
-                raise e
-            with util.disable_log_to_console():
-                logging.exception(str(e))
-            raise exceptions.UserFacingError(status.MESSAGE_CONNECTIVITY_ERROR)
     else:
         machine_token = orig_token["machineToken"]
+        with _refresh_flights_lock:
+            flight = _refresh_flights.get(cfg.data_dir)
+            if flight and flight.shared_with(machine_token):
+                shared = True
+            else:
+                flight = _RefreshFlight(machine_token)
+                _refresh_flights[cfg.data_dir] = flight
+                shared = False
+        if shared:
+            if flight.fetched.is_set() and not flight.done.is_set():
+                # The token is refreshed and its deltas are being processed,
+                # which may enable services asking for a refresh themselves
+                logging.debug("Contract refresh already processing deltas")
+                return
+            # Another caller refreshes, or just refreshed, this token
+            logging.debug("Sharing contract refresh already in progress")
+            flight.done.wait()
+            if flight.error:
+                raise flight.error
+            return
         contract_id = orig_token["machineTokenInfo"]["contractInfo"]["id"]
-        new_token = contract_client.request_machine_token_update(
-            machine_token=machine_token, contract_id=contract_id
+        try:
+            with events.phase("contract-request"):
+                new_token = contract_client.request_machine_token_update(
+                    machine_token=machine_token, contract_id=contract_id
+                )
+        except BaseException as e:
+            _finish_refresh(cfg, flight, e)
+            raise
+        flight.fetch(new_token.get("machineToken"))
+    try:
+        _process_new_machine_token(
+            cfg,
+            orig_entitlements,
+            new_token,
+            allow_enable,
+            orig_machine_token=orig_token.get("machineToken")
+            if orig_token
+            else None,
         )
+        # Only a refresh whose deltas were applied counts as a success
+        _record_refresh_success(cfg)
+    except BaseException as e:
+        if flight:
+            _finish_refresh(cfg, flight, e)
+        raise
+    if flight:
+        _finish_refresh(cfg, flight)
+
+
+def _finish_refresh(
+    cfg, flight: _RefreshFlight, error: "Optional[BaseException]" = None
+) -> None:
+    """Complete flight, sharing error only with the callers waiting on it."""
+    if error:
+        with _refresh_flights_lock:
+            if _refresh_flights.get(cfg.data_dir) is flight:
+                del _refresh_flights[cfg.data_dir]
+    flight.finish(error)
+
+
+def forget_contract_refresh(cfg) -> None:
+    """Stop sharing the last refresh of cfg's machine token.
+
+    The next request_updated_contract for cfg contacts the contract server,
+    unless a refresh is already in flight.
+    """
+    with _refresh_flights_lock:
+        flight = _refresh_flights.get(cfg.data_dir)
+        if flight and flight.done.is_set():
+            del _refresh_flights[cfg.data_dir]
+
+
+def _request_machine_attach(
+    contract_client: UAContractClient, contract_token: str
+) -> "Dict[str, Any]":
+    """Request and cache a machine token for contract_token.
+
+    :raise UserFacingError: on an invalid or expired contract_token or
+        failure to reach the contract server
+    :raise ContractAPIError: on other contract server errors
+    """
+    try:
+        return contract_client.request_contract_machine_attach(
+            contract_token=contract_token
+        )
+    except util.UrlError as e:
+        if isinstance(e, ContractAPIError):
+            if hasattr(e, "code"):
+                if e.code == 401:
+                    raise exceptions.UserFacingError(
+                        status.MESSAGE_ATTACH_INVALID_TOKEN
+                    )
+                elif e.code == 403:
+                    raise exceptions.UserFacingError(
+                        status.MESSAGE_ATTACH_EXPIRED_TOKEN
+                    )
+            raise e
+        with util.disable_log_to_console():
+            logging.exception(str(e))
+        raise exceptions.UserFacingError(status.MESSAGE_CONNECTIVITY_ERROR)
+
+
+def reattach_with_contract_token(
+    cfg, contract_token: str, allow_enable: bool = False
+) -> None:
+    """Swap the machine token of an attached machine for contract_token's.
+
+    Used when an attached image boots as a new instance. Rather than a
+    detach followed by an attach, the new machine token is applied as a
+    contract delta against the old one. Enabled services stay in place and
+    only credentials or directives which changed are rewritten. The old
+    machine token is detached from the contract server once the new one
+    was granted.
+
+    :param cfg: Instance of UAConfig for this machine.
+    :param contract_token: String containing the new contract token.
+    :param allow_enable: Boolean set True if allowed to perform the enable
+        operation. When False, a message will be logged to inform the user
+        about the recommended enabled service.
+
+    :raise UserFacingError: on failure to attach or error processing
+        contract deltas. The old machine token stays cached, and attached on
+        the contract server, on attach failure, leaving the configured
+        services untouched.
+    :raise UrlError: On failure to contact the server
+    """
+    orig_token = cfg.machine_token
+    if not orig_token:
+        raise RuntimeError("Cannot re-attach a machine which is not attached")
+    orig_entitlements = cfg.entitlements
+    contract_client = UAContractClient(cfg)
+    new_token = _request_machine_attach(contract_client, contract_token)
+    _detach_replaced_machine_token(
+        contract_client, orig_token, util.get_machine_id(cfg.data_dir)
+    )
+    _process_new_machine_token(
+        cfg,
+        orig_entitlements,
+        new_token,
+        allow_enable,
+        orig_machine_token=orig_token["machineToken"],
+    )
+    _record_refresh_success(cfg)
+
+
+def _detach_replaced_machine_token(
+    contract_client: UAContractClient,
+    orig_token: "Dict[str, Any]",
+    machine_id: str,
+) -> None:
+    """Detach orig_token, which a new attachment of machine_id replaced.
+
+    Nothing is detached when orig_token was granted to machine_id, or to an
+    unknown machine, as that would detach the new attachment. Failures are
+    only logged: the machine is attached with its new token either way.
+    """
+    orig_info = orig_token["machineTokenInfo"]
+    orig_machine_id = orig_info.get("machineId")
+    if not orig_machine_id or orig_machine_id == machine_id:
+        return
+    try:
+        contract_client.detach_machine_from_contract(
+            orig_token["machineToken"],
+            orig_info["contractInfo"]["id"],
+            machine_id=orig_machine_id,
+        )
+    except util.UrlError as e:
+        with util.disable_log_to_console():
+            logging.warning("Failed to detach replaced machine token: %s", e)
+
+
+def _process_new_machine_token(
+    cfg, orig_entitlements, new_token, allow_enable, orig_machine_token=None
+) -> None:
+    """Check expiry of new_token and apply its entitlement deltas.
+
+    :param orig_machine_token: The machineToken new_token replaces, if any.
+
+    :raise UserFacingError: on an expired contract or error processing
+        contract deltas
+    """
+    _check_contract_expiry(new_token)
+    if orig_machine_token and orig_machine_token != new_token["machineToken"]:
+        _update_machine_token_credentials(cfg)
+    # The views of cfg.entitlements already carry their series overrides
+    process_entitlements_delta(
+        orig_entitlements,
+        cfg.entitlements,
+        allow_enable,
+        series_overrides=False,
+    )
+
+
+def _check_contract_expiry(new_token) -> None:
+    """Raise UserFacingError when the contract of new_token has expired."""
     expiry = new_token["machineTokenInfo"]["contractInfo"].get("effectiveTo")
     if expiry:
         if datetime.strptime(expiry, "%Y-%m-%dT%H:%M:%SZ") < datetime.utcnow():
@@ -348,13 +640,185 @@ def request_updated_contract(
                 status.MESSAGE_CONTRACT_EXPIRED_ERROR
             )
 
-    process_entitlements_delta(
-        orig_entitlements, cfg.entitlements, allow_enable
+
+def _update_machine_token_credentials(cfg) -> None:
+    """Rewrite the apt auth of enabled services using the machine token.
+
+    Services without a resourceToken authenticate with the machine token, so
+    a new machine token changes their credentials without any delta.
+    """
+    from uaclient.entitlements import ENTITLEMENT_CLASS_BY_NAME
+    from uaclient.entitlements.repo import RepoEntitlement
+
+    for name, access in sorted(cfg.entitlements.items()):
+        ent_cls = ENTITLEMENT_CLASS_BY_NAME.get(name)
+        if access.get("resourceToken") or not ent_cls:
+            continue
+        if not issubclass(ent_cls, RepoEntitlement):
+            continue
+        entitlement = ent_cls(cfg)
+        application_status, _ = entitlement.application_status()
+        if application_status == status.ApplicationStatus.ENABLED:
+            logging.info(
+                "Updating '%s' apt auth on changed machine token.", name
+            )
+            entitlement.update_apt_auth()
+
+
+def attach_with_contract_bundle(
+    cfg, bundle_path: str, allow_enable: bool = False, allow_unsigned=False
+) -> None:
+    """Attach this machine from an offline contract bundle.
+
+    No network requests are made. The bundled machine token is cached as if
+    returned by the contract server, so a later refresh reconciles it with
+    the contract server.
+
+    :param cfg: Instance of UAConfig for this machine.
+    :param bundle_path: Path of the contract bundle to attach with.
+    :param allow_enable: Boolean set True if allowed to perform the enable
+        operation. When False, a message will be logged to inform the user
+        about the recommended enabled service.
+    :param allow_unsigned: Boolean set True to attach from a bundle without
+        a signature when no contract_bundle_keyring is configured.
+
+    :raise UserFacingError: on an invalid bundle, an expired contract or
+        error processing contract deltas
+    """
+    if cfg.machine_token:
+        raise RuntimeError(
+            "Got unexpected contract bundle on an already attached machine"
+        )
+    content = bundle.read_contract_bundle(
+        bundle_path,
+        keyring=cfg.contract_bundle_keyring,
+        allow_unsigned=allow_unsigned,
     )
+    orig_entitlements = cfg.entitlements
+    new_token = content["machineToken"]
+    if not new_token.get("availableResources"):
+        new_token["availableResources"] = content["availableResources"]
+    # Never leave the machine attached with an expired bundle
+    _check_contract_expiry(new_token)
+    cfg.write_cache("machine-token", new_token)
+    _process_new_machine_token(cfg, orig_entitlements, new_token, allow_enable)
 
 
 def get_available_resources(cfg) -> "List[Dict]":
-    """Query available resources from the contrct server for this machine."""
+    """Query available resources from the contrct server for this machine.
+
+    The resources are cached when running as root, for local-only status.
+    """
     client = UAContractClient(cfg)
-    resources = client.request_resources()
-    return resources.get("resources", [])
+    resources = client.request_resources().get("resources", [])
+    if os.getuid() == 0:
+        cfg.write_cache("available-resources", resources)
+    return resources
+
+
+def _utcnow() -> datetime:
+    """Return the current UTC time truncated to whole seconds.
+
+    Whole seconds round-trip through DatetimeAwareJSONDecoder.
+    """
+    return datetime.utcnow().replace(microsecond=0)
+
+
+def _record_refresh_success(cfg) -> None:
+    """Persist the time of a successful contract refresh."""
+    cfg.write_cache("refresh-state", {"lastSuccess": _utcnow(), "failures": 0})
+
+
+def _retry_after_seconds(
+    headers: "Dict[str, str]", now: datetime
+) -> "Optional[int]":
+    """Return seconds to wait as requested by a Retry-After header.
+
+    Retry-After is either a number of seconds or an HTTP-date.
+    """
+    value = headers.get("Retry-After") if headers else None
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return int(value)
+    try:
+        retry_at = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo:
+        retry_at = retry_at.replace(tzinfo=None) - retry_at.utcoffset()
+    return max(0, int((retry_at - now).total_seconds()))
+
+
+def refresh_slot(machine_id: str, interval: int, now: datetime) -> datetime:
+    """Return the latest scheduled refresh time for machine_id before now.
+
+    Each machine refreshes once per interval at a fixed offset derived from
+    its machine-id, so a fleet triggered at the same moment spreads its
+    requests over the whole interval instead of arriving together.
+    """
+    digest = hashlib.sha256(machine_id.encode("utf-8")).hexdigest()
+    offset = int(digest, 16) % interval
+    elapsed = int((now - datetime(1970, 1, 1)).total_seconds())
+    return now - timedelta(seconds=(elapsed - offset) % interval)
+
+
+def scheduled_refresh(cfg, now: "Optional[datetime]" = None) -> bool:
+    """Refresh the contract when this machine's refresh slot is due.
+
+    The refresh is skipped when a refresh succeeded since the machine's
+    latest slot, or while backing off from previous failures. Failures to
+    reach the contract server or to apply its deltas back off exponentially
+    from REFRESH_BACKOFF_BASE up to cfg.refresh_interval, or longer when the
+    server sends Retry-After.
+
+    :param cfg: Instance of UAConfig for this machine.
+    :param now: Optional naive UTC datetime to use as the current time.
+
+    :return: True when the contract was refreshed, False when skipped.
+    :raise UserFacingError: on failure to process contract deltas
+    :raise UrlError: On failure to contact the server
+    """
+    if now is None:
+        now = _utcnow()
+    state = cfg.read_cache("refresh-state", silent=True)
+    if not isinstance(state, dict):
+        state = {}
+    machine_id = util.get_machine_id(cfg.data_dir)
+    slot = refresh_slot(machine_id, cfg.refresh_interval, now)
+    last_success = state.get("lastSuccess")
+    if isinstance(last_success, datetime) and last_success >= slot:
+        logging.debug(
+            "Skipping scheduled refresh: last refresh at %s, next slot at %s",
+            last_success,
+            slot + timedelta(seconds=cfg.refresh_interval),
+        )
+        return False
+    retry_at = state.get("retryAt")
+    if isinstance(retry_at, datetime) and now < retry_at:
+        logging.debug(
+            "Skipping scheduled refresh: backing off until %s", retry_at
+        )
+        return False
+    try:
+        request_updated_contract(cfg)
+    except (util.UrlError, exceptions.UserFacingError) as e:
+        failures = state.get("failures", 0) + 1
+        delay = min(
+            REFRESH_BACKOFF_BASE * 2 ** (failures - 1), cfg.refresh_interval
+        )
+        if isinstance(e, util.UrlError):
+            retry_after = _retry_after_seconds(e.headers, now)
+            if retry_after is not None:
+                delay = max(delay, retry_after)
+        state.update(
+            {
+                "failures": failures,
+                "lastFailure": now,
+                "retryAt": now + timedelta(seconds=delay),
+            }
+        )
+        cfg.write_cache("refresh-state", state)
+        raise
+    return True
@@ -0,0 +1,287 @@
+"""
+An optional long-lived process answering status and help queries.
+
+"ua daemon" keeps a UAConfig, with its parsed machine token, and the status
+and help responses computed from it in memory, and serves them on a Unix
+socket. Everything kept is dropped as soon as one of the files it was
+computed from changes, and at the latest after DAEMON_CACHE_MAX_AGE
+seconds. ua status and ua help run by root with the default configuration
+query the socket when the daemon runs and compute their response in-process
+otherwise.
+
+Kernel state lives in /proc and /sys, whose mtimes do not follow their
+contents, so only livepatch modules appearing or going away under
+/sys/kernel/livepatch are noticed right away. A livepatch module being
+enabled or disabled, FIPS mode and the state of the livepatch client are
+not, and a status the daemon answers can lag behind them by up to
+DAEMON_CACHE_MAX_AGE seconds.
+
+Each connection carries one request and one response, both a line of JSON:
+
+    {"method": "status", "params": {"show_beta": false}}
+    {"result": {...}} or {"error": "..."}
+"""
+
+import glob
+import json
+import logging
+import os
+import signal
+import socket
+import socketserver
+import stat
+import threading
+import time
+
+from uaclient import apt, exceptions, util
+from uaclient.defaults import DEFAULT_CONFIG_FILE, DEFAULT_HELP_INDEX_FILE
+
+try:
+    from typing import Any, Callable, Dict, List, Optional, Tuple  # noqa
+except ImportError:
+    # typing isn't available on trusty, so ignore its absence
+    pass
+
+
+DAEMON_SOCKET = "/run/ubuntu-advantage/daemon.socket"
+DAEMON_CLIENT_TIMEOUT = 60.0  # seconds, covers computing a fresh status
+DAEMON_CACHE_MAX_AGE = 300  # seconds, covers state no watched file records
+DAEMON_MAX_REQUEST = 64 * 1024  # bytes
+
+# Files whose changes invalidate everything the daemon keeps, besides the
+# uaclient.conf and data_dir files
+WATCHED_FILES = [
+    DEFAULT_HELP_INDEX_FILE,
+    apt.DPKG_STATUS_FILE,
+    "/var/run/reboot-required",
+]
+WATCHED_GLOBS = [
+    "/etc/apt/sources.list.d/*",
+    "/etc/apt/preferences.d/*",
+    "/sys/kernel/livepatch/*",
+]
+WATCHED_DATA_PATHS = [
+    "machine-token",
+    "available-resources",
+    "lock",
+    "status-cache",
+]
+
+
+class DaemonUnavailable(Exception):
+    """Raised by query when no daemon answers on the socket."""
+
+
+def _help(cfg, name: str) -> "List[Tuple[str, Any]]":
+    # Pairs keep the field order of the OrderedDict across JSON
+    return list(cfg.help(name).items())
+
+
+def _status(cfg, show_beta: bool = False, local_only: bool = False):
+    return cfg.status(show_beta=show_beta, local_only=local_only)
+
+
+QUERY_HANDLERS = {
+    "help": _help,
+    "status": _status,
+}  # type: Dict[str, Callable[..., Any]]
+
+# The parameters each query accepts, with their type
+QUERY_PARAMS = {
+    "help": {"name": str},
+    "status": {"show_beta": bool, "local_only": bool},
+}  # type: Dict[str, Dict[str, type]]
+
+
+def _fingerprint(paths: "List[str]") -> "Tuple[Any, ...]":
+    """Return the mtime and size of each of paths, None when missing."""
+    fingerprint = []
+    for path in paths:
+        try:
+            st = os.stat(path)
+        except OSError:
+            fingerprint.append((path, None))
+        else:
+            fingerprint.append((path, st.st_mtime_ns, st.st_size))
+    return tuple(fingerprint)
+
+
+class DaemonState:
+    """A UAConfig and the query responses computed from it.
+
+    :param cfg_factory: Callable returning a new UAConfig.
+    :param max_age: Seconds after which everything is recomputed even
+        when no watched file changed.
+    """
+
+    def __init__(self, cfg_factory, max_age: float = DAEMON_CACHE_MAX_AGE):
+        self._cfg_factory = cfg_factory
+        self.max_age = max_age
+        self.cfg = None
+        self._responses = {}  # type: Dict[str, Any]
+        self._fingerprint = None  # type: Optional[Tuple[Any, ...]]
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _watched_paths(self) -> "List[str]":
+        paths = [os.environ.get("UA_CONFIG_FILE") or DEFAULT_CONFIG_FILE]
+        paths.extend(WATCHED_FILES)
+        for pattern in WATCHED_GLOBS:
+            paths.extend(sorted(glob.glob(pattern)))
+        paths.extend(self.cfg.data_path(key) for key in WATCHED_DATA_PATHS)
+        return paths
+
+    def _refresh(self) -> None:
+        """Start over from a new UAConfig when watched files changed."""
+        if self.cfg is not None:
+            expired = time.monotonic() - self._loaded_at > self.max_age
+            if not expired and (
+                _fingerprint(self._watched_paths()) == self._fingerprint
+            ):
+                return
+            logging.debug("Dropping ua daemon state, its files changed")
+        self.cfg = self._cfg_factory()
+        self._responses = {}
+        self._loaded_at = time.monotonic()
+        self._fingerprint = _fingerprint(self._watched_paths())
+
+    def query(self, method: str, params: "Dict[str, Any]") -> "Any":
+        """Return the response of method, computing it when not kept.
+
+        :raise UserFacingError: when method is unknown, params are not
+            among those it accepts or it fails as such.
+        """
+        handler = QUERY_HANDLERS.get(method)
+        if handler is None:
+            raise exceptions.UserFacingError(
+                "Unknown ua daemon query: {}".format(method)
+            )
+        accepted = QUERY_PARAMS[method]
+        for name, value in params.items():
+            if name not in accepted or not isinstance(value, accepted[name]):
+                raise exceptions.UserFacingError(
+                    "Invalid ua daemon {} query parameter: {}".format(
+                        method, name
+                    )
+                )
+        key = json.dumps([method, params], sort_keys=True)
+        with self._lock:
+            self._refresh()
+            if key not in self._responses:
+                self._responses[key] = handler(self.cfg, **params)
+                # Computing status rewrites the status-cache, which must not
+                # count as a change
+                self._fingerprint = _fingerprint(self._watched_paths())
+            return self._responses[key]
+
+
+class DaemonRequestHandler(socketserver.StreamRequestHandler):
+    """Answer one JSON line request using the server's DaemonState."""
+
+    def handle(self):
+        line = self.rfile.readline(DAEMON_MAX_REQUEST)
+        try:
+            request = json.loads(line.decode("utf-8"))
+            method = request["method"]
+            params = request.get("params") or {}
+            if not isinstance(params, dict):
+                raise ValueError("params must be an object")
+        except (KeyError, TypeError, ValueError) as e:
+            logging.debug("Invalid ua daemon request %r: %s", line, e)
+            return
+        try:
+            response = {"result": self.server.state.query(method, params)}
+        except exceptions.UserFacingError as e:
+            response = {"error": e.msg}
+        except Exception as e:
+            # Leave the connection unanswered: the client then computes the
+            # response in-process, reporting the error as usual
+            logging.warning("ua daemon %s query failed: %r", method, e)
+            return
+        content = json.dumps(response, cls=util.DatetimeAwareJSONEncoder)
+        self.wfile.write(content.encode("utf-8") + b"\n")
+
+
+class DaemonServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Serve queries on socket_path from a DaemonState."""
+
+    daemon_threads = True
+
+    def __init__(self, state: DaemonState, socket_path: str) -> None:
+        socket_dir = os.path.dirname(socket_path)
+        if not os.path.exists(socket_dir):
+            os.makedirs(socket_dir, mode=0o755)
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)  # Left behind by an unclean exit
+        super().__init__(socket_path, DaemonRequestHandler)
+        # Only root may query: responses are computed with root's view of
+        # the machine token. Other users compute their response in-process.
+        os.chmod(socket_path, 0o600)
+        self.socket_path = socket_path
+        self.state = state
+
+    def server_close(self):
+        super().server_close()
+        util.remove_file(self.socket_path)
+
+
+def serve(cfg_factory, socket_path: "Optional[str]" = None) -> None:
+    """Serve queries on socket_path until SIGTERM or SIGINT."""
+    server = DaemonServer(
+        DaemonState(cfg_factory), socket_path or DAEMON_SOCKET
+    )
+    stop = threading.Event()
+    for signum in (signal.SIGTERM, signal.SIGINT):
+        signal.signal(signum, lambda *_args: stop.set())
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    logging.info("ua daemon serving on %s", server.socket_path)
+    while not stop.wait(1):
+        pass
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def query(
+    method: str,
+    params: "Optional[Dict[str, Any]]" = None,
+    socket_path: "Optional[str]" = None,
+    timeout: float = DAEMON_CLIENT_TIMEOUT,
+) -> "Any":
+    """Return the response of the daemon to the query method.
+
+    :raise DaemonUnavailable: when no daemon owned by root or this user
+        answers on socket_path.
+    :raise UserFacingError: when the daemon reports the query failed.
+    """
+    socket_path = socket_path or DAEMON_SOCKET
+    try:
+        st = os.stat(socket_path)
+    except OSError:
+        raise DaemonUnavailable(socket_path)
+    if not stat.S_ISSOCK(st.st_mode) or st.st_uid not in (0, os.getuid()):
+        raise DaemonUnavailable(socket_path)
+    request = json.dumps({"method": method, "params": params or {}})
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(socket_path)
+        sock.sendall(request.encode("utf-8") + b"\n")
+        with sock.makefile("rb") as stream:
+            line = stream.readline()
+    except OSError as e:
+        logging.debug("ua daemon at %s unavailable: %s", socket_path, e)
+        raise DaemonUnavailable(socket_path)
+    finally:
+        sock.close()
+    try:
+        response = json.loads(
+            line.decode("utf-8"), cls=util.DatetimeAwareJSONDecoder
+        )
+    except ValueError:
+        raise DaemonUnavailable(socket_path)
+    if "error" in response:
+        raise exceptions.UserFacingError(response["error"])
+    return response["result"]
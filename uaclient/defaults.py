@@ -6,8 +6,14 @@ any of our dependencies installed.
 """
 
 UAC_ETC_PATH = "/etc/ubuntu-advantage/"
+UAC_SHARE_PATH = "/usr/share/ubuntu-advantage/"
 DEFAULT_CONFIG_FILE = UAC_ETC_PATH + "uaclient.conf"
 DEFAULT_HELP_FILE = UAC_ETC_PATH + "help_data.yaml"
+DEFAULT_HELP_INDEX_FILE = UAC_SHARE_PATH + "help_data.json"
+DEFAULT_MANIFEST_FILE = UAC_SHARE_PATH + "entitlements.json"
+DEFAULT_METRICS_FILE = (
+    "/var/lib/prometheus/node-exporter/ubuntu-advantage.prom"
+)
 DEFAULT_UPGRADE_CONTRACT_FLAG_FILE = UAC_ETC_PATH + "request-update-contract"
 BASE_CONTRACT_URL = "https://contracts.canonical.com"
 
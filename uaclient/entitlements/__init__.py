@@ -6,7 +6,7 @@ from uaclient.entitlements import fips
 from uaclient.entitlements.livepatch import LivepatchEntitlement
 
 try:
-    from typing import cast, Dict, List, Type  # noqa: F401
+    from typing import cast, Dict, Iterable, List, Optional, Type  # noqa: F401
 except ImportError:
     # typing isn't available on trusty, so ignore its absence
     def cast(_, x):  # type: ignore
@@ -37,3 +37,48 @@ RELEASED_ENTITLEMENTS_STR = ", ".join(
         if not cls.is_beta
     ]
 )  # type: str
+
+
+def package_system_lanes(
+    names: "Iterable[str]", changed: "Optional[Iterable[str]]" = None
+) -> "List[List[str]]":
+    """Group entitlement names into lanes which can be processed concurrently.
+
+    Entitlements using the same package system share a lane, so apt-based
+    services never race each other. Changed entitlements which declare each
+    other incompatible, such as FIPS and Livepatch, also share a lane so
+    their operations are applied in name order.
+
+    :param names: Entitlement names to group.
+    :param changed: Names of the entitlements which are about to change.
+        Defaults to all names.
+
+    :return: List of lanes, each a sorted list of entitlement names.
+    """
+    names = sorted(names)
+    changed = set(names if changed is None else changed)
+    parent = dict((name, name) for name in names)
+
+    def find(name):
+        while parent[name] != name:
+            name = parent[name]
+        return name
+
+    def join(name1, name2):
+        root1, root2 = find(name1), find(name2)
+        if root1 != root2:
+            parent[max(root1, root2)] = min(root1, root2)
+
+    first_by_system = {}  # type: Dict[str, str]
+    for name in names:
+        ent_cls = ENTITLEMENT_CLASS_BY_NAME.get(name)
+        package_system = ent_cls.package_system if ent_cls else "apt"
+        join(name, first_by_system.setdefault(package_system, name))
+        if ent_cls and name in changed:
+            for other in ent_cls.incompatible_services:
+                if other in changed and other in parent:
+                    join(name, other)
+    lanes = {}  # type: Dict[str, List[str]]
+    for name in names:
+        lanes.setdefault(find(name), []).append(name)
+    return [lanes[root] for root in sorted(lanes)]
@@ -1,9 +1,7 @@
-import os
 import abc
 from datetime import datetime
 import logging
 import re
-import yaml
 
 try:
     from typing import Any, Callable, Dict, List, Optional, Tuple  # noqa: F401
@@ -15,6 +13,7 @@ except ImportError:
 
 from uaclient import config
 from uaclient import contract
+from uaclient import help_index
 from uaclient import status
 from uaclient import util
 from uaclient.status import (
@@ -22,7 +21,6 @@ from uaclient.status import (
     ContractStatus,
     UserFacingStatus,
 )
-from uaclient.defaults import DEFAULT_HELP_FILE
 
 RE_KERNEL_UNAME = (
     r"(?P<major>[\d]+)[.-](?P<minor>[\d]+)[.-](?P<patch>[\d]+\-[\d]+)"
@@ -44,6 +42,14 @@ class UAEntitlement(metaclass=abc.ABCMeta):
     # Help info message for the entitlement
     _help_info = None  # type: str
 
+    # Package system changed when processing this entitlement's contract
+    # deltas. Deltas of entitlements sharing a package system run serially.
+    package_system = "apt"
+
+    # Names of entitlements which cannot be enabled alongside this one. Their
+    # contract deltas are never processed concurrently with this one's.
+    incompatible_services = ()  # type: Tuple[str, ...]
+
     @property
     @abc.abstractmethod
     def name(self) -> str:
@@ -66,13 +72,7 @@ class UAEntitlement(metaclass=abc.ABCMeta):
     def help_info(self) -> str:
         """Help information for the entitlement"""
         if self._help_info is None:
-            help_dict = {}
-
-            if os.path.exists(DEFAULT_HELP_FILE):
-                with open(DEFAULT_HELP_FILE, "r") as f:
-                    help_dict = yaml.safe_load(f)
-
-            self._help_info = help_dict.get(self.name, {}).get("help", "")
+            self._help_info = help_index.get_help(self.name)
 
         return self._help_info
 
@@ -320,7 +320,7 @@ class UAEntitlement(metaclass=abc.ABCMeta):
         transition_to_unentitled = bool(delta_entitlement == util.DROPPED_KEY)
         if not transition_to_unentitled:
             if delta_entitlement:
-                util.apply_series_overrides(deltas)
+                deltas = util.with_series_overrides(deltas)
                 delta_entitlement = deltas["entitlement"]
             if orig_access and "entitled" in delta_entitlement:
                 transition_to_unentitled = delta_entitlement["entitled"] in (
@@ -1,5 +1,7 @@
+import os
+
 from uaclient.entitlements import repo
-from uaclient import status, util
+from uaclient import apt, status, util
 
 try:
     from typing import Any, Callable, Dict, List, Set, Tuple, Union  # noqa
@@ -9,6 +11,16 @@ except ImportError:
     # typing isn't available on trusty, so ignore its absence
     pass
 
+FIPS_ENABLED_FILE = "/proc/sys/crypto/fips_enabled"
+
+
+def kernel_fips_enabled() -> bool:
+    """Return True when the running kernel is in FIPS mode."""
+    try:
+        return util.load_file(FIPS_ENABLED_FILE).strip() == "1"
+    except (IOError, OSError):
+        return False
+
 
 class FIPSCommonEntitlement(repo.RepoEntitlement):
 
@@ -23,6 +35,8 @@ class FIPSCommonEntitlement(repo.RepoEntitlement):
 
     help_doc_url = "https://ubuntu.com/security/certifications#fips"
 
+    incompatible_services = ("livepatch",)  # type: Tuple[str, ...]
+
     @property
     def static_affordances(self) -> "Tuple[StaticAffordance, ...]":
         # Use a lambda so we can mock util.is_container in tests
@@ -51,12 +65,31 @@ class FIPSCommonEntitlement(repo.RepoEntitlement):
         )
 
     def application_status(self) -> "Tuple[status.ApplicationStatus, str]":
-        super_status, super_msg = super().application_status()
-        if super_status != status.ApplicationStatus.ENABLED:
-            return super_status, super_msg
-        running_kernel = util.get_platform_info()["kernel"]
-        if running_kernel.endswith("-fips"):
-            return super_status, super_msg
+        """Return (ApplicationStatus, details) without forking any command.
+
+        FIPS is enabled when its apt source is configured and its packages
+        are installed according to the dpkg database. A reboot is required
+        until the kernel reports fips_enabled.
+        """
+        repo_filename = self.repo_list_file_tmpl.format(name=self.name)
+        if not os.path.exists(repo_filename):
+            return (
+                status.ApplicationStatus.DISABLED,
+                "{} is not configured".format(self.title),
+            )
+        missing = set(self.packages) - apt.get_dpkg_installed_packages()
+        if missing:
+            return (
+                status.ApplicationStatus.DISABLED,
+                "{} packages are not installed: {}".format(
+                    self.title, ", ".join(sorted(missing))
+                ),
+            )
+        if kernel_fips_enabled():
+            return (
+                status.ApplicationStatus.ENABLED,
+                "{} is active".format(self.title),
+            )
         return (
             status.ApplicationStatus.ENABLED,
             "Reboot to FIPS kernel required",
@@ -79,6 +112,7 @@ class FIPSEntitlement(FIPSCommonEntitlement):
     title = "FIPS"
     description = "NIST-certified FIPS modules"
     origin = "UbuntuFIPS"
+    incompatible_services = ("livepatch", "fips-updates")
 
     @property
     def static_affordances(self) -> "Tuple[StaticAffordance, ...]":
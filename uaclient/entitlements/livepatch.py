@@ -1,15 +1,22 @@
 import logging
+import os
+import time
 
 from uaclient.entitlements import base
-from uaclient import apt, exceptions, status
+from uaclient import apt, events, exceptions, snapd, status
 from uaclient import util
 from uaclient.status import ApplicationStatus
 
 SNAP_CMD = "/usr/bin/snap"
 SNAP_INSTALL_RETRIES = [0.5, 1.0, 5.0]
+LIVEPATCH_CMD = "/snap/bin/canonical-livepatch"
+LIVEPATCH_SYSFS_DIR = "/sys/kernel/livepatch"
+LIVEPATCH_MODULE_PREFIX = "lkp_"  # Canonical livepatch kernel module names
+LIVEPATCH_STATUS_CACHE_TTL = 60  # seconds a canonical-livepatch status holds
+BOOT_ID_FILE = "/proc/sys/kernel/random/boot_id"
 
 try:
-    from typing import Any, Callable, Dict, Tuple  # noqa: F401
+    from typing import Any, Callable, Dict, Optional, Tuple  # noqa: F401
 
     StaticAffordance = Tuple[str, Callable[[], Any], bool]
 except ImportError:
@@ -28,6 +35,8 @@ class LivepatchEntitlement(base.UAEntitlement):
     name = "livepatch"
     title = "Livepatch"
     description = "Canonical Livepatch service"
+    package_system = "snap"
+    incompatible_services = ("fips", "fips-updates")
 
     @property
     def static_affordances(self) -> "Tuple[StaticAffordance, ...]":
@@ -75,41 +84,38 @@ class LivepatchEntitlement(base.UAEntitlement):
         """
         if not self.can_enable(silent=silent_if_inapplicable):
             return False
-        if not util.which("/snap/bin/canonical-livepatch"):
+        if not util.which(LIVEPATCH_CMD):
             if not util.which(SNAP_CMD):
                 print("Installing snapd")
                 print(status.MESSAGE_APT_UPDATING_LISTS)
                 try:
-                    apt.run_apt_command(
-                        ["apt-get", "update"], status.MESSAGE_APT_UPDATE_FAILED
-                    )
+                    with events.phase("apt-update"):
+                        apt.run_apt_command(
+                            ["apt-get", "update"],
+                            status.MESSAGE_APT_UPDATE_FAILED,
+                        )
                 except exceptions.UserFacingError as e:
                     logging.debug(
                         "Trying to install snapd."
                         " Ignoring apt-get update failure: %s",
                         str(e),
                     )
-                util.subp(
-                    ["apt-get", "install", "--assume-yes", "snapd"],
-                    capture=True,
-                    retry_sleeps=apt.APT_RETRIES,
-                )
+                with events.phase("install-snapd"), apt.apt_lock:
+                    util.subp(
+                        ["apt-get", "install", "--assume-yes", "snapd"],
+                        capture=True,
+                        retry_sleeps=apt.APT_RETRIES,
+                    )
             elif "snapd" not in apt.get_installed_packages():
                 raise exceptions.UserFacingError(
                     "/usr/bin/snap is present but snapd is not installed;"
                     " cannot enable {}".format(self.title)
                 )
-            util.subp(
-                [SNAP_CMD, "wait", "system", "seed.loaded"], capture=True
-            )
             print("Installing canonical-livepatch snap")
             try:
-                util.subp(
-                    [SNAP_CMD, "install", "canonical-livepatch"],
-                    capture=True,
-                    retry_sleeps=SNAP_INSTALL_RETRIES,
-                )
-            except util.ProcessExecutionError as e:
+                with events.phase("install-snap"):
+                    _install_snap("canonical-livepatch")
+            except snapd.SnapdError as e:
                 msg = "Unable to install Livepatch client: " + str(e)
                 raise exceptions.UserFacingError(msg)
         return self.setup_livepatch_config(
@@ -151,18 +157,13 @@ class LivepatchEntitlement(base.UAEntitlement):
                     self.title,
                 )
                 try:
-                    util.subp(["/snap/bin/canonical-livepatch", "disable"])
+                    util.subp([LIVEPATCH_CMD, "disable"])
                 except util.ProcessExecutionError as e:
                     logging.error(str(e))
                     return False
             try:
                 util.subp(
-                    [
-                        "/snap/bin/canonical-livepatch",
-                        "enable",
-                        livepatch_token,
-                    ],
-                    capture=True,
+                    [LIVEPATCH_CMD, "enable", livepatch_token], capture=True
                 )
             except util.ProcessExecutionError as e:
                 msg = "Unable to enable Livepatch: "
@@ -174,6 +175,7 @@ class LivepatchEntitlement(base.UAEntitlement):
                     msg += str(e)
                 print(msg)
                 return False
+            self._write_status_cache(ApplicationStatus.ENABLED, "")
             print("Canonical livepatch enabled.")
         return True
 
@@ -184,20 +186,80 @@ class LivepatchEntitlement(base.UAEntitlement):
         """
         if not self.can_disable(silent):
             return False
-        if not util.which("/snap/bin/canonical-livepatch"):
+        if not util.which(LIVEPATCH_CMD):
             return True
-        util.subp(["/snap/bin/canonical-livepatch", "disable"], capture=True)
+        util.subp([LIVEPATCH_CMD, "disable"], capture=True)
+        self._write_status_cache(ApplicationStatus.DISABLED, "")
         return True
 
     def application_status(self) -> "Tuple[ApplicationStatus, str]":
-        status = (ApplicationStatus.ENABLED, "")
+        """Return (ApplicationStatus, details) of the Livepatch client.
+
+        Avoid forking the snap-wrapped canonical-livepatch CLI when possible:
+        the client is disabled when its snap is absent and enabled when the
+        kernel runs an enabled Canonical livepatch module. Patches stay
+        loaded after the client is disabled, so that kernel evidence is
+        ignored once Livepatch was disabled during this boot. Otherwise, ask
+        canonical-livepatch status and cache the result for
+        LIVEPATCH_STATUS_CACHE_TTL seconds.
+        """
+        if not os.path.exists(LIVEPATCH_CMD):
+            return (
+                ApplicationStatus.DISABLED,
+                "canonical-livepatch snap is not installed",
+            )
+        cached = self._read_status_cache()
+        if cached:
+            app_status, details, age = cached
+            if age < LIVEPATCH_STATUS_CACHE_TTL:
+                return app_status, details
+        disabled_this_boot = bool(
+            cached and cached[0] == ApplicationStatus.DISABLED
+        )
+        if not disabled_this_boot and kernel_livepatch_enabled():
+            return ApplicationStatus.ENABLED, ""
+        app_status, details = ApplicationStatus.ENABLED, ""
         try:
-            util.subp(["/snap/bin/canonical-livepatch", "status"])
+            util.subp([LIVEPATCH_CMD, "status"])
         except util.ProcessExecutionError as e:
             # TODO(May want to parse INACTIVE/failure assessment)
             logging.debug("Livepatch not enabled. %s", str(e))
-            status = (ApplicationStatus.DISABLED, str(e))
-        return status
+            app_status, details = ApplicationStatus.DISABLED, str(e)
+        self._write_status_cache(app_status, details)
+        return app_status, details
+
+    def _read_status_cache(
+        self
+    ) -> "Optional[Tuple[ApplicationStatus, str, float]]":
+        """Return (status, details, age in seconds) cached during this boot.
+
+        :return: None when no status was cached during this boot.
+        """
+        cache = self.cfg.read_cache("livepatch-status", silent=True)
+        if not isinstance(cache, dict) or cache.get("bootId") != _boot_id():
+            return None
+        try:
+            app_status = ApplicationStatus[cache["status"]]
+            age = time.time() - float(cache["checkedAt"])
+        except (KeyError, TypeError, ValueError):
+            return None
+        return app_status, cache.get("details", ""), age
+
+    def _write_status_cache(
+        self, app_status: ApplicationStatus, details: str
+    ) -> None:
+        """Cache the Livepatch client status for this boot when root."""
+        if os.getuid() != 0:
+            return
+        self.cfg.write_cache(
+            "livepatch-status",
+            {
+                "status": app_status.name,
+                "details": details,
+                "checkedAt": time.time(),
+                "bootId": _boot_id(),
+            },
+        )
 
     def process_contract_deltas(
         self,
@@ -238,6 +300,63 @@ class LivepatchEntitlement(base.UAEntitlement):
         return True
 
 
+def _install_snap(name: str) -> None:
+    """Install the snap name through the snapd REST API.
+
+    Waits for snapd to load its seed, then for the install change to
+    complete while printing its task progress, retrying after
+    SNAP_INSTALL_RETRIES when snapd reports errors.
+
+    :raise SnapdError: when the install still fails after all retries.
+    """
+    client = snapd.SnapdClient()
+    retry_sleeps = list(SNAP_INSTALL_RETRIES)
+    while True:
+        try:
+            client.wait_for_seed()
+            change_id = client.install(name)
+            if change_id:
+                client.wait_for_change(change_id, on_progress=print)
+            return
+        except snapd.SnapdError as e:
+            if not retry_sleeps:
+                raise
+            logging.debug(
+                "Retrying install of %s snap after error: %s", name, str(e)
+            )
+            time.sleep(retry_sleeps.pop(0))
+
+
+def _boot_id() -> str:
+    """Return the kernel's random id of the current boot, or empty string."""
+    try:
+        return util.load_file(BOOT_ID_FILE).strip()
+    except (IOError, OSError):
+        return ""
+
+
+def kernel_livepatch_enabled() -> bool:
+    """Return True when the kernel runs an enabled Canonical livepatch.
+
+    Reads the sysfs state of each livepatch module under
+    LIVEPATCH_SYSFS_DIR, without forking any command.
+    """
+    try:
+        modules = os.listdir(LIVEPATCH_SYSFS_DIR)
+    except OSError:
+        return False
+    for module in modules:
+        if not module.startswith(LIVEPATCH_MODULE_PREFIX):
+            continue
+        enabled_path = os.path.join(LIVEPATCH_SYSFS_DIR, module, "enabled")
+        try:
+            if util.load_file(enabled_path).strip() == "1":
+                return True
+        except (IOError, OSError):
+            continue
+    return False
+
+
 def process_config_directives(cfg):
     """Process livepatch configuration directives.
 
@@ -254,11 +373,7 @@ def process_config_directives(cfg):
     ca_certs = directives.get("caCerts")
     if ca_certs:
         util.subp(
-            [
-                "/snap/bin/canonical-livepatch",
-                "config",
-                "ca-certs={}".format(ca_certs),
-            ],
+            [LIVEPATCH_CMD, "config", "ca-certs={}".format(ca_certs)],
             capture=True,
         )
     remote_server = directives.get("remoteServer", "")
@@ -267,7 +382,7 @@ def process_config_directives(cfg):
     if remote_server:
         util.subp(
             [
-                "/snap/bin/canonical-livepatch",
+                LIVEPATCH_CMD,
                 "config",
                 "remote-server={}".format(remote_server),
             ],
@@ -20,6 +20,7 @@ except ImportError:
 
 
 from uaclient import apt
+from uaclient import events
 from uaclient import exceptions
 from uaclient.entitlements import base
 from uaclient import status
@@ -110,6 +111,8 @@ class RepoEntitlement(base.UAEntitlement):
         self.setup_apt_config()
         if self.packages:
             try:
+                # Repositories configured in a batch need fresh package lists
+                apt.flush_apt_update()
                 print("Installing {title} packages".format(title=self.title))
                 msg_ops = self.messaging.get("pre_install", [])
                 if not handle_message_operations(msg_ops):
@@ -124,15 +127,16 @@ class RepoEntitlement(base.UAEntitlement):
                 else:
                     env = {}
                     apt_options = []
-                apt.run_apt_command(
-                    ["apt-get", "install", "--assume-yes"]
-                    + apt_options
-                    + self.packages,
-                    status.MESSAGE_ENABLED_FAILED_TMPL.format(
-                        title=self.title
-                    ),
-                    env=env,
-                )
+                with events.phase("install-packages"):
+                    apt.run_apt_command(
+                        ["apt-get", "install", "--assume-yes"]
+                        + apt_options
+                        + self.packages,
+                        status.MESSAGE_ENABLED_FAILED_TMPL.format(
+                            title=self.title
+                        ),
+                        env=env,
+                    )
             except exceptions.UserFacingError:
                 self._cleanup()
                 raise
@@ -220,6 +224,14 @@ class RepoEntitlement(base.UAEntitlement):
         if application_status == status.ApplicationStatus.DISABLED:
             return True
 
+        if set(deltas) == set(["resourceToken"]):
+            # Only credentials changed, so sources, keys and pins still apply
+            logging.info(
+                "Updating '%s' apt auth on changed resourceToken.", self.name
+            )
+            self.update_apt_auth()
+            return True
+
         logging.info(
             "Updating '%s' apt sources list on changed directives.", self.name
         )
@@ -231,19 +243,28 @@ class RepoEntitlement(base.UAEntitlement):
                 # Remove original aptURL and auth and rewrite
                 repo_filename = self.repo_list_file_tmpl.format(name=self.name)
                 apt.remove_auth_apt_repo(repo_filename, old_url)
-        self.remove_apt_config()
-        self.setup_apt_config()
+        # One apt-get update covers both removal and setup
+        with apt.batched_apt_update():
+            self.remove_apt_config()
+            self.setup_apt_config()
         return True
 
-    def setup_apt_config(self) -> None:
-        """Setup apt config based on the resourceToken and  directives.
+    def update_apt_auth(self) -> None:
+        """Rewrite the apt auth of this service with its current credentials.
 
-        :raise UserFacingError: on failure to setup any aspect of this apt
-           configuration
+        Sources lists, keys and pins are left untouched.
+
+        :raise MissingAptURLDirective: when the entitlement has no aptURL.
         """
-        repo_filename = self.repo_list_file_tmpl.format(name=self.name)
-        resource_cfg = self.cfg.entitlements.get(self.name)
-        directives = resource_cfg["entitlement"].get("directives", {})
+        entitlement = self.cfg.entitlements[self.name]["entitlement"]
+        repo_url = entitlement.get("directives", {}).get("aptURL")
+        if not repo_url:
+            raise exceptions.MissingAptURLDirective(self.name)
+        apt.update_apt_auth_credentials(repo_url, self._apt_credentials())
+
+    def _apt_credentials(self) -> str:
+        """Return the resourceToken, or machine token, used for apt auth."""
+        resource_cfg = self.cfg.entitlements.get(self.name, {})
         token = resource_cfg.get("resourceToken")
         if not token:
             logging.debug(
@@ -252,6 +273,18 @@ class RepoEntitlement(base.UAEntitlement):
                 self.title,
             )
             token = self.cfg.machine_token["machineToken"]
+        return token
+
+    def setup_apt_config(self) -> None:
+        """Setup apt config based on the resourceToken and  directives.
+
+        :raise UserFacingError: on failure to setup any aspect of this apt
+           configuration
+        """
+        repo_filename = self.repo_list_file_tmpl.format(name=self.name)
+        resource_cfg = self.cfg.entitlements.get(self.name)
+        directives = resource_cfg["entitlement"].get("directives", {})
+        token = self._apt_credentials()
         aptKey = directives.get("aptKey")
         if not aptKey:
             raise exceptions.UserFacingError(
@@ -303,10 +336,12 @@ class RepoEntitlement(base.UAEntitlement):
                 )
             )
             try:
-                apt.run_apt_command(
-                    ["apt-get", "install", "--assume-yes"] + prerequisite_pkgs,
-                    status.MESSAGE_APT_INSTALL_FAILED,
-                )
+                with events.phase("install-prerequisites"):
+                    apt.run_apt_command(
+                        ["apt-get", "install", "--assume-yes"]
+                        + prerequisite_pkgs,
+                        status.MESSAGE_APT_INSTALL_FAILED,
+                    )
             except exceptions.UserFacingError:
                 self.remove_apt_config()
                 raise
@@ -317,14 +352,9 @@ class RepoEntitlement(base.UAEntitlement):
         # probably wants access to the repo that was just enabled.
         # Side-effect is that apt policy will now report the repo as accessible
         # which allows ua status to report correct info
-        print(status.MESSAGE_APT_UPDATING_LISTS)
-        try:
-            apt.run_apt_command(
-                ["apt-get", "update"], status.MESSAGE_APT_UPDATE_FAILED
-            )
-        except exceptions.UserFacingError:
-            self.remove_apt_config(run_apt_update=False)
-            raise
+        apt.run_apt_update(
+            on_failure=lambda: self.remove_apt_config(run_apt_update=False)
+        )
 
     def remove_apt_config(self, run_apt_update=True):
         """Remove any repository apt configuration files.
@@ -364,10 +394,7 @@ class RepoEntitlement(base.UAEntitlement):
                 os.unlink(repo_pref_file)
 
         if run_apt_update:
-            print(status.MESSAGE_APT_UPDATING_LISTS)
-            apt.run_apt_command(
-                ["apt-get", "update"], status.MESSAGE_APT_UPDATE_FAILED
-            )
+            apt.run_apt_update()
 
 
 def handle_message_operations(
@@ -419,7 +419,7 @@ class TestUaEntitlementUserFacingStatus:
             entitled=False,
             applicability_status=(status.ApplicabilityStatus.APPLICABLE, ""),
         )
-        entitlement.cfg._entitlements = {}
+        entitlement.cfg._entitlement_views = {entitlement.cfg.series: {}}
 
         user_facing_status, details = entitlement.user_facing_status()
         assert status.UserFacingStatus.UNAVAILABLE == user_facing_status
@@ -10,7 +10,11 @@ import pytest
 from uaclient import apt
 from uaclient import defaults
 from uaclient import status, util
-from uaclient.entitlements.fips import FIPSEntitlement, FIPSUpdatesEntitlement
+from uaclient.entitlements.fips import (
+    FIPSCommonEntitlement,
+    FIPSEntitlement,
+    FIPSUpdatesEntitlement,
+)
 from uaclient import exceptions
 
 
@@ -366,72 +370,90 @@ class TestFIPSEntitlementDisable:
         assert (expected_stdout, "") == capsys.readouterr()
 
 
+@pytest.fixture
+def fips_state(tmpdir):
+    """Point the repo list files, dpkg database and fips_enabled at tmpdir."""
+    dpkg_status = tmpdir.join("dpkg-status")
+    dpkg_status.write("")
+    fips_enabled = tmpdir.join("fips_enabled")
+    fips_enabled.write("0\n")
+    list_tmpl = tmpdir.join("ubuntu-{name}.list").strpath
+
+    def set_state(configured=(), installed=(), kernel_fips=False):
+        for name in configured:
+            util.write_file(list_tmpl.format(name=name), "")
+        dpkg_status.write(
+            "".join(
+                "Package: {}\nStatus: install ok installed\n\n".format(pkg)
+                for pkg in installed
+            )
+        )
+        fips_enabled.write("1\n" if kernel_fips else "0\n")
+
+    with mock.patch.object(
+        FIPSCommonEntitlement, "repo_list_file_tmpl", list_tmpl
+    ), mock.patch(M_PATH + "apt.DPKG_STATUS_FILE", dpkg_status.strpath):
+        with mock.patch(
+            M_PATH + "FIPS_ENABLED_FILE", fips_enabled.strpath
+        ), mock.patch(M_PATH + "util.subp") as m_subp:
+            with mock.patch(
+                "uaclient.util.get_platform_info",
+                return_value={"series": "xenial"},
+            ):
+                yield set_state
+    assert [] == m_subp.call_args_list  # No command is ever forked
+
+
 class TestFIPSEntitlementApplicationStatus:
-    @pytest.mark.parametrize(
-        "super_application_status",
-        [
-            s
-            for s in status.ApplicationStatus
-            if s is not status.ApplicationStatus.ENABLED
-        ],
-    )
-    def test_non_enabled_passed_through(
-        self, entitlement, super_application_status
+    def test_disabled_when_repo_is_not_configured(
+        self, entitlement, fips_state
     ):
-        msg = "sure is some status here"
-        with mock.patch(
-            M_PATH + "repo.RepoEntitlement.application_status",
-            return_value=(super_application_status, msg),
-        ):
-            application_status = entitlement.application_status()
+        fips_state(installed=["ubuntu-fips"], kernel_fips=True)
 
-        assert (super_application_status, msg) == application_status
+        assert (
+            status.ApplicationStatus.DISABLED,
+            "{} is not configured".format(entitlement.title),
+        ) == entitlement.application_status()
+
+    def test_disabled_when_packages_are_not_installed(
+        self, entitlement, fips_state
+    ):
+        fips_state(configured=[entitlement.name], installed=["other"])
+
+        assert (
+            status.ApplicationStatus.DISABLED,
+            "{} packages are not installed: ubuntu-fips".format(
+                entitlement.title
+            ),
+        ) == entitlement.application_status()
 
     @pytest.mark.parametrize(
-        "platform_info,expected_status,expected_msg",
+        "kernel_fips,expected_msg",
         (
-            (
-                {"kernel": "4.4.0-1002-fips"},
-                status.ApplicationStatus.ENABLED,
-                None,
-            ),
-            (
-                {"kernel": "4.4.0-148-generic"},
-                status.ApplicationStatus.ENABLED,
-                "Reboot to FIPS kernel required",
-            ),
+            (True, "{title} is active"),
+            (False, "Reboot to FIPS kernel required"),
         ),
     )
-    def test_kernels_are_used_to_detemine_application_status_message(
-        self, entitlement, platform_info, expected_status, expected_msg
+    def test_fips_enabled_flag_determines_application_status_message(
+        self, entitlement, fips_state, kernel_fips, expected_msg
     ):
-        msg = "sure is some status here"
-        with mock.patch(
-            M_PATH + "repo.RepoEntitlement.application_status",
-            return_value=(status.ApplicationStatus.ENABLED, msg),
-        ):
-            with mock.patch(
-                M_PATH + "util.get_platform_info", return_value=platform_info
-            ):
-                application_status = entitlement.application_status()
+        fips_state(
+            configured=[entitlement.name],
+            installed=["ubuntu-fips"],
+            kernel_fips=kernel_fips,
+        )
 
-        if expected_msg is None:
-            # None indicates that we expect the super-class message to be
-            # passed through
-            expected_msg = msg
-        assert (expected_status, expected_msg) == application_status
+        assert (
+            status.ApplicationStatus.ENABLED,
+            expected_msg.format(title=entitlement.title),
+        ) == entitlement.application_status()
 
     def test_fips_does_not_show_enabled_when_fips_updates_is(
-        self, entitlement
+        self, entitlement, fips_state
     ):
-        with mock.patch(M_PATH + "util.subp") as m_subp:
-            m_subp.return_value = (
-                "1001 http://FIPS-UPDATES/ubuntu"
-                " xenial-updates/main amd64 Packages\n",
-                "",
-            )
+        fips_state(configured=["fips-updates"], installed=["ubuntu-fips"])
 
-            application_status, _ = entitlement.application_status()
+        application_status, _ = entitlement.application_status()
 
         expected_status = status.ApplicationStatus.DISABLED
         if isinstance(entitlement, FIPSUpdatesEntitlement):
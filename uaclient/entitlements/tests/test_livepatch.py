@@ -19,13 +19,18 @@ import pytest
 
 from uaclient import apt
 from uaclient import exceptions
+from uaclient import snapd
 from uaclient.entitlements.livepatch import (
     LivepatchEntitlement,
+    _install_snap,
+    kernel_livepatch_enabled,
     process_config_directives,
 )
 from uaclient.entitlements.tests.conftest import machine_token
 from uaclient import status
+from uaclient import util
 from uaclient.status import ContractStatus
+from uaclient.testing.snapd_server import SnapdServer, SnapdServerState
 
 PLATFORM_INFO_SUPPORTED = MappingProxyType(
     {
@@ -116,6 +121,123 @@ class TestLivepatchUserFacingStatus:
         assert "Livepatch is not entitled" == details
 
 
+@pytest.fixture
+def livepatch_sysfs(tmpdir):
+    """Point the livepatch sysfs dir and CLI at tmpdir paths."""
+    sysfs_dir = tmpdir.mkdir("livepatch")
+    livepatch_cmd = tmpdir.join("canonical-livepatch")
+    boot_id = tmpdir.join("boot_id")
+    boot_id.write("boot-1\n")
+
+    def add_module(name, enabled="1"):
+        sysfs_dir.mkdir(name).join("enabled").write(enabled + "\n")
+
+    with mock.patch(M_PATH + "LIVEPATCH_SYSFS_DIR", sysfs_dir.strpath):
+        with mock.patch(M_PATH + "LIVEPATCH_CMD", livepatch_cmd.strpath):
+            with mock.patch(M_PATH + "BOOT_ID_FILE", boot_id.strpath):
+                yield add_module, livepatch_cmd
+
+
+class TestKernelLivepatchEnabled:
+    @pytest.mark.parametrize(
+        "module,enabled,expected",
+        (
+            ("lkp_Ubuntu_4_4_0_00_generic_1", "1", True),
+            ("lkp_Ubuntu_4_4_0_00_generic_1", "0", False),
+            ("kpatch_other_vendor", "1", False),
+        ),
+    )
+    def test_reads_enabled_state_of_canonical_modules(
+        self, module, enabled, expected, livepatch_sysfs
+    ):
+        add_module, _livepatch_cmd = livepatch_sysfs
+        add_module(module, enabled)
+
+        assert expected is kernel_livepatch_enabled()
+
+    def test_false_without_livepatch_sysfs(self):
+        with mock.patch(M_PATH + "LIVEPATCH_SYSFS_DIR", "/does/not/exist"):
+            assert kernel_livepatch_enabled() is False
+
+
+@mock.patch(M_PATH + "os.getuid", return_value=0)
+@mock.patch(M_PATH + "util.subp")
+class TestLivepatchApplicationStatus:
+    def test_disabled_without_forking_when_snap_is_absent(
+        self, m_subp, _m_getuid, entitlement, livepatch_sysfs
+    ):
+        assert (
+            status.ApplicationStatus.DISABLED,
+            "canonical-livepatch snap is not installed",
+        ) == entitlement.application_status()
+        assert 0 == m_subp.call_count
+
+    def test_enabled_without_forking_when_kernel_is_livepatched(
+        self, m_subp, _m_getuid, entitlement, livepatch_sysfs
+    ):
+        add_module, livepatch_cmd = livepatch_sysfs
+        livepatch_cmd.write("")
+        add_module("lkp_Ubuntu_4_4_0_00_generic_1")
+
+        assert (
+            status.ApplicationStatus.ENABLED,
+            "",
+        ) == entitlement.application_status()
+        assert 0 == m_subp.call_count
+
+    def test_ambiguous_state_runs_cli_once_within_cache_ttl(
+        self, m_subp, _m_getuid, entitlement, livepatch_sysfs
+    ):
+        _add_module, livepatch_cmd = livepatch_sysfs
+        livepatch_cmd.write("")
+        m_subp.side_effect = util.ProcessExecutionError("not enabled")
+
+        for _ in range(2):
+            app_status, _details = entitlement.application_status()
+            assert status.ApplicationStatus.DISABLED == app_status
+
+        assert [
+            mock.call([livepatch_cmd.strpath, "status"])
+        ] == m_subp.call_args_list
+
+    def test_expired_cache_runs_cli_again(
+        self, m_subp, _m_getuid, entitlement, livepatch_sysfs
+    ):
+        _add_module, livepatch_cmd = livepatch_sysfs
+        livepatch_cmd.write("")
+
+        with mock.patch(M_PATH + "time.time", return_value=1000):
+            entitlement.application_status()
+        with mock.patch(M_PATH + "time.time", return_value=1061):
+            entitlement.application_status()
+
+        assert 2 == m_subp.call_count
+
+    def test_kernel_patches_are_ignored_after_disable_this_boot(
+        self, m_subp, _m_getuid, entitlement, livepatch_sysfs
+    ):
+        """Loaded patches outlive disable, so the CLI decides."""
+        add_module, livepatch_cmd = livepatch_sysfs
+        livepatch_cmd.write("")
+        add_module("lkp_Ubuntu_4_4_0_00_generic_1")
+
+        with mock.patch(M_PATH + "time.time", return_value=1000):
+            with mock.patch.object(
+                entitlement, "can_disable", return_value=True
+            ):
+                with mock.patch(M_PATH + "util.which", return_value=True):
+                    assert entitlement.disable()
+        m_subp.side_effect = util.ProcessExecutionError("not enabled")
+        with mock.patch(M_PATH + "time.time", return_value=1100):
+            app_status, _details = entitlement.application_status()
+
+        assert status.ApplicationStatus.DISABLED == app_status
+        assert [
+            mock.call([livepatch_cmd.strpath, "disable"], capture=True),
+            mock.call([livepatch_cmd.strpath, "status"]),
+        ] == m_subp.call_args_list
+
+
 class TestLivepatchProcessConfigDirectives:
     @pytest.mark.parametrize(
         "directive_key,livepatch_param_tmpl",
@@ -406,6 +528,51 @@ class TestLivepatchProcessContractDeltas:
         assert setup_calls == m_setup_livepatch_config.call_args_list
 
 
+class TestInstallSnap:
+    @pytest.fixture
+    def snapd_server(self):
+        servers = []
+
+        def factory(**kwargs):
+            srv = SnapdServer(SnapdServerState(**kwargs))
+            srv.start()
+            servers.append(srv)
+            return srv
+
+        with mock.patch(M_PATH + "time.sleep"):
+            with mock.patch("uaclient.snapd.time.sleep"):
+                yield factory
+        for srv in servers:
+            srv.stop()
+
+    def test_waits_for_seed_and_install_change(self, snapd_server):
+        installed = []
+        srv = snapd_server(
+            seed_polls=2, change_polls=2, on_install=installed.append
+        )
+
+        with mock.patch("uaclient.snapd.SNAPD_SOCKET", srv.socket_path):
+            _install_snap("canonical-livepatch")
+
+        assert ["canonical-livepatch"] == installed
+        assert {"seed": 3, "install": 1, "change": 3} == dict(
+            srv.state.requests
+        )
+
+    def test_retries_failed_installs_before_raising(self, snapd_server):
+        srv = snapd_server(install_error="cannot download")
+
+        with mock.patch("uaclient.snapd.SNAPD_SOCKET", srv.socket_path):
+            with pytest.raises(snapd.SnapdError) as excinfo:
+                _install_snap("canonical-livepatch")
+
+        assert (
+            'Install "canonical-livepatch" snap failed: cannot download'
+            == excinfo.value.msg
+        )
+        assert 4 == srv.state.requests["install"]
+
+
 class TestLivepatchEntitlementEnable:
 
     mocks_apt_update = [
@@ -418,21 +585,13 @@ class TestLivepatchEntitlementEnable:
             retry_sleeps=apt.APT_RETRIES,
         )
     ]
-    mocks_snap_wait_seed = [
-        mock.call(
-            ["/usr/bin/snap", "wait", "system", "seed.loaded"], capture=True
-        )
+    mocks_install = mocks_snapd_install
+    mocks_snapd_client = [
+        mock.call(),
+        mock.call().wait_for_seed(),
+        mock.call().install("canonical-livepatch"),
+        mock.call().wait_for_change("1", on_progress=print),
     ]
-    mocks_livepatch_install = [
-        mock.call(
-            ["/usr/bin/snap", "install", "canonical-livepatch"],
-            capture=True,
-            retry_sleeps=[0.5, 1, 5],
-        )
-    ]
-    mocks_install = (
-        mocks_snapd_install + mocks_snap_wait_seed + mocks_livepatch_install
-    )
     mocks_config = [
         mock.call(
             [
@@ -476,6 +635,7 @@ class TestLivepatchEntitlementEnable:
     @pytest.mark.parametrize("caplog_text", [logging.DEBUG], indirect=True)
     @pytest.mark.parametrize("apt_update_success", (True, False))
     @mock.patch("uaclient.util.get_platform_info")
+    @mock.patch(M_PATH + "snapd.SnapdClient")
     @mock.patch("uaclient.util.subp")
     @mock.patch("uaclient.apt.run_apt_command")
     @mock.patch("uaclient.util.which", return_value=False)
@@ -488,6 +648,7 @@ class TestLivepatchEntitlementEnable:
         m_which,
         m_run_apt,
         m_subp,
+        m_snapd_client,
         _m_get_platform_info,
         capsys,
         caplog_text,
@@ -504,9 +665,11 @@ class TestLivepatchEntitlementEnable:
             raise exceptions.UserFacingError("Apt go BOOM")
 
         m_run_apt.side_effect = fake_run_apt
+        m_snapd_client.return_value.install.return_value = "1"
 
         assert entitlement.enable()
         assert self.mocks_install + self.mocks_config in m_subp.call_args_list
+        assert self.mocks_snapd_client == m_snapd_client.mock_calls
         assert self.mocks_apt_update == m_run_apt.call_args_list
         msg = (
             "Installing snapd\n"
@@ -530,6 +693,7 @@ class TestLivepatchEntitlementEnable:
         assert expected_calls == m_which.call_args_list
 
     @mock.patch("uaclient.util.get_platform_info")
+    @mock.patch(M_PATH + "snapd.SnapdClient")
     @mock.patch("uaclient.util.subp", return_value=("snapd", ""))
     @mock.patch(
         "uaclient.util.which", side_effect=lambda cmd: cmd == "/usr/bin/snap"
@@ -542,6 +706,7 @@ class TestLivepatchEntitlementEnable:
         m_app_status,
         m_which,
         m_subp,
+        m_snapd_client,
         _m_get_platform_info,
         capsys,
         entitlement,
@@ -549,13 +714,10 @@ class TestLivepatchEntitlementEnable:
         """Install canonical-livepatch snap when not present on the system."""
         application_status = status.ApplicationStatus.ENABLED
         m_app_status.return_value = application_status, "enabled"
+        m_snapd_client.return_value.install.return_value = "1"
         assert entitlement.enable()
-        assert (
-            self.mocks_snap_wait_seed
-            + self.mocks_livepatch_install
-            + self.mocks_config
-            in m_subp.call_args_list
-        )
+        assert self.mocks_config == m_subp.call_args_list[-3:]
+        assert self.mocks_snapd_client == m_snapd_client.mock_calls
         msg = (
             "Installing canonical-livepatch snap\n"
             "Canonical livepatch enabled.\n"
@@ -590,6 +752,29 @@ class TestLivepatchEntitlementEnable:
         )
         assert expected_msg == excinfo.value.msg
 
+    @mock.patch(M_PATH + "_install_snap")
+    @mock.patch(M_PATH + "apt.get_installed_packages", return_value=["snapd"])
+    @mock.patch(
+        "uaclient.util.which", side_effect=lambda cmd: cmd == "/usr/bin/snap"
+    )
+    @mock.patch(M_PATH + "LivepatchEntitlement.can_enable", return_value=True)
+    def test_enable_reports_snapd_install_failures(
+        self, m_can_enable, m_which, _m_installed, m_install_snap, entitlement
+    ):
+        """Errors reported by snapd are raised as UserFacingErrors."""
+        m_install_snap.side_effect = snapd.SnapdError(
+            'Install "canonical-livepatch" snap failed: no space left'
+        )
+
+        with pytest.raises(exceptions.UserFacingError) as excinfo:
+            entitlement.enable()
+
+        expected_msg = (
+            "Unable to install Livepatch client: Install"
+            ' "canonical-livepatch" snap failed: no space left'
+        )
+        assert expected_msg == excinfo.value.msg
+
     @mock.patch("uaclient.util.get_platform_info")
     @mock.patch("uaclient.util.subp")
     @mock.patch("uaclient.util.which", return_value="/found/livepatch")
@@ -250,6 +250,31 @@ class TestProcessContractDeltas:
         assert [mock.call()] == m_setup_apt_config.call_args_list
         assert [] == m_remove_auth_apt_repo.call_args_list
 
+    @mock.patch(M_PATH + "apt.update_apt_auth_credentials")
+    @mock.patch.object(RepoTestEntitlement, "setup_apt_config")
+    @mock.patch.object(RepoTestEntitlement, "remove_apt_config")
+    @mock.patch.object(RepoTestEntitlement, "application_status")
+    def test_only_apt_auth_is_rewritten_on_resource_token_delta(
+        self,
+        m_application_status,
+        m_remove_apt_config,
+        m_setup_apt_config,
+        m_update_apt_auth_credentials,
+        entitlement,
+    ):
+        """A changed resourceToken leaves sources, keys and pins in place."""
+        application_status = status.ApplicationStatus.ENABLED
+        m_application_status.return_value = (application_status, "")
+        assert entitlement.process_contract_deltas(
+            {"entitlement": {"entitled": True}, "resourceToken": "old-token"},
+            {"resourceToken": "repotest-token"},
+        )
+        assert [
+            mock.call("http://REPOTEST", "repotest-token")
+        ] == m_update_apt_auth_credentials.call_args_list
+        assert 0 == m_remove_apt_config.call_count
+        assert 0 == m_setup_apt_config.call_count
+
     @mock.patch(
         "uaclient.entitlements.base.UAEntitlement.process_contract_deltas"
     )
@@ -0,0 +1,173 @@
+"""
+Opt-in machine-readable progress events.
+
+Long-running operations report their phases as newline-delimited JSON on
+the stream selected with "ua --events-fd FD" or "ua --events-file PATH":
+
+    {"event": "phase-start", "phase": "enable", "pid": 42,
+     "service": "esm-infra", "timestamp": "2020-07-01T12:00:00.000000Z"}
+    {"duration": 12.5, "event": "phase-end", "outcome": "succeeded",
+     "phase": "enable", "pid": 42, "service": "esm-infra",
+     "timestamp": "2020-07-01T12:00:12.500000Z"}
+
+Each event is one line. Phases nest: the command phase wraps per service
+phases, which wrap phases such as apt-update or install-packages. Nested
+phases report the service of the phase they run in. outcome is "succeeded"
+or "failed"; failed phases ending in an exception carry an error field.
+Nothing is written unless a stream was started.
+
+Independently of the stream, phase-end events can be recorded in memory
+for the operation journal.
+"""
+
+import contextlib
+import datetime
+import json
+import logging
+import os
+import threading
+import time
+
+from uaclient import exceptions
+
+try:
+    from typing import Any, Dict, Iterator, List, Optional, TextIO  # noqa
+except ImportError:
+    # typing isn't available on trusty, so ignore its absence
+    pass
+
+
+OUTCOME_SUCCEEDED = "succeeded"
+OUTCOME_FAILED = "failed"
+
+_stream = None  # type: Optional[TextIO]
+_stream_lock = threading.Lock()
+_recorded = None  # type: Optional[List[Dict[str, Any]]]
+_context = threading.local()
+
+
+def start_stream(fd: "Optional[int]" = None, path: "Optional[str]" = None):
+    """Write events to the open file descriptor fd, or append them to path.
+
+    The descriptor stays open when the stream is stopped.
+    """
+    global _stream
+    if fd is not None:
+        stream = os.fdopen(fd, "w", closefd=False)
+    elif path is not None:
+        stream = open(path, "a")
+    else:
+        return
+    with _stream_lock:
+        _stream = stream
+
+
+def stop_stream() -> None:
+    """Flush and close the event stream, if any."""
+    global _stream
+    with _stream_lock:
+        stream, _stream = _stream, None
+    if stream is not None:
+        try:
+            stream.close()
+        except OSError as e:
+            logging.debug("Failed to close event stream: %s", e)
+
+
+def start_recording() -> None:
+    """Record phase-end events in memory until stop_recording."""
+    global _recorded
+    with _stream_lock:
+        _recorded = []
+
+
+def stop_recording() -> "List[Dict[str, Any]]":
+    """Stop recording and return the phase-end events recorded."""
+    global _recorded
+    with _stream_lock:
+        recorded, _recorded = _recorded, None
+    return recorded or []
+
+
+def timestamp() -> str:
+    """Return the current UTC time as used in events."""
+    return datetime.datetime.utcnow().strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+
+def emit(event: str, **fields: "Any") -> None:
+    """Write event with fields whose value is not None to the stream."""
+    if _stream is None and _recorded is None:
+        return
+    record = {"event": event, "timestamp": timestamp(), "pid": os.getpid()}
+    record.update(
+        (key, value) for key, value in fields.items() if value is not None
+    )
+    with _stream_lock:
+        if _recorded is not None and event == "phase-end":
+            _recorded.append(record)
+        if _stream is None:
+            return
+        try:
+            _stream.write(json.dumps(record, sort_keys=True) + "\n")
+            _stream.flush()
+        except (OSError, ValueError) as e:
+            # A closed reader must not fail the operation it observes
+            logging.debug("Failed to write %s event: %s", event, e)
+
+
+def _error(exc: BaseException) -> str:
+    if isinstance(exc, exceptions.UserFacingError):
+        return exc.msg
+    # Messages of other errors may carry commands with credentials
+    return type(exc).__name__
+
+
+@contextlib.contextmanager
+def phase(
+    name: str, service: "Optional[str]" = None
+) -> "Iterator[Dict[str, Any]]":
+    """Emit phase-start and phase-end events around the with block.
+
+    The block gets a dict whose "outcome" it may set to OUTCOME_FAILED when
+    the phase fails without raising. Exceptions end the phase as failed.
+    Once the phase ended, the dict also holds its "duration" in seconds.
+
+    :param name: Name of the phase, such as "enable" or "apt-update".
+    :param service: Service the phase acts on, defaults to the service of
+        the enclosing phase in this thread.
+    """
+    outer_service = getattr(_context, "service", None)
+    if service is None:
+        service = outer_service
+    result = {"outcome": OUTCOME_SUCCEEDED}  # type: Dict[str, Any]
+    _context.service = service
+    emit("phase-start", phase=name, service=service)
+    start = time.monotonic()
+    try:
+        yield result
+    except BaseException as e:
+        result["duration"] = round(time.monotonic() - start, 6)
+        if not isinstance(e, SystemExit) or e.code:
+            result["outcome"] = OUTCOME_FAILED
+        emit(
+            "phase-end",
+            phase=name,
+            service=service,
+            outcome=result["outcome"],
+            duration=result["duration"],
+            error=None
+            if result["outcome"] == OUTCOME_SUCCEEDED
+            else _error(e),
+        )
+        raise
+    else:
+        result["duration"] = round(time.monotonic() - start, 6)
+        emit(
+            "phase-end",
+            phase=name,
+            service=service,
+            outcome=result["outcome"],
+            duration=result["duration"],
+        )
+    finally:
+        _context.service = outer_service
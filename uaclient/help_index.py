@@ -0,0 +1,116 @@
+"""
+Index of the service help text shipped in help_data.yaml.
+
+The package build compiles help_data.yaml into a JSON index, help_data.json,
+which maps each service name to its help text. Reading help then only needs
+the json module. When the index is missing, or older than the YAML file,
+the YAML file is parsed instead. Either way the index is loaded at most once
+per process.
+
+Usage at build time:
+
+    python3 -m uaclient.help_index help_data.yaml help_data.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+
+from uaclient import util
+from uaclient.defaults import DEFAULT_HELP_FILE, DEFAULT_HELP_INDEX_FILE
+
+try:
+    from typing import Dict, List, Optional  # noqa: F401
+except ImportError:
+    # typing isn't available on trusty, so ignore its absence
+    pass
+
+
+_index = None  # type: Optional[Dict[str, str]]
+_index_lock = threading.Lock()
+
+
+def compile_help_index(help_file: str) -> "Dict[str, str]":
+    """Return a dict of help text keyed by service name from help_file."""
+    import yaml  # Only needed when the index is missing or stale
+
+    with open(help_file, "r") as stream:
+        help_dict = yaml.safe_load(stream) or {}
+    return dict(
+        (name, (value or {}).get("help", ""))
+        for name, value in help_dict.items()
+    )
+
+
+def write_help_index(help_file: str, index_file: str) -> None:
+    """Compile help_file into the JSON index_file."""
+    util.write_file(
+        index_file,
+        json.dumps(compile_help_index(help_file), indent=2, sort_keys=True),
+        mode=0o644,
+    )
+
+
+def _load_help_index(help_file: str, index_file: str) -> "Dict[str, str]":
+    try:
+        index_mtime = os.stat(index_file).st_mtime
+    except OSError:
+        index_mtime = None
+    try:
+        help_mtime = os.stat(help_file).st_mtime
+    except OSError:
+        help_mtime = None
+    if index_mtime is not None and (
+        help_mtime is None or index_mtime >= help_mtime
+    ):
+        try:
+            return json.loads(util.load_file(index_file))
+        except (IOError, OSError, ValueError) as e:
+            logging.debug("Ignoring invalid help index %s: %s", index_file, e)
+    if help_mtime is None:
+        return {}
+    return compile_help_index(help_file)
+
+
+def get_help_index() -> "Dict[str, str]":
+    """Return the dict of help text keyed by service name.
+
+    The index is loaded on the first call only.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = _load_help_index(
+                DEFAULT_HELP_FILE, DEFAULT_HELP_INDEX_FILE
+            )
+        return _index
+
+
+def get_help(name: str) -> str:
+    """Return the help text of service name, or an empty string."""
+    return get_help_index().get(name, "")
+
+
+def clear_help_index() -> None:
+    """Drop the loaded index, so the next lookup loads it again."""
+    global _index
+    with _index_lock:
+        _index = None
+
+
+def main(sys_argv: "Optional[List[str]]" = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Compile help_data.yaml into a JSON help index"
+    )
+    parser.add_argument("help_file", help="path of the help_data.yaml")
+    parser.add_argument("index_file", help="path of the JSON index to write")
+    args = parser.parse_args(sys_argv)
+    write_help_index(args.help_file, args.index_file)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
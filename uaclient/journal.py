@@ -0,0 +1,192 @@
+"""
+Persistent journal of the operations ua performed.
+
+Each attach, auto-attach, detach, enable, disable and refresh appends one
+JSON line to the journal in the data dir, with its start, end, duration,
+outcome and the phases it went through, as reported by uaclient.events.
+Scheduled refreshes which skip contacting the contract server are not
+journaled:
+
+    {"operation": "enable", "started": "...Z", "finished": "...Z",
+     "duration": 20.1, "outcome": "succeeded",
+     "phases": [{"phase": "apt-update", "service": "esm-infra",
+                 "duration": 15.2, "outcome": "succeeded"}, ...]}
+
+Once the journal exceeds JOURNAL_MAX_BYTES it is rotated to a single older
+file, which bounds its size on disk. "ua journal" summarises both. Unlike
+the caches, the journal is kept when the machine detaches.
+"""
+
+import json
+import logging
+import os
+
+from uaclient import util
+
+try:
+    from typing import Any, Dict, List, Optional  # noqa: F401
+except ImportError:
+    # typing isn't available on trusty, so ignore its absence
+    pass
+
+
+JOURNALED_OPERATIONS = (
+    "attach",
+    "auto-attach",
+    "detach",
+    "disable",
+    "enable",
+    "refresh",
+)
+JOURNAL_FILE = "journal.jsonl"
+JOURNAL_MAX_BYTES = 256 * 1024
+PHASE_FIELDS = ("phase", "service", "duration", "outcome", "error")
+
+SUMMARY_TMPL = "{name: <22}{runs: >5}{failed: >8}{average: >10}{maximum: >10}"
+OPERATION_HEADER = (
+    SUMMARY_TMPL.format(
+        name="OPERATION",
+        runs="RUNS",
+        failed="FAILED",
+        average="AVERAGE",
+        maximum="MAX",
+    )
+    + "  LAST RUN"
+)
+PHASE_HEADER = SUMMARY_TMPL.format(
+    name="PHASE",
+    runs="RUNS",
+    failed="FAILED",
+    average="AVERAGE",
+    maximum="MAX",
+)
+MESSAGE_JOURNAL_EMPTY = "No operations recorded in the journal yet."
+
+
+def journal_path(cfg) -> str:
+    return os.path.join(cfg.data_dir, JOURNAL_FILE)
+
+
+def _rotated_path(path: str) -> str:
+    return path + ".1"
+
+
+def append_entry(cfg, entry: "Dict[str, Any]") -> None:
+    """Append entry to the journal of cfg, rotating it when full."""
+    path = journal_path(cfg)
+    line = json.dumps(entry, sort_keys=True) + "\n"
+    try:
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        try:
+            size = os.path.getsize(path)
+        except OSError:
+            size = 0
+        if size and size + len(line) > JOURNAL_MAX_BYTES:
+            os.rename(path, _rotated_path(path))
+        with open(path, "a") as stream:
+            stream.write(line)
+        os.chmod(path, 0o644)
+    except OSError as e:
+        # The journal must never fail the operation it records
+        logging.warning("Failed to write operation journal %s: %s", path, e)
+
+
+def record_operation(
+    cfg, name: str, started: str, phases: "List[Dict[str, Any]]"
+) -> None:
+    """Journal operation name from the phase-end events it recorded.
+
+    :param started: events.timestamp() taken when the operation started.
+    :param phases: Phase-end events, the last one ending the operation.
+    """
+    if not phases:
+        return
+    end = phases[-1]
+    entry = {
+        "operation": name,
+        "started": started,
+        "finished": end["timestamp"],
+        "duration": end.get("duration"),
+        "outcome": end.get("outcome"),
+        "phases": [
+            dict((k, phase[k]) for k in PHASE_FIELDS if k in phase)
+            for phase in phases[:-1]
+        ],
+    }
+    if "error" in end:
+        entry["error"] = end["error"]
+    append_entry(cfg, entry)
+
+
+def read_entries(cfg) -> "List[Dict[str, Any]]":
+    """Return journal entries of cfg, oldest first."""
+    path = journal_path(cfg)
+    entries = []
+    for journal_file in (_rotated_path(path), path):
+        try:
+            content = util.load_file(journal_file)
+        except (IOError, OSError):
+            continue
+        for line in content.splitlines():
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                continue  # Cut short by a crash or full disk
+            if isinstance(entry, dict) and "operation" in entry:
+                entries.append(entry)
+    return entries
+
+
+def _aggregate(records, name_key: str) -> "Dict[str, Dict[str, Any]]":
+    summary = {}  # type: Dict[str, Dict[str, Any]]
+    for record in records:
+        item = summary.setdefault(
+            record.get(name_key),
+            {"runs": 0, "failed": 0, "total": 0.0, "max": 0.0, "last": None},
+        )
+        duration = record.get("duration") or 0.0
+        item["runs"] += 1
+        item["failed"] += record.get("outcome") != "succeeded"
+        item["total"] += duration
+        item["max"] = max(item["max"], duration)
+        item["last"] = record.get("finished")
+    for item in summary.values():
+        item["average"] = round(item.pop("total") / item["runs"], 6)
+    return summary
+
+
+def summarise(entries: "List[Dict[str, Any]]") -> "Dict[str, Any]":
+    """Return run counts, failures and durations per operation and phase."""
+    phases = [phase for entry in entries for phase in entry.get("phases", [])]
+    summary = {
+        "operations": _aggregate(entries, "operation"),
+        "phases": _aggregate(phases, "phase"),
+    }
+    for item in summary["phases"].values():
+        del item["last"]
+    return summary
+
+
+def format_summary(summary: "Dict[str, Any]") -> str:
+    """Format summary for tabular output."""
+    if not summary["operations"]:
+        return MESSAGE_JOURNAL_EMPTY
+
+    def row(name, item):
+        return SUMMARY_TMPL.format(
+            name=name,
+            runs=item["runs"],
+            failed=item["failed"],
+            average="{:.2f}s".format(item["average"]),
+            maximum="{:.2f}s".format(item["max"]),
+        )
+
+    content = [OPERATION_HEADER]
+    for name, item in sorted(summary["operations"].items()):
+        content.append(row(name, item) + "  " + (item["last"] or ""))
+    if summary["phases"]:
+        content.extend(["", PHASE_HEADER])
+        for name, item in sorted(summary["phases"].items()):
+            content.append(row(name, item))
+    return "\n".join(content)
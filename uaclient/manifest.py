@@ -0,0 +1,229 @@
+"""
+Manifest of the services this client knows about.
+
+The package build writes entitlements.json, which records the name, title,
+origin, package system and apt files of each entitlement class. The
+maintainer scripts read it instead of importing uaclient.entitlements, and
+ask whether a single service is enabled from local state only, without
+running a full ua status.
+
+Usage:
+
+    python3 -m uaclient.manifest compile entitlements.json
+    python3 -m uaclient.manifest names
+    python3 -m uaclient.manifest is-enabled esm-infra
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+
+from uaclient import status, util
+from uaclient.defaults import DEFAULT_MANIFEST_FILE
+
+try:
+    from typing import Any, Dict, List, Optional  # noqa: F401
+except ImportError:
+    # typing isn't available on trusty, so ignore its absence
+    pass
+
+
+_manifest = None  # type: Optional[Dict[str, Dict[str, Any]]]
+_manifest_lock = threading.Lock()
+
+
+def compile_manifest(entitlement_classes=None) -> "Dict[str, Dict[str, Any]]":
+    """Return manifest entries keyed by name for entitlement_classes.
+
+    :param entitlement_classes: Entitlement classes to describe, defaults to
+        uaclient.entitlements.ENTITLEMENT_CLASSES.
+    """
+    from uaclient.entitlements.repo import RepoEntitlement
+
+    if entitlement_classes is None:
+        from uaclient.entitlements import ENTITLEMENT_CLASSES
+
+        entitlement_classes = ENTITLEMENT_CLASSES
+    manifest = {}
+    for ent_cls in entitlement_classes:
+        files = []  # type: List[str]
+        origin = None
+        if issubclass(ent_cls, RepoEntitlement):
+            files = [
+                ent_cls.repo_list_file_tmpl.format(name=ent_cls.name),
+                ent_cls.repo_pref_file_tmpl.format(name=ent_cls.name),
+            ]
+            origin = ent_cls.origin
+        manifest[ent_cls.name] = {
+            "title": ent_cls.title,
+            "origin": origin,
+            "package_system": ent_cls.package_system,
+            "is_beta": ent_cls.is_beta,
+            "files": files,
+        }
+    return manifest
+
+
+def write_manifest(manifest_file: str) -> None:
+    """Compile the manifest of all entitlements into manifest_file."""
+    util.write_file(
+        manifest_file,
+        json.dumps(compile_manifest(), indent=2, sort_keys=True),
+        mode=0o644,
+    )
+
+
+def _load_manifest(manifest_file: str) -> "Dict[str, Dict[str, Any]]":
+    try:
+        return json.loads(util.load_file(manifest_file))
+    except (IOError, OSError, ValueError) as e:
+        logging.debug(
+            "Compiling manifest, %s is unusable: %s", manifest_file, e
+        )
+    return compile_manifest()
+
+
+def get_manifest() -> "Dict[str, Dict[str, Any]]":
+    """Return the manifest entries keyed by service name.
+
+    The manifest is loaded on the first call only.
+    """
+    global _manifest
+    with _manifest_lock:
+        if _manifest is None:
+            _manifest = _load_manifest(DEFAULT_MANIFEST_FILE)
+        return _manifest
+
+
+def clear_manifest() -> None:
+    """Drop the loaded manifest, so the next lookup loads it again."""
+    global _manifest
+    with _manifest_lock:
+        _manifest = None
+
+
+def _deb_line_url(line: str) -> "Optional[str]":
+    """Return the repository URL of the deb line, or None if malformed.
+
+    Options such as [arch=amd64 signed-by=...] before the URL are skipped.
+    """
+    words = line.split()
+    if not words or words[0] != "deb":
+        return None
+    words = words[1:]
+    if words and words[0].startswith("["):
+        while words and not words[0].endswith("]"):
+            words.pop(0)
+        words = words[1:]
+    return words[0] if words else None
+
+
+def _apt_urls(machine_token: "Dict[str, Any]", name: str) -> "List[str]":
+    """Return the aptURLs the machine token gives service name on any series.
+
+    Reading the raw token, rather than the series views of
+    UAConfig.entitlements, avoids looking up the platform.
+    """
+    contract_info = machine_token["machineTokenInfo"]["contractInfo"]
+    urls = []
+    for entitlement in contract_info.get("resourceEntitlements", []):
+        if entitlement.get("type") != name:
+            continue
+        accesses = [entitlement]
+        accesses.extend((entitlement.get("series") or {}).values())
+        for access in accesses:
+            url = (access.get("directives") or {}).get("aptURL")
+            if url:
+                urls.append(url)
+    return urls
+
+
+def _apt_files_enabled(entry: "Dict[str, Any]", apt_urls: "List[str]") -> bool:
+    """Return whether the apt files of entry configure one of apt_urls.
+
+    This mirrors the apt-cache policy check of RepoEntitlement: the source
+    must be listed by an active deb line and must not be pinned to never.
+    """
+    list_file, pref_file = entry["files"]
+    try:
+        content = util.load_file(list_file)
+    except (IOError, OSError):
+        return False
+    repos = set(url.rstrip("/") + "/ubuntu" for url in apt_urls)
+    urls = [_deb_line_url(line) for line in content.splitlines()]
+    if not any(url.rstrip("/") in repos for url in urls if url):
+        return False
+    if os.path.exists(pref_file):
+        for line in util.load_file(pref_file).splitlines():
+            if line.replace(" ", "") == "Pin-Priority:never":
+                return False
+    return True
+
+
+def is_enabled(name: str, cfg=None) -> bool:
+    """Return whether service name is enabled, judged from local state only.
+
+    Repo services are checked against their apt files, which must list an
+    aptURL of the machine token. Other services use the status cache
+    written by the last status update. No network access or subprocess is
+    involved.
+
+    :param cfg: UAConfig to read the machine token and caches from.
+    """
+    entry = get_manifest().get(name)
+    if entry is None:
+        return False
+    if cfg is None:
+        from uaclient.config import UAConfig
+
+        cfg = UAConfig()
+    if not cfg.is_attached:
+        return False
+    if entry["files"]:
+        apt_urls = _apt_urls(cfg.machine_token, name)
+        if not apt_urls:
+            return False
+        return _apt_files_enabled(entry, apt_urls)
+    cached = cfg.read_cache("status-cache", silent=True) or {}
+    for service in cached.get("services", []):
+        if service.get("name") == name:
+            return (
+                service.get("status") == status.UserFacingStatus.ACTIVE.value
+            )
+    return False
+
+
+def main(sys_argv: "Optional[List[str]]" = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Query or compile the manifest of ua services"
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    compile_parser = subparsers.add_parser(
+        "compile", help="write the manifest of all services"
+    )
+    compile_parser.add_argument(
+        "manifest_file", help="path of the JSON manifest to write"
+    )
+    subparsers.add_parser("names", help="print the names of all services")
+    enabled_parser = subparsers.add_parser(
+        "is-enabled", help="exit 0 when the service is enabled, 1 otherwise"
+    )
+    enabled_parser.add_argument("name", help="the name of the service")
+    args = parser.parse_args(sys_argv)
+    if args.command == "compile":
+        write_manifest(args.manifest_file)
+    elif args.command == "names":
+        print(" ".join(sorted(get_manifest())))
+    elif args.command == "is-enabled":
+        return 0 if is_enabled(args.name) else 1
+    else:
+        parser.print_usage()
+        return 2
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+"""
+Prometheus metrics for the node-exporter textfile collector.
+
+Whenever the status-cache is rewritten, the metrics file is rewritten from
+it, the refresh state and the timings of the last attach, enable, refresh
+and detach. node-exporter then scrapes a file instead of running ua status.
+The file is only written when its directory exists, which is the case once
+prometheus-node-exporter is installed. Set metrics_file in uaclient.conf to
+publish it elsewhere, or to an empty value to disable it.
+"""
+
+import datetime
+import logging
+import os
+
+from uaclient import status, util
+
+try:
+    from typing import Any, Dict, List, Optional, Tuple  # noqa: F401
+except ImportError:
+    # typing isn't available on trusty, so ignore its absence
+    pass
+
+
+TIMED_OPERATIONS = ("attach", "auto-attach", "detach", "enable", "refresh")
+SERVICE_STATUSES = [s.value for s in status.UserFacingStatus]
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _timestamp(value: "Any") -> "Optional[float]":
+    """Return seconds since the epoch of the naive UTC datetime value."""
+    if not isinstance(value, datetime.datetime):
+        return None
+    return (value - EPOCH).total_seconds()
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metrics:
+    """Accumulate metric families in text exposition format."""
+
+    def __init__(self):
+        self.lines = []  # type: List[str]
+
+    def family(self, name: str, doc: str, samples) -> None:
+        """Add metric name from (labels, value) samples, skipping None."""
+        samples = [(k, v) for k, v in samples if v is not None]
+        if not samples:
+            return
+        self.lines.append("# HELP ua_{} {}".format(name, doc))
+        self.lines.append("# TYPE ua_{} gauge".format(name))
+        for labels, value in samples:
+            label_str = ",".join(
+                '{}="{}"'.format(k, _escape(str(v)))
+                for k, v in sorted(labels.items())
+            )
+            if label_str:
+                label_str = "{" + label_str + "}"
+            self.lines.append(
+                "ua_{}{} {}".format(name, label_str, float(value))
+            )
+
+    def render(self) -> str:
+        return "\n".join(self.lines) + "\n"
+
+
+def render_metrics(
+    status_cache: "Dict[str, Any]",
+    refresh_state: "Optional[Dict[str, Any]]" = None,
+    timings: "Optional[Dict[str, Any]]" = None,
+) -> str:
+    """Return metrics in text exposition format.
+
+    :param status_cache: Content of the status-cache.
+    :param refresh_state: Content of the refresh-state cache.
+    :param timings: Content of the operation-timings cache.
+    """
+    metrics = _Metrics()
+    attached = bool(status_cache.get("attached"))
+    metrics.family(
+        "attached",
+        "Whether the machine is attached to a subscription.",
+        [({}, attached)],
+    )
+    metrics.family(
+        "contract_expiry_timestamp_seconds",
+        "Time the contract expires.",
+        [({}, _timestamp(status_cache.get("expires")))],
+    )
+    services = status_cache.get("services", [])
+    entitled = []
+    applicable = []
+    statuses = []
+    for service in services:
+        label = {"service": service.get("name")}
+        if attached:
+            entitled.append((label, service.get("entitled") == "yes"))
+            applicable.append(
+                (
+                    label,
+                    service.get("status")
+                    != status.UserFacingStatus.INAPPLICABLE.value,
+                )
+            )
+            for value in SERVICE_STATUSES:
+                statuses.append(
+                    (dict(label, status=value), service.get("status") == value)
+                )
+        else:
+            applicable.append((label, service.get("available") == "yes"))
+    metrics.family(
+        "service_entitled",
+        "Whether the contract entitles the service.",
+        entitled,
+    )
+    metrics.family(
+        "service_status",
+        "Status of the service, 1 for the current status.",
+        statuses,
+    )
+    metrics.family(
+        "service_applicable",
+        "Whether the service applies to this machine.",
+        applicable,
+    )
+    refresh_state = refresh_state or {}
+    last_success = _timestamp(refresh_state.get("lastSuccess"))
+    last_failure = _timestamp(refresh_state.get("lastFailure"))
+    last_refresh = max(
+        [t for t in (last_success, last_failure) if t is not None],
+        default=None,
+    )
+    metrics.family(
+        "last_refresh_timestamp_seconds",
+        "Time of the last contract refresh attempt.",
+        [({}, last_refresh)],
+    )
+    metrics.family(
+        "last_refresh_success",
+        "Whether the last contract refresh attempt succeeded.",
+        [({}, None if last_refresh is None else last_refresh == last_success)],
+    )
+    durations = []
+    successes = []
+    finished = []
+    for operation, timing in sorted((timings or {}).items()):
+        label = {"operation": operation}
+        durations.append((label, timing.get("duration")))
+        successes.append((label, timing.get("outcome") == "succeeded"))
+        finished.append((label, _timestamp(timing.get("finished"))))
+    metrics.family(
+        "operation_duration_seconds",
+        "Duration of the last run of the operation.",
+        durations,
+    )
+    metrics.family(
+        "operation_success",
+        "Whether the last run of the operation succeeded.",
+        successes,
+    )
+    metrics.family(
+        "operation_timestamp_seconds",
+        "Time the last run of the operation finished.",
+        finished,
+    )
+    return metrics.render()
+
+
+def write_metrics(cfg) -> None:
+    """Rewrite cfg.metrics_file from the caches of cfg.
+
+    Failures are logged only: metrics never fail the operation writing them.
+    """
+    metrics_file = cfg.metrics_file
+    if not metrics_file or not os.path.isdir(os.path.dirname(metrics_file)):
+        return
+    status_cache = cfg.read_cache("status-cache", silent=True)
+    if not isinstance(status_cache, dict):
+        status_cache = {}  # Removed by detach
+    content = render_metrics(
+        status_cache,
+        cfg.read_cache("refresh-state", silent=True),
+        cfg.read_cache("operation-timings", silent=True),
+    )
+    # The textfile collector must never read a partially written file
+    tmp_file = metrics_file + ".tmp"
+    try:
+        util.write_file(tmp_file, content, mode=0o644)
+        os.rename(tmp_file, metrics_file)
+    except OSError as e:
+        logging.warning("Failed to write metrics to %s: %s", metrics_file, e)
+
+
+def record_operation(cfg, name: str, result: "Dict[str, Any]") -> None:
+    """Record the duration and outcome of operation name for metrics.
+
+    :param result: The result of the events.phase which ran the operation.
+    """
+    timings = cfg.read_cache("operation-timings", silent=True)
+    if not isinstance(timings, dict):
+        timings = {}
+    timings[name] = {
+        "duration": result.get("duration"),
+        "outcome": result.get("outcome"),
+        "finished": datetime.datetime.utcnow().replace(microsecond=0),
+    }
+    try:
+        cfg.write_cache("operation-timings", timings)
+    except OSError as e:
+        logging.warning("Failed to record %s timing: %s", name, e)
+        return
+    write_metrics(cfg)
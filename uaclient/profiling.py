@@ -0,0 +1,134 @@
+"""
+Profiling of ua commands on the machine they are slow on.
+
+Run any command with UA_PROFILE=cpu, or the hidden --profile flag, to run
+its action under cProfile. UA_PROFILE=memory, or --profile-memory, also
+traces memory allocations with tracemalloc:
+
+    sudo UA_PROFILE=memory ua status
+    sudo ua --profile-memory status
+
+The profile is written in pstats format to the profiles directory of the
+data dir, next to a summary of the top PROFILE_TOP_N functions and, when
+traced, allocation sites. Only the PROFILE_KEEP most recent profiles are
+kept. cProfile only follows the main thread, so work done in enable lanes
+shows up as time spent waiting on them.
+"""
+
+import contextlib
+import cProfile
+import datetime
+import glob
+import io
+import logging
+import os
+import pstats
+import sys
+import tracemalloc
+
+from uaclient import util
+
+try:
+    from typing import Any, Iterator, Optional  # noqa: F401
+except ImportError:
+    # typing isn't available on trusty, so ignore its absence
+    pass
+
+
+PROFILE_ENV = "UA_PROFILE"
+PROFILE_MODES = {"1": "cpu", "cpu": "cpu", "memory": "memory"}
+PROFILE_SUBDIR = "profiles"
+PROFILE_TOP_N = 30
+PROFILE_KEEP = 10
+
+
+def profile_mode(args: "Any") -> "Optional[str]":
+    """Return "cpu" or "memory" when args or the environment ask for it."""
+    requested = getattr(args, "profile", None) or os.environ.get(PROFILE_ENV)
+    if not requested:
+        return None
+    mode = PROFILE_MODES.get(requested) if isinstance(requested, str) else None
+    if mode is None:
+        logging.warning("Ignoring unknown profile mode %r", requested)
+    return mode
+
+
+def _summary(
+    profiler: cProfile.Profile, snapshot: "Optional[Any]", top_n: int
+) -> str:
+    stream = io.StringIO()
+    stats = pstats.Stats(profiler, stream=stream)
+    stats.sort_stats("cumulative").print_stats(top_n)
+    stats.sort_stats("tottime").print_stats(top_n)
+    if snapshot is not None:
+        stream.write("Top {} allocation sites:\n".format(top_n))
+        for stat in snapshot.statistics("lineno")[:top_n]:
+            stream.write("{}\n".format(stat))
+    return stream.getvalue()
+
+
+def _prune(profile_dir: str, keep: int) -> None:
+    """Remove all but the keep most recent profiles in profile_dir."""
+    profiles = sorted(
+        glob.glob(os.path.join(profile_dir, "*.prof")),
+        key=lambda path: (os.stat(path).st_mtime_ns, path),
+    )
+    for profile in profiles[:-keep]:
+        util.remove_file(profile)
+        util.remove_file(profile[: -len(".prof")] + ".txt")
+
+
+def write_profile(
+    cfg, name: str, profiler: cProfile.Profile, snapshot=None
+) -> "Optional[str]":
+    """Write the profile of command name under the data dir of cfg.
+
+    :return: Path of the summary written, None when it could not be.
+    """
+    profile_dir = os.path.join(cfg.data_dir, PROFILE_SUBDIR)
+    base = os.path.join(
+        profile_dir,
+        "{}-{}-{}".format(
+            name,
+            datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%S"),
+            os.getpid(),
+        ),
+    )
+    try:
+        if not os.path.exists(profile_dir):
+            os.makedirs(profile_dir, mode=0o700)
+        profiler.dump_stats(base + ".prof")
+        util.write_file(
+            base + ".txt",
+            _summary(profiler, snapshot, PROFILE_TOP_N),
+            mode=0o600,
+        )
+        _prune(profile_dir, PROFILE_KEEP)
+    except OSError as e:
+        logging.warning("Failed to write profile to %s: %s", profile_dir, e)
+        return None
+    return base + ".txt"
+
+
+@contextlib.contextmanager
+def profiled(cfg, name: str, mode: "Optional[str]") -> "Iterator[None]":
+    """Profile the with block as command name when mode is set."""
+    if mode is None:
+        yield
+        return
+    trace_memory = mode == "memory" and not tracemalloc.is_tracing()
+    if trace_memory:
+        tracemalloc.start()
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        snapshot = None
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            tracemalloc.stop()
+        summary = write_profile(cfg, name, profiler, snapshot)
+        if summary:
+            print("Profile written to {}".format(summary), file=sys.stderr)
@@ -60,6 +60,9 @@ class UAServiceClient(metaclass=abc.ABCMeta):
                 if error_details:
                     raise self.api_error_cls(e, error_details)
             raise util.UrlError(
-                e, code=getattr(e, "code", None), headers=headers, url=url
+                e,
+                code=getattr(e, "code", None),
+                headers=getattr(e, "headers", None),
+                url=url,
             )
         return response, headers
@@ -0,0 +1,247 @@
+"""
+A minimal client for the snapd REST API served on /run/snapd.socket.
+
+Talking to snapd directly avoids forking the snap CLI and lets us poll
+asynchronous changes with backoff, reporting snapd's own task progress and
+error messages.
+"""
+
+import http.client
+import json
+import logging
+import socket
+import time
+import urllib.parse
+
+from uaclient import exceptions
+
+try:
+    from typing import Any, Callable, Dict, Optional  # noqa: F401
+except ImportError:
+    # typing isn't available on trusty, so ignore its absence
+    pass
+
+
+SNAPD_SOCKET = "/run/snapd.socket"
+SNAPD_REQUEST_TIMEOUT = 30.0  # seconds to wait on any single request
+SNAPD_WAIT_TIMEOUT = 600.0  # seconds to wait for seeding or a change
+SNAPD_POLL_INITIAL = 0.1  # seconds before the first poll is repeated
+SNAPD_POLL_MAX = 2.0  # seconds between polls once backed off
+
+# snapd change statuses which mean the change failed
+CHANGE_FAILED_STATUSES = ("Error", "Hold", "Undone")
+
+
+class SnapdError(exceptions.UserFacingError):
+    """Raised on snapd error responses, failed changes or timeouts.
+
+    :param kind: The snapd error kind, such as "snap-not-found", if any.
+    :param status_code: The HTTP status code of a snapd error response, or
+        None when the error did not come from snapd itself.
+    """
+
+    def __init__(
+        self,
+        msg: str,
+        kind: "Optional[str]" = None,
+        status_code: "Optional[int]" = None,
+    ) -> None:
+        super().__init__(msg)
+        self.kind = kind
+        self.status_code = status_code
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+    """An HTTPConnection over a Unix domain socket."""
+
+    def __init__(self, socket_path: str, timeout: float) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError:
+            sock.close()
+            raise
+        self.sock = sock
+
+
+def _poll_sleeps(timeout: float):
+    """Yield seconds to sleep between polls, backing off until timeout."""
+    deadline = time.monotonic() + timeout
+    delay = SNAPD_POLL_INITIAL
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        yield min(delay, remaining)
+        delay = min(delay * 2, SNAPD_POLL_MAX)
+
+
+class SnapdClient:
+    """Query snapd and install snaps through its REST API."""
+
+    def __init__(
+        self,
+        socket_path: "Optional[str]" = None,
+        timeout: float = SNAPD_REQUEST_TIMEOUT,
+    ) -> None:
+        self.socket_path = socket_path or SNAPD_SOCKET
+        self.timeout = timeout
+
+    def request(
+        self, method: str, path: str, body: "Optional[Dict[str, Any]]" = None
+    ) -> "Dict[str, Any]":
+        """Perform a snapd API request and return its decoded response.
+
+        :raise SnapdError: when snapd is unreachable, responds with invalid
+            JSON or with an error response.
+        """
+        headers = {"Accept": "application/json"}
+        data = None
+        if body is not None:
+            data = json.dumps(body).encode("utf-8")
+            headers["Content-Type"] = "application/json"
+        conn = _UnixHTTPConnection(self.socket_path, self.timeout)
+        try:
+            conn.request(method, path, body=data, headers=headers)
+            content = conn.getresponse().read()
+        except (OSError, http.client.HTTPException) as e:
+            raise SnapdError(
+                "Unable to reach snapd at {}: {}".format(self.socket_path, e)
+            )
+        finally:
+            conn.close()
+        try:
+            response = json.loads(content.decode("utf-8"))
+        except ValueError:
+            raise SnapdError(
+                "Invalid response from snapd for {} {}".format(method, path)
+            )
+        if response.get("type") == "error":
+            result = response.get("result") or {}
+            raise SnapdError(
+                "snapd error: {}".format(
+                    result.get("message", response.get("status", "unknown"))
+                ),
+                kind=result.get("kind"),
+                status_code=response.get("status-code"),
+            )
+        return response
+
+    def is_seeded(self) -> bool:
+        """Return True once snapd has loaded the system seed."""
+        path = "/v2/snaps/system/conf?" + urllib.parse.urlencode(
+            {"keys": "seed.loaded"}
+        )
+        try:
+            response = self.request("GET", path)
+        except SnapdError as e:
+            # seed.loaded is not set until seeding completes. Older snapd
+            # reports the missing option as a 400 error without a kind.
+            if e.kind == "option-not-found":
+                return False
+            if e.kind is None and e.status_code == 400:
+                return False
+            raise
+        return bool((response.get("result") or {}).get("seed.loaded"))
+
+    def wait_for_seed(self, timeout: float = SNAPD_WAIT_TIMEOUT) -> None:
+        """Block until snapd has loaded the system seed.
+
+        :raise SnapdError: on snapd errors or when timeout expires first.
+        """
+        if self.is_seeded():
+            return
+        for sleep in _poll_sleeps(timeout):
+            time.sleep(sleep)
+            if self.is_seeded():
+                return
+        raise SnapdError(
+            "Timed out after {} seconds waiting for snapd to load its"
+            " seed".format(int(timeout))
+        )
+
+    def install(self, name: str) -> "Optional[str]":
+        """Start installing the snap name.
+
+        :return: The id of the asynchronous install change, or None when
+            the snap is already installed.
+        :raise SnapdError: when snapd refuses the install.
+        """
+        try:
+            response = self.request(
+                "POST",
+                "/v2/snaps/{}".format(urllib.parse.quote(name)),
+                {"action": "install"},
+            )
+        except SnapdError as e:
+            if e.kind == "snap-already-installed":
+                return None
+            raise
+        return response.get("change")
+
+    def wait_for_change(
+        self,
+        change_id: str,
+        timeout: float = SNAPD_WAIT_TIMEOUT,
+        on_progress: "Optional[Callable[[str], None]]" = None,
+    ) -> "Dict[str, Any]":
+        """Poll the change change_id with backoff until it is ready.
+
+        Task progress reported by snapd is logged as it advances and, when
+        on_progress is set, passed to it.
+
+        :return: The final change dict.
+        :raise SnapdError: when the change fails or timeout expires first.
+        """
+        path = "/v2/changes/{}".format(urllib.parse.quote(change_id))
+        sleeps = _poll_sleeps(timeout)
+        last_progress = None
+        while True:
+            change = self.request("GET", path).get("result") or {}
+            progress = _describe_progress(change)
+            if progress and progress != last_progress:
+                logging.debug("snapd change %s: %s", change_id, progress)
+                if on_progress:
+                    on_progress(progress)
+                last_progress = progress
+            if change.get("ready"):
+                break
+            sleep = next(sleeps, None)
+            if sleep is None:
+                raise SnapdError(
+                    "Timed out after {} seconds waiting for snapd to"
+                    " {}".format(int(timeout), _summary(change).lower())
+                )
+            time.sleep(sleep)
+        if change.get("err") or change.get("status") in (
+            CHANGE_FAILED_STATUSES
+        ):
+            raise SnapdError(
+                "{} failed: {}".format(
+                    _summary(change), change.get("err", change.get("status"))
+                )
+            )
+        return change
+
+
+def _summary(change: "Dict[str, Any]") -> str:
+    return change.get("summary") or "Change {}".format(change.get("id", ""))
+
+
+def _describe_progress(change: "Dict[str, Any]") -> str:
+    """Return a description of the task snapd is currently working on."""
+    for task in change.get("tasks", []):
+        if task.get("status") != "Doing":
+            continue
+        description = task.get("summary", "")
+        progress = task.get("progress") or {}
+        total = progress.get("total")
+        if total and total > 1:
+            description += " ({}/{})".format(progress.get("done", 0), total)
+        return description
+    return change.get("status", "")
@@ -63,6 +63,7 @@ class UserFacingAvailability(enum.Enum):
 
     AVAILABLE = "yes"
     UNAVAILABLE = "no"
+    UNKNOWN = "unknown"  # Local-only status without cached availability
 
 
 @enum.unique
@@ -220,6 +221,8 @@ Attach requires a token: sudo ua attach <TOKEN>
 To obtain a token please visit: https://ubuntu.com/advantage"""
 MESSAGE_ATTACH_FAILURE = """\
 Failed to attach machine. See https://ubuntu.com/advantage"""
+MESSAGE_INVALID_CONTRACT_BUNDLE_TMPL = """\
+Invalid contract bundle {path}: {reason}"""
 MESSAGE_ATTACH_FAILURE_DEFAULT_SERVICES = """\
 Failed to enable default services, check: sudo ua status"""
 MESSAGE_ATTACH_SUCCESS_TMPL = """\
@@ -246,7 +249,6 @@ A reboot is required to complete {operation}"""
 MESSAGE_ENABLE_BY_DEFAULT_MANUAL_TMPL = """\
 Service {name} is recommended by default. Run: sudo ua enable {name}"""
 MESSAGE_DETACH_SUCCESS = "This machine is now detached"
-MESSAGE_DETACH_AUTOMATION_FAILURE = "Unable to automatically detach machine"
 
 MESSAGE_REFRESH_ENABLE = "One moment, checking your subscription first"
 MESSAGE_REFRESH_SUCCESS = "Successfully refreshed your subscription"
@@ -0,0 +1,629 @@
+"""
+Benchmark the status, attach, enable, refresh and detach code paths.
+
+Each scenario runs against a throw-away sandbox containing fake apt-cache,
+apt-get, dpkg, snap and canonical-livepatch executables (plus the few other
+helpers ua calls), a snapd stand-in serving installs on a Unix socket and a
+FakeContractClient. The fake executables, snap installs and the fake
+contract client sleep for a configurable latency, so a run reports the wall
+time of each code path alongside the number of subprocesses and contract
+HTTP calls it made.
+
+Usage:
+
+    python3 -m uaclient.testing.benchmark
+    python3 -m uaclient.testing.benchmark --latency 0.05 \\
+        --command-latency "apt-get update=0.5" --save baseline.json
+    python3 -m uaclient.testing.benchmark --compare baseline.json
+
+When --compare is given, the exit code is non-zero if any scenario got slower
+than the baseline by more than --tolerance, or made more subprocess or HTTP
+calls than the baseline did.
+"""
+
+import argparse
+import collections
+import contextlib
+import io
+import json
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+import mock
+
+from uaclient import apt, cli, config, contract, snapd, util, version
+from uaclient.entitlements import ENTITLEMENT_CLASSES
+from uaclient.entitlements.repo import RepoEntitlement
+from uaclient.testing import fakes
+from uaclient.testing.snapd_server import SnapdServer, SnapdServerState
+
+try:
+    from typing import Any, Callable, Dict, List, Optional  # noqa: F401
+except ImportError:
+    # typing isn't available on trusty, so ignore its absence
+    pass
+
+
+DEFAULT_LATENCY = 0.01
+DEFAULT_HTTP_LATENCY = 0.05
+DEFAULT_ROUNDS = 3
+DEFAULT_TOLERANCE = 0.25
+
+ENABLE_SERVICES = ["cc-eal", "esm-apps", "esm-infra", "livepatch"]
+ENABLE_BY_DEFAULT = ["esm-infra", "livepatch"]
+
+FAKE_OS_RELEASE = {
+    "NAME": "Ubuntu",
+    "VERSION": "16.04.6 LTS (Xenial Xerus)",
+    "VERSION_ID": "16.04",
+    "VERSION_CODENAME": "xenial",
+}
+
+# Shell snippet shared by every fake executable. The subp shim exports the
+# latency for the command being run as BENCH_SLEEP.
+FAKE_PRELUDE = """\
+#!/bin/sh
+sleep "${BENCH_SLEEP:-0}"
+"""
+
+FAKE_EXECUTABLES = {
+    "apt-cache": """\
+[ "$1" = "policy" ] || exit 0
+echo "Package files:"
+echo " 100 /var/lib/dpkg/status"
+echo " 500 http://archive.ubuntu.com/ubuntu xenial-updates/main amd64 Packages"
+echo "     release v=16.04,o=Ubuntu,a=xenial-updates,n=xenial,l=Ubuntu,c=main"
+for list in "$BENCH_ROOT"/etc/apt/sources.list.d/*.list; do
+    [ -f "$list" ] || continue
+    sed -n 's|^deb \\([^ ]*\\)/ubuntu \\([^ ]*\\) .*| 500 \\1/ubuntu \\2/main amd64 Packages|p' "$list"
+done
+""",  # noqa: E501
+    "apt-config": """\
+case "$3" in
+    Dir::Etc::netrc/) echo "key='$BENCH_ROOT/etc/apt/auth.conf'";;
+    Dir::State::lists/) echo "key='$BENCH_ROOT/var/lib/apt/lists/'";;
+esac
+""",
+    "apt-get": """\
+if [ "$1" = "install" ]; then
+    for arg in "$@"; do
+        case "$arg" in
+            -*|install) ;;
+            *) echo "$arg" >> "$BENCH_ROOT/dpkg-installed";;
+        esac
+    done
+fi
+""",
+    "apt-helper": "",
+    "canonical-livepatch": """\
+case "$1" in
+    status)
+        [ -f "$BENCH_ROOT/livepatch-enabled" ] && exit 0
+        echo "Machine is not enabled" >&2
+        exit 1;;
+    enable) touch "$BENCH_ROOT/livepatch-enabled";;
+    disable) rm -f "$BENCH_ROOT/livepatch-enabled";;
+esac
+""",
+    "dpkg": 'echo "amd64"\n',
+    "dpkg-query": 'cat "$BENCH_ROOT/dpkg-installed"\n',
+    "ps": "",
+    "snap": "",
+    "systemd-detect-virt": "exit 1\n",
+}  # type: Dict[str, str]
+
+# Fakes which are only present in bin once the snap has been installed
+SNAP_EXECUTABLES = ("canonical-livepatch",)
+
+
+class BenchmarkError(RuntimeError):
+    pass
+
+
+class Sandbox:
+    """A throw-away root containing fake executables, apt dirs and data_dir.
+
+    :param latency: Default number of seconds each fake executable sleeps.
+    :param http_latency: Number of seconds each contract request sleeps.
+    :param command_latency: Dict of per-command latency overrides keyed by
+        the command name, optionally followed by its first argument, for
+        example {"apt-get update": 0.5, "snap": 1.0}.
+    """
+
+    def __init__(
+        self,
+        latency: float = DEFAULT_LATENCY,
+        http_latency: float = DEFAULT_HTTP_LATENCY,
+        command_latency: "Optional[Dict[str, float]]" = None,
+    ) -> None:
+        self.latency = latency
+        self.http_latency = http_latency
+        self.command_latency = command_latency or {}
+        self.root = tempfile.mkdtemp(prefix="ua-benchmark-")
+        self.bin_dir = os.path.join(self.root, "bin")
+        self.data_dir = os.path.join(self.root, "var/lib/ubuntu-advantage")
+        self.subprocess_calls = collections.Counter()  # type: Dict[str, int]
+        self.http_calls = collections.Counter()  # type: Dict[str, int]
+        self.responses = {}  # type: Dict[str, Any]
+        self._patchers = []  # type: List[Any]
+        self._snapd = None  # type: Optional[SnapdServer]
+        self._build_tree()
+
+    def path(self, *parts: str) -> str:
+        return os.path.join(self.root, *parts)
+
+    def _latency_for(self, name: str, first_arg: str = "") -> float:
+        for key in ("{} {}".format(name, first_arg), name):
+            if key in self.command_latency:
+                return self.command_latency[key]
+        return self.latency
+
+    def _build_tree(self) -> None:
+        for dirname in (
+            "bin",
+            "libexec",
+            "etc/apt/sources.list.d",
+            "etc/apt/preferences.d",
+            "etc/apt/trusted.gpg.d",
+            "usr/share/keyrings",
+            "var/lib/apt/lists",
+            "var/lib/ubuntu-advantage",
+        ):
+            os.makedirs(self.path(dirname))
+        for name, body in FAKE_EXECUTABLES.items():
+            dest_dir = "libexec" if name in SNAP_EXECUTABLES else "bin"
+            script = self.path(dest_dir, name)
+            util.write_file(script, FAKE_PRELUDE + body, mode=0o755)
+        for ent_cls in ENTITLEMENT_CLASSES:
+            key_file = getattr(ent_cls, "repo_key_file", None)
+            if isinstance(key_file, str):
+                util.write_file(self.path("usr/share/keyrings", key_file), "")
+        util.write_file(self.path("dpkg-installed"), "snapd\n")
+        # Present so that no apt prerequisites are installed during enable
+        util.write_file(self.path("apt-transport-https"), "")
+        util.write_file(self.path("update-ca-certificates"), "")
+
+    def _subp(self, orig_subp: "Callable") -> "Callable":
+        def fake_subp(args, rcs=None, capture=False, timeout=None, env=None):
+            name = os.path.basename(args[0])
+            first_arg = args[1] if len(args) > 1 else ""
+            if name in ("apt-get", "apt-cache", "snap", "canonical-livepatch"):
+                self.subprocess_calls["{} {}".format(name, first_arg)] += 1
+            else:
+                self.subprocess_calls[name] += 1
+            fake = os.path.join(self.bin_dir, name)
+            if not util.is_exe(fake):
+                raise util.ProcessExecutionError(cmd=" ".join(args))
+            env = dict(env or {})
+            env["BENCH_SLEEP"] = str(self._latency_for(name, first_arg))
+            return orig_subp(
+                [fake] + list(args[1:]), rcs, capture, timeout, env=env
+            )
+
+        return fake_subp
+
+    def _install_snap(self, name: str) -> None:
+        """Put the fake executables of snap name in bin, like snapd would."""
+        self.http_calls["snapd install"] += 1
+        time.sleep(self._latency_for("snap", "install"))
+        shutil.copy(self.path("libexec", name), self.bin_dir)
+
+    def _which(self, program: str) -> "Optional[str]":
+        fake = os.path.join(self.bin_dir, os.path.basename(program))
+        return fake if util.is_exe(fake) else None
+
+    def _contract_client_cls(self) -> "Any":
+        sandbox = self
+
+        class BenchmarkContractClient(fakes.FakeContractClient):
+            def __init__(self, cfg=None):
+                super().__init__(cfg)
+                self._requests = []
+
+            def request_url(self, path, data=None, headers=None, method=None):
+                if path.startswith(contract.API_V1_RESOURCES):
+                    route = contract.API_V1_RESOURCES
+                elif path.startswith("/v1/contracts/"):
+                    route = "{} {}".format(
+                        method or "GET",
+                        contract.API_V1_TMPL_CONTEXT_MACHINE_TOKEN_RESOURCE,
+                    )
+                else:
+                    route = path
+                sandbox.http_calls[route] += 1
+                time.sleep(sandbox.http_latency)
+                response = sandbox.responses.get(route)
+                if isinstance(response, Exception):
+                    raise response
+                return copy_json(response), {}
+
+        return BenchmarkContractClient
+
+    def cfg(self) -> config.UAConfig:
+        """Return a new UAConfig using this sandbox's data_dir."""
+        return config.UAConfig({"data_dir": self.data_dir})
+
+    def start(self) -> None:
+        repo_dir = self.path("etc/apt/sources.list.d")
+        pref_dir = self.path("etc/apt/preferences.d")
+        self._snapd = SnapdServer(
+            SnapdServerState(on_install=self._install_snap),
+            socket_path=self.path("snapd.socket"),
+        )
+        self._snapd.start()
+        patches = [
+            mock.patch("os.getuid", return_value=0),
+            mock.patch.dict(
+                os.environ,
+                {
+                    "BENCH_ROOT": self.root,
+                    "UA_DATA_DIR": self.data_dir,
+                    "UA_CONFIG_FILE": self.path("uaclient.conf"),
+                },
+            ),
+            mock.patch.object(util, "_subp", self._subp(util._subp)),
+            mock.patch.object(util, "which", self._which),
+            mock.patch.object(
+                util, "parse_os_release", return_value=FAKE_OS_RELEASE
+            ),
+            mock.patch.object(
+                version, "get_version", return_value="benchmark"
+            ),
+            mock.patch.object(
+                util, "REBOOT_FILE_CHECK_PATH", self.path("reboot-required")
+            ),
+            mock.patch.object(
+                util, "ETC_MACHINE_ID", self.path("etc/machine-id")
+            ),
+            mock.patch.object(
+                util, "DBUS_MACHINE_ID", self.path("etc/machine-id")
+            ),
+            mock.patch.object(
+                apt, "APT_KEYS_DIR", self.path("etc/apt/trusted.gpg.d")
+            ),
+            mock.patch.object(
+                apt, "KEYRINGS_DIR", self.path("usr/share/keyrings")
+            ),
+            mock.patch.object(
+                apt, "APT_METHOD_HTTPS_FILE", self.path("apt-transport-https")
+            ),
+            mock.patch.object(
+                apt,
+                "CA_CERTIFICATES_FILE",
+                self.path("update-ca-certificates"),
+            ),
+            mock.patch.object(
+                RepoEntitlement,
+                "repo_list_file_tmpl",
+                os.path.join(repo_dir, "ubuntu-{name}.list"),
+            ),
+            mock.patch.object(
+                RepoEntitlement,
+                "repo_pref_file_tmpl",
+                os.path.join(pref_dir, "ubuntu-{name}"),
+            ),
+            mock.patch.object(
+                contract, "UAContractClient", self._contract_client_cls()
+            ),
+            mock.patch.object(
+                snapd, "SNAPD_SOCKET", self.path("snapd.socket")
+            ),
+        ]
+        util.write_file(self.path("etc/machine-id"), "benchmark-machine-id")
+        util.write_file(self.path("uaclient.conf"), "{}")
+        for patcher in patches:
+            patcher.start()
+            self._patchers.append(patcher)
+
+    def stop(self) -> None:
+        for patcher in reversed(self._patchers):
+            patcher.stop()
+        self._patchers = []
+        if self._snapd:
+            self._snapd.stop()
+            self._snapd = None
+        shutil.rmtree(self.root, ignore_errors=True)
+
+    def reset_counters(self) -> None:
+        self.subprocess_calls.clear()
+        self.http_calls.clear()
+
+
+def copy_json(value: "Any") -> "Any":
+    """Return a deep copy of a JSON-serialisable value, as a server would."""
+    if value is None:
+        return None
+    return json.loads(json.dumps(value))
+
+
+def _attach(sandbox: Sandbox, services: "List[str]") -> config.UAConfig:
+    """Attach the sandbox and enable services, outside of any measurement."""
+    token = fakes.fake_machine_token()
+    sandbox.responses[contract.API_V1_CONTEXT_MACHINE_TOKEN] = token
+    _set_refresh_response(sandbox, token)
+    cfg = sandbox.cfg()
+    contract.request_updated_contract(cfg, "contract-token")
+    for name in services:
+        _enable(cfg, [name])
+    return cfg
+
+
+def _enable(cfg: config.UAConfig, names: "List[str]") -> None:
+    args = argparse.Namespace(service=names, assume_yes=True, beta=True)
+    if cli.action_enable(args, cfg) != 0:
+        raise BenchmarkError("Failed to enable {}".format(", ".join(names)))
+
+
+def _set_refresh_response(sandbox: Sandbox, token: "Dict[str, Any]") -> None:
+    for method in ("POST", "DELETE"):
+        route = "{} {}".format(
+            method, contract.API_V1_TMPL_CONTEXT_MACHINE_TOKEN_RESOURCE
+        )
+        sandbox.responses[route] = token
+
+
+def setup_status(sandbox: Sandbox) -> "Callable[[], Any]":
+    _attach(sandbox, ENABLE_SERVICES)
+    return lambda: sandbox.cfg().status()
+
+
+def setup_attach(sandbox: Sandbox) -> "Callable[[], Any]":
+    token = fakes.fake_machine_token(enable_by_default=ENABLE_BY_DEFAULT)
+    sandbox.responses[contract.API_V1_CONTEXT_MACHINE_TOKEN] = token
+
+    def run():
+        ret = cli._attach_with_token(
+            sandbox.cfg(), token="contract-token", allow_enable=True
+        )
+        if ret != 0:
+            raise BenchmarkError("Attach failed")
+
+    return run
+
+
+def setup_enable(sandbox: Sandbox) -> "Callable[[], Any]":
+    _attach(sandbox, [])
+    return lambda: _enable(sandbox.cfg(), ENABLE_SERVICES)
+
+
+def setup_refresh(sandbox: Sandbox) -> "Callable[[], Any]":
+    cfg = _attach(sandbox, ENABLE_SERVICES)
+    # Move every enabled repo service to a new aptURL to exercise deltas
+    new_token = copy_json(cfg.machine_token)
+    contract_info = new_token["machineTokenInfo"]["contractInfo"]
+    for entitlement in contract_info["resourceEntitlements"]:
+        apt_url = entitlement.get("directives", {}).get("aptURL")
+        if apt_url:
+            entitlement["directives"]["aptURL"] = apt_url + "-moved"
+    _set_refresh_response(sandbox, new_token)
+
+    def run():
+        cfg = sandbox.cfg()
+        contract.forget_contract_refresh(cfg)  # Measure a real refresh
+        contract.request_updated_contract(cfg)
+
+    return run
+
+
+def setup_detach(sandbox: Sandbox) -> "Callable[[], Any]":
+    _attach(sandbox, ENABLE_SERVICES)
+
+    def run():
+        if cli._detach(sandbox.cfg(), assume_yes=True) != 0:
+            raise BenchmarkError("Detach failed")
+
+    return run
+
+
+SCENARIOS = collections.OrderedDict(
+    [
+        ("status", setup_status),
+        ("attach", setup_attach),
+        ("enable", setup_enable),
+        ("refresh", setup_refresh),
+        ("detach", setup_detach),
+    ]
+)  # type: Dict[str, Callable[[Sandbox], Callable[[], Any]]]
+
+
+def run_scenario(
+    name: str, rounds: int = DEFAULT_ROUNDS, **sandbox_kwargs: "Any"
+) -> "Dict[str, Any]":
+    """Run the named scenario rounds times, each in a fresh sandbox.
+
+    :return: Dict with wall-time statistics and the subprocess and HTTP call
+        counts of the last round.
+    """
+    timings = []  # type: List[float]
+    subprocess_calls = {}  # type: Dict[str, int]
+    http_calls = {}  # type: Dict[str, int]
+    for _ in range(rounds):
+        sandbox = Sandbox(**sandbox_kwargs)
+        sandbox.start()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                func = SCENARIOS[name](sandbox)
+                sandbox.reset_counters()
+                start = time.monotonic()
+                func()
+                timings.append(time.monotonic() - start)
+        finally:
+            subprocess_calls = dict(sandbox.subprocess_calls)
+            http_calls = dict(sandbox.http_calls)
+            sandbox.stop()
+    return {
+        "name": name,
+        "rounds": rounds,
+        "wall_median": statistics.median(timings),
+        "wall_min": min(timings),
+        "subprocesses": sum(subprocess_calls.values()),
+        "subprocess_calls": subprocess_calls,
+        "http": sum(http_calls.values()),
+        "http_calls": http_calls,
+    }
+
+
+def compare_results(
+    results: "List[Dict[str, Any]]",
+    baseline: "List[Dict[str, Any]]",
+    tolerance: float = DEFAULT_TOLERANCE,
+) -> "List[str]":
+    """Return a list of regressions of results against a saved baseline."""
+    baseline_by_name = dict((result["name"], result) for result in baseline)
+    regressions = []
+    for result in results:
+        base = baseline_by_name.get(result["name"])
+        if not base:
+            continue
+        old = base["wall_median"]
+        new = result["wall_median"]
+        if new > old * (1 + tolerance):
+            regressions.append(
+                "{name}: wall time {new:.3f}s > {old:.3f}s"
+                " (+{pct:.0%})".format(
+                    name=result["name"],
+                    new=new,
+                    old=old,
+                    pct=(new - old) / old if old else float("inf"),
+                )
+            )
+        for key, label in (("subprocesses", "subprocess"), ("http", "http")):
+            if result[key] > base[key]:
+                regressions.append(
+                    "{name}: {label} calls {new} > {old}".format(
+                        name=result["name"],
+                        label=label,
+                        new=result[key],
+                        old=base[key],
+                    )
+                )
+    return regressions
+
+
+def format_results(results: "List[Dict[str, Any]]") -> str:
+    tmpl = "{name: <10}{median: >10}{minimum: >10}{subp: >8}{http: >6}"
+    content = [
+        tmpl.format(
+            name="SCENARIO",
+            median="MEDIAN",
+            minimum="MIN",
+            subp="SUBP",
+            http="HTTP",
+        )
+    ]
+    for result in results:
+        content.append(
+            tmpl.format(
+                name=result["name"],
+                median="{:.3f}s".format(result["wall_median"]),
+                minimum="{:.3f}s".format(result["wall_min"]),
+                subp=result["subprocesses"],
+                http=result["http"],
+            )
+        )
+    for result in results:
+        content.append("\n{}:".format(result["name"]))
+        for cmd, count in sorted(result["subprocess_calls"].items()):
+            content.append("    {: <64}{: >4}".format(cmd, count))
+        for route, count in sorted(result["http_calls"].items()):
+            content.append("    {: <64}{: >4}".format(route, count))
+    return "\n".join(content)
+
+
+def _parse_command_latency(values: "List[str]") -> "Dict[str, float]":
+    command_latency = {}
+    for value in values:
+        try:
+            command, seconds = value.rsplit("=", 1)
+            command_latency[command.strip()] = float(seconds)
+        except ValueError:
+            raise argparse.ArgumentTypeError(
+                "Invalid --command-latency '{}'. Expected"
+                " 'COMMAND [ARG]=SECONDS'".format(value)
+            )
+    return command_latency
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python3 -m uaclient.testing.benchmark",
+        description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument(
+        "scenarios",
+        nargs="*",
+        help="scenarios to run, any of: {} (default: all)".format(
+            ", ".join(SCENARIOS)
+        ),
+    )
+    parser.add_argument("--rounds", type=int, default=DEFAULT_ROUNDS)
+    parser.add_argument(
+        "--latency",
+        type=float,
+        default=DEFAULT_LATENCY,
+        help="seconds each fake executable sleeps",
+    )
+    parser.add_argument(
+        "--http-latency",
+        type=float,
+        default=DEFAULT_HTTP_LATENCY,
+        help="seconds each contract server request sleeps",
+    )
+    parser.add_argument(
+        "--command-latency",
+        action="append",
+        default=[],
+        metavar="'COMMAND [ARG]=SECONDS'",
+        help="latency override for one fake command, e.g. 'apt-get update=1'",
+    )
+    parser.add_argument("--format", choices=["tabular", "json"])
+    parser.add_argument("--save", help="write results as JSON to this file")
+    parser.add_argument(
+        "--compare", help="baseline JSON file to check for regressions"
+    )
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=DEFAULT_TOLERANCE,
+        help="allowed relative wall time increase against --compare",
+    )
+    return parser
+
+
+def main(sys_argv: "Optional[List[str]]" = None) -> int:
+    parser = get_parser()
+    args = parser.parse_args(sys_argv)
+    unknown = sorted(set(args.scenarios) - set(SCENARIOS))
+    if unknown:
+        parser.error("unknown scenario(s): {}".format(", ".join(unknown)))
+    sandbox_kwargs = {
+        "latency": args.latency,
+        "http_latency": args.http_latency,
+        "command_latency": _parse_command_latency(args.command_latency),
+    }
+    results = [
+        run_scenario(name, rounds=args.rounds, **sandbox_kwargs)
+        for name in (args.scenarios or SCENARIOS)
+    ]
+    if args.format == "json":
+        print(json.dumps(results, indent=2, sort_keys=True))
+    else:
+        print(format_results(results))
+    if args.save:
+        util.write_file(args.save, json.dumps(results, indent=2))
+    if args.compare:
+        baseline = json.loads(util.load_file(args.compare))
+        regressions = compare_results(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions:\n" + "\n".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,571 @@
+"""
+A local stand-in for the contract service, for offline and load testing.
+
+The server answers the machine-token attach, resources, auto-attach cloud
+token, machine-token refresh and detach endpoints with data generated by
+uaclient.testing.fakes. Knobs allow injecting latency, server errors, rate
+limiting and inflated payloads.
+
+Usage:
+
+    python3 -m uaclient.testing.contract_server serve --port 8484 \\
+        --latency 0.2 --error-rate 0.05 --rate-limit 50
+    python3 -m uaclient.testing.contract_server load --clients 20 \\
+        --requests 10 --scenario refresh
+
+Point a client at a running server with contract_url in uaclient.conf or the
+UA_CONTRACT_URL environment variable. The load subcommand starts its own
+server unless --url is given.
+"""
+
+import argparse
+import collections
+import json
+import random
+import re
+import shutil
+import socketserver
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+from http import server
+
+from uaclient import config, contract, util
+from uaclient.testing import fakes
+
+try:
+    from typing import Any, Dict, List, Optional, Tuple  # noqa: F401
+except ImportError:
+    # typing isn't available on trusty, so ignore its absence
+    pass
+
+
+DEFAULT_RETRY_AFTER = 1
+DEFAULT_ERROR_CODE = 503
+
+ROUTE_ATTACH = "attach"
+ROUTE_AUTO_ATTACH = "auto-attach"
+ROUTE_DETACH = "detach"
+ROUTE_REFRESH = "refresh"
+ROUTE_RESOURCES = "resources"
+
+RE_AUTO_ATTACH = re.compile(
+    "^"
+    + re.escape(contract.API_V1_AUTO_ATTACH_CLOUD_TOKEN).replace(
+        re.escape("{cloud_type}"), "(?P<cloud_type>[^/]+)"
+    )
+    + "$"
+)
+RE_MACHINE_TOKEN_RESOURCE = re.compile(
+    "^"
+    + re.escape(contract.API_V1_TMPL_CONTEXT_MACHINE_TOKEN_RESOURCE)
+    .replace(re.escape("{contract}"), "(?P<contract>[^/]+)")
+    .replace(re.escape("{machine}"), "(?P<machine>[^/]+)")
+    + "$"
+)
+
+
+class ContractServerState:
+    """Generated contract data, fault injection knobs and request counters.
+
+    :param latency: Seconds to sleep before answering each request.
+    :param error_rate: Fraction of requests, between 0 and 1, answered with
+        error_code instead of a response.
+    :param error_code: HTTP status code of injected errors.
+    :param rate_limit: Maximum number of requests served per second. Further
+        requests within the same second get a 429 with a Retry-After header.
+    :param retry_after: Seconds advertised in the Retry-After header.
+    :param payload_size: Minimum size in bytes of machine-token responses.
+        Responses are inflated with padding entitlements unknown to the
+        client.
+    :param services: Service names entitled by generated contracts.
+        Defaults to all services known to fakes.SERVICE_DIRECTIVES.
+    :param enable_by_default: Service names carrying enableByDefault.
+    :param valid_tokens: When set, only these contract tokens may attach.
+    :param seed: Seed for the error injection random number generator.
+    """
+
+    def __init__(
+        self,
+        *,
+        latency: float = 0,
+        error_rate: float = 0,
+        error_code: int = DEFAULT_ERROR_CODE,
+        rate_limit: "Optional[int]" = None,
+        retry_after: int = DEFAULT_RETRY_AFTER,
+        payload_size: int = 0,
+        services: "Optional[List[str]]" = None,
+        enable_by_default: "Optional[List[str]]" = None,
+        valid_tokens: "Optional[List[str]]" = None,
+        seed: "Optional[int]" = None
+    ) -> None:
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_code = error_code
+        self.rate_limit = rate_limit
+        self.retry_after = retry_after
+        self.payload_size = payload_size
+        self.services = services
+        self.enable_by_default = enable_by_default
+        self.valid_tokens = valid_tokens
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._window_start = 0.0
+        self._window_count = 0
+        self.machines = {}  # type: Dict[str, Dict[str, Any]]
+        self.requests = collections.Counter()  # type: collections.Counter
+        self.responses = collections.Counter()  # type: collections.Counter
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.requests.clear()
+            self.responses.clear()
+
+    def check_faults(self) -> "Optional[Tuple[int, Dict[str, str]]]":
+        """Return an (error code, headers) tuple for a faulted request.
+
+        Return None when the request should be served normally.
+        """
+        with self._lock:
+            if self.rate_limit:
+                now = time.monotonic()
+                if now - self._window_start >= 1:
+                    self._window_start = now
+                    self._window_count = 0
+                self._window_count += 1
+                if self._window_count > self.rate_limit:
+                    return 429, {"Retry-After": str(self.retry_after)}
+            if self.error_rate and self._random.random() < self.error_rate:
+                return self.error_code, {}
+        return None
+
+    def new_machine_token(
+        self, machine_id: str, contract_id: str
+    ) -> "Dict[str, Any]":
+        """Generate and record a machine token for machine_id."""
+        with self._lock:
+            serial = len(self.machines) + 1
+        token = fakes.fake_machine_token(
+            self.services,
+            enable_by_default=self.enable_by_default,
+            contract_id=contract_id,
+            machine_token="machine-token-{}-{}".format(machine_id, serial),
+        )
+        token["machineTokenInfo"]["machineId"] = machine_id
+        self._pad(token)
+        with self._lock:
+            self.machines[machine_id] = token
+        return token
+
+    def _pad(self, token: "Dict[str, Any]") -> None:
+        """Inflate token with padding entitlements up to payload_size."""
+        size = len(json.dumps(token))
+        entitlements = token["machineTokenInfo"]["contractInfo"][
+            "resourceEntitlements"
+        ]
+        while size < self.payload_size:
+            padding = {
+                "type": "padding-{}".format(len(entitlements)),
+                "entitled": False,
+                "directives": {"padding": "x" * min(4096, self.payload_size)},
+            }
+            entitlements.append(padding)
+            size += len(json.dumps(padding)) + 2
+
+
+class ContractRequestHandler(server.BaseHTTPRequestHandler):
+    """Route contract API requests to handlers using the server's state."""
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self) -> ContractServerState:
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass  # Keep load test output readable
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def do_DELETE(self):
+        self._dispatch("DELETE")
+
+    def _dispatch(self, method: str) -> None:
+        parsed = urllib.parse.urlsplit(self.path)
+        path = "/" + parsed.path.lstrip("/")
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            data = json.loads(body.decode("utf-8")) if body else {}
+        except ValueError:
+            return self._send_error(400, "bad-request", "Invalid JSON body")
+        route, handler, match = self._route(method, path)
+        if not handler:
+            return self._send_error(404, "not-found", "No such endpoint")
+        with self.state._lock:
+            self.state.requests[route] += 1
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        fault = self.state.check_faults()
+        if fault:
+            code, headers = fault
+            return self._send_error(
+                code, "injected-fault", "Fault injected", headers
+            )
+        handler(match, data)
+
+    def _route(self, method, path):
+        if method == "POST" and path == contract.API_V1_CONTEXT_MACHINE_TOKEN:
+            return ROUTE_ATTACH, self._attach, None
+        if method == "GET" and path == contract.API_V1_RESOURCES:
+            return ROUTE_RESOURCES, self._resources, None
+        match = RE_AUTO_ATTACH.match(path)
+        if method == "POST" and match:
+            return ROUTE_AUTO_ATTACH, self._auto_attach, match
+        match = RE_MACHINE_TOKEN_RESOURCE.match(path)
+        if method == "POST" and match:
+            return ROUTE_REFRESH, self._refresh, match
+        if method == "DELETE" and match:
+            return ROUTE_DETACH, self._detach, match
+        return None, None, None
+
+    def _bearer(self) -> str:
+        auth = self.headers.get("Authorization", "")
+        if auth.startswith("Bearer "):
+            return auth[len("Bearer ") :]
+        return ""
+
+    def _attach(self, match, data):
+        contract_token = self._bearer()
+        if not contract_token or (
+            self.state.valid_tokens is not None
+            and contract_token not in self.state.valid_tokens
+        ):
+            return self._send_error(401, "invalid-token", "Invalid token")
+        machine_id = data.get("machineId")
+        if not machine_id:
+            return self._send_error(400, "bad-request", "Missing machineId")
+        self._send_json(200, self.state.new_machine_token(machine_id, "cid"))
+
+    def _refresh(self, match, data):
+        machine_id = match.group("machine")
+        token = self.state.machines.get(machine_id)
+        if not token or self._bearer() != token["machineToken"]:
+            return self._send_error(401, "invalid-token", "Invalid token")
+        contract_id = match.group("contract")
+        if contract_id != token["machineTokenInfo"]["contractInfo"]["id"]:
+            return self._send_error(404, "not-found", "No such contract")
+        self._send_json(
+            200, token, {"Expires": "Fri, 31 Dec 2999 00:00:00 GMT"}
+        )
+
+    def _detach(self, match, data):
+        machine_id = match.group("machine")
+        token = self.state.machines.get(machine_id)
+        if not token or self._bearer() != token["machineToken"]:
+            return self._send_error(401, "invalid-token", "Invalid token")
+        with self.state._lock:
+            self.state.machines.pop(machine_id, None)
+        self._send_json(200, {})
+
+    def _resources(self, match, data):
+        self._send_json(
+            200, {"resources": fakes.fake_available_resources(None)}
+        )
+
+    def _auto_attach(self, match, data):
+        if not data:
+            return self._send_error(
+                400, "bad-request", "Missing identity document"
+            )
+        self._send_json(
+            200,
+            {
+                "contractToken": "contract-token-{}".format(
+                    match.group("cloud_type")
+                )
+            },
+        )
+
+    def _send_error(self, code, title, detail, headers=None):
+        error = {"error_list": [{"title": title, "detail": detail}]}
+        self._send_json(code, error, headers)
+
+    def _send_json(self, code, content, headers=None):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+        with self.state._lock:
+            self.state.responses[code] += 1
+
+
+class ContractServer(socketserver.ThreadingMixIn, server.HTTPServer):
+    """Threaded HTTP contract server bound to localhost.
+
+    Use as a context manager to serve from a background thread:
+
+        with ContractServer(ContractServerState(latency=0.1)) as srv:
+            cfg = UAConfig({"contract_url": srv.url, ...})
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        state: "Optional[ContractServerState]" = None,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ) -> None:
+        super().__init__((host, port), ContractRequestHandler)
+        self.state = state or ContractServerState()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return "http://{}:{}".format(host, port)
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+
+class _LoadClient:
+    """One attaching machine with its own data dir and machine id."""
+
+    def __init__(self, url: str, data_dir: str, index: int) -> None:
+        self.machine_id = "load-machine-{}".format(index)
+        self.cfg = config.UAConfig({"contract_url": url, "data_dir": data_dir})
+        self.client = contract.UAContractClient(self.cfg)
+
+    def attach(self) -> None:
+        self.client.request_contract_machine_attach(
+            contract_token="contract-token", machine_id=self.machine_id
+        )
+
+    def refresh(self) -> None:
+        token = self.cfg.read_cache("machine-token")
+        self.client.request_machine_token_update(
+            machine_token=token["machineToken"],
+            contract_id=token["machineTokenInfo"]["contractInfo"]["id"],
+            machine_id=self.machine_id,
+        )
+
+
+LOAD_SCENARIOS = ("attach", "refresh")
+
+
+def run_load(
+    url: str, *, clients: int = 10, requests: int = 5, scenario: str = "attach"
+) -> "Dict[str, Any]":
+    """Run concurrent attach or refresh clients against a contract server.
+
+    Each client attaches with its own machine id and data dir. In the
+    refresh scenario a client attaches once, untimed, and then times
+    each of its machine-token refreshes.
+
+    :return: Dict of request count, error counts keyed by HTTP status code,
+        total elapsed seconds, throughput and per-request latency
+        percentiles.
+    """
+    if scenario not in LOAD_SCENARIOS:
+        raise ValueError("Unknown load scenario: {}".format(scenario))
+    tmp_dir = tempfile.mkdtemp(prefix="uaclient-load-")
+    latencies = []  # type: List[float]
+    errors = collections.Counter()  # type: collections.Counter
+    lock = threading.Lock()
+    start_barrier = threading.Barrier(clients)
+
+    def worker(index):
+        load_client = _LoadClient(url, tempfile.mkdtemp(dir=tmp_dir), index)
+        attached = True
+        if scenario == "refresh":
+            try:
+                load_client.attach()
+            except Exception as e:
+                attached = False
+                with lock:
+                    errors[_error_key(e)] += 1
+        try:
+            start_barrier.wait()  # Start timed requests together
+        except threading.BrokenBarrierError:
+            pass
+        if not attached:
+            return
+        operation = getattr(load_client, scenario)
+        for _ in range(requests):
+            start = time.monotonic()
+            try:
+                operation()
+            except Exception as e:
+                with lock:
+                    errors[_error_key(e)] += 1
+                continue
+            with lock:
+                latencies.append(time.monotonic() - start)
+
+    threads = [
+        threading.Thread(target=worker, args=(index,))
+        for index in range(clients)
+    ]
+    start = time.monotonic()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+    elapsed = time.monotonic() - start
+    latencies.sort()
+    return {
+        "scenario": scenario,
+        "clients": clients,
+        "succeeded": len(latencies),
+        "errors": dict(errors),
+        "elapsed": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0,
+        "latency_median": statistics.median(latencies) if latencies else 0,
+        "latency_p95": _percentile(latencies, 0.95),
+        "latency_max": latencies[-1] if latencies else 0,
+    }
+
+
+def _error_key(error: Exception) -> str:
+    """Key load errors by HTTP status code, or exception type otherwise."""
+    if isinstance(error, util.UrlError) and error.code:
+        return str(error.code)
+    return type(error).__name__
+
+
+def _percentile(ordered: "List[float]", fraction: float) -> float:
+    if not ordered:
+        return 0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def _add_state_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--latency", type=float, default=0, help="seconds per request"
+    )
+    parser.add_argument(
+        "--error-rate",
+        type=float,
+        default=0,
+        help="fraction of requests answered with --error-code",
+    )
+    parser.add_argument("--error-code", type=int, default=DEFAULT_ERROR_CODE)
+    parser.add_argument(
+        "--rate-limit",
+        type=int,
+        default=None,
+        help="requests per second served before answering 429",
+    )
+    parser.add_argument("--retry-after", type=int, default=DEFAULT_RETRY_AFTER)
+    parser.add_argument(
+        "--payload-size",
+        type=int,
+        default=0,
+        help="minimum size in bytes of machine-token responses",
+    )
+    parser.add_argument("--seed", type=int, default=None)
+
+
+def get_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="python3 -m uaclient.testing.contract_server",
+        description="Local contract server for offline and load testing",
+    )
+    subparsers = parser.add_subparsers(dest="command")
+    serve_parser = subparsers.add_parser("serve", help="serve until killed")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8484)
+    _add_state_arguments(serve_parser)
+    load_parser = subparsers.add_parser(
+        "load", help="run concurrent clients against a contract server"
+    )
+    load_parser.add_argument(
+        "--url", help="contract server url. Default: start a local server"
+    )
+    load_parser.add_argument("--clients", type=int, default=10)
+    load_parser.add_argument(
+        "--requests", type=int, default=5, help="requests per client"
+    )
+    load_parser.add_argument(
+        "--scenario", choices=LOAD_SCENARIOS, default="attach"
+    )
+    _add_state_arguments(load_parser)
+    return parser
+
+
+def _state_from_args(args: argparse.Namespace) -> ContractServerState:
+    return ContractServerState(
+        latency=args.latency,
+        error_rate=args.error_rate,
+        error_code=args.error_code,
+        rate_limit=args.rate_limit,
+        retry_after=args.retry_after,
+        payload_size=args.payload_size,
+        seed=args.seed,
+    )
+
+
+def main(sys_argv: "Optional[List[str]]" = None) -> int:
+    parser = get_parser()
+    args = parser.parse_args(sys_argv)
+    if args.command == "serve":
+        srv = ContractServer(_state_from_args(args), args.host, args.port)
+        print("Serving contract API on {}".format(srv.url))
+        try:
+            srv.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            srv.server_close()
+        return 0
+    if args.command == "load":
+        kwargs = {
+            "clients": args.clients,
+            "requests": args.requests,
+            "scenario": args.scenario,
+        }
+        if args.url:
+            result = run_load(args.url, **kwargs)
+        else:
+            with ContractServer(_state_from_args(args)) as srv:
+                result = run_load(srv.url, **kwargs)
+                result["server_requests"] = dict(srv.state.requests)
+        print(json.dumps(result, indent=2, sort_keys=True))
+        return 0
+    parser.print_usage()
+    return 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
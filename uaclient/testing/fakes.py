@@ -1,8 +1,135 @@
+import copy
+
 from uaclient.contract import (
     API_V1_TMPL_CONTEXT_MACHINE_TOKEN_RESOURCE,
     UAContractClient,
 )
 
+try:
+    from typing import Any, Dict, List, Optional  # noqa: F401
+except ImportError:
+    # typing isn't available on trusty, so ignore its absence
+    pass
+
+
+# Directives for each known service, as delivered by the contract server
+SERVICE_DIRECTIVES = {
+    "cc-eal": {
+        "aptKey": "9F912DADD99EE1CC6BFFFF243A186E733F491C46",
+        "aptURL": "https://esm.ubuntu.com/cc",
+        "suites": ["xenial"],
+        "additionalPackages": ["ubuntu-commoncriteria"],
+    },
+    "cis-audit": {
+        "aptKey": "E8A443CE358113D187BEE0E6AD8E9E3C2A1D3A4C",
+        "aptURL": "https://esm.ubuntu.com/cis",
+        "suites": ["xenial"],
+        "additionalPackages": ["usg-cisbenchmark", "usg-common"],
+    },
+    "esm-apps": {
+        "aptKey": "3CB3DF682220A643B43065E9B30EDAA63D8F61D0",
+        "aptURL": "https://esm.ubuntu.com/apps",
+        "suites": ["xenial-apps-security", "xenial-apps-updates"],
+    },
+    "esm-infra": {
+        "aptKey": "56F7650A24C9E9ECF87C4D8D4067E40313CB4B13",
+        "aptURL": "https://esm.ubuntu.com/infra",
+        "suites": ["xenial-infra-security", "xenial-infra-updates"],
+    },
+    "fips": {
+        "aptKey": "E23341B2A1467EDBF07057D6C1997C40EDE22758",
+        "aptURL": "https://esm.ubuntu.com/fips",
+        "suites": ["xenial"],
+        "additionalPackages": ["ubuntu-fips"],
+    },
+    "fips-updates": {
+        "aptKey": "E23341B2A1467EDBF07057D6C1997C40EDE22758",
+        "aptURL": "https://esm.ubuntu.com/fips-updates",
+        "suites": ["xenial-updates"],
+        "additionalPackages": ["ubuntu-fips"],
+    },
+    "livepatch": {
+        "caCerts": "",
+        "remoteServer": "https://livepatch.canonical.com",
+    },
+}  # type: Dict[str, Dict[str, Any]]
+
+
+def fake_resource_entitlement(
+    name: str, *, enable_by_default: bool = False, entitled: bool = True
+) -> "Dict[str, Any]":
+    """Return a resourceEntitlements item for the named service."""
+    return {
+        "type": name,
+        "entitled": entitled,
+        "obligations": {"enableByDefault": enable_by_default},
+        "affordances": {"series": []},  # Will match all series
+        "directives": copy.deepcopy(SERVICE_DIRECTIVES.get(name, {})),
+    }
+
+
+def fake_available_resources(
+    names: "Optional[List[str]]" = None
+) -> "List[Dict[str, Any]]":
+    """Return an availableResources list marking every service available."""
+    if names is None:
+        names = sorted(SERVICE_DIRECTIVES)
+    return [{"name": name, "available": True} for name in names]
+
+
+def fake_machine_token(
+    names: "Optional[List[str]]" = None,
+    *,
+    enable_by_default: "Optional[List[str]]" = None,
+    contract_id: str = "cid",
+    machine_token: str = "machine-token",
+    support_level: str = "standard"
+) -> "Dict[str, Any]":
+    """Generate a machine-token response entitling the named services.
+
+    :param names: List of service names to entitle. Defaults to every
+        service in SERVICE_DIRECTIVES.
+    :param enable_by_default: List of service names carrying the
+        enableByDefault obligation.
+    :param contract_id: Contract id reported in contractInfo.
+    :param machine_token: The machineToken value of the response.
+    :param support_level: The support entitlement supportLevel affordance.
+    """
+    if names is None:
+        names = sorted(SERVICE_DIRECTIVES)
+    if enable_by_default is None:
+        enable_by_default = []
+    entitlements = [
+        fake_resource_entitlement(
+            name, enable_by_default=bool(name in enable_by_default)
+        )
+        for name in names
+    ]
+    entitlements.append(
+        {
+            "type": "support",
+            "entitled": True,
+            "affordances": {"supportLevel": support_level},
+        }
+    )
+    return {
+        "availableResources": fake_available_resources(),
+        "machineToken": machine_token,
+        "machineTokenInfo": {
+            "accountInfo": {"id": "acct-1", "name": "test_account"},
+            "contractInfo": {
+                "id": contract_id,
+                "name": "test_contract",
+                "origin": "free",
+                "effectiveTo": "2999-12-31T00:00:00Z",
+                "resourceEntitlements": entitlements,
+            },
+        },
+        "resourceTokens": [
+            {"type": name, "token": "{}-token".format(name)} for name in names
+        ],
+    }
+
 
 class FakeContractClient(UAContractClient):
 
@@ -13,7 +140,7 @@ class FakeContractClient(UAContractClient):
         contract="cid", machine="mid"
     )
 
-    def __init___(self, cfg, responses=None):
+    def __init__(self, cfg, responses=None):
         super().__init__(cfg)
         if responses:
             self._responses = responses
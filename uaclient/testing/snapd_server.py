@@ -0,0 +1,288 @@
+"""
+A local stand-in for snapd's REST API served on a Unix socket.
+
+The server answers the seed.loaded system config query, snap install and
+change polling endpoints used by uaclient.snapd. Knobs allow delaying
+seeding and change completion by a number of polls and failing installs.
+
+Usage:
+
+    with SnapdServer(SnapdServerState(seed_polls=2)) as srv:
+        client = snapd.SnapdClient(srv.socket_path)
+"""
+
+import collections
+import json
+import os
+import re
+import shutil
+import socketserver
+import tempfile
+import threading
+import urllib.parse
+from http import server
+
+try:
+    from typing import Any, Callable, Dict, Optional  # noqa: F401
+except ImportError:
+    # typing isn't available on trusty, so ignore its absence
+    pass
+
+
+RE_SNAP = re.compile("^/v2/snaps/(?P<name>[^/]+)$")
+RE_CHANGE = re.compile("^/v2/changes/(?P<id>[^/]+)$")
+
+
+class SnapdServerState:
+    """Installed snaps, pending changes, fault knobs and request counters.
+
+    :param seed_polls: Number of seed.loaded queries answered before the
+        system reports it is seeded.
+    :param change_polls: Number of polls of a change answered before it
+        is ready.
+    :param installed: Names of snaps installed from the start.
+    :param install_error: When set, changes complete with this error.
+    :param on_install: Callable receiving a snap name when its install
+        change completes successfully.
+    :param seed_error_kind: Kind of the error answering seed.loaded queries
+        before seeding; empty to mimic older snapd, which sends no kind.
+    """
+
+    def __init__(
+        self,
+        seed_polls: int = 0,
+        change_polls: int = 0,
+        installed=(),
+        install_error: "Optional[str]" = None,
+        on_install: "Optional[Callable[[str], None]]" = None,
+        seed_error_kind: str = "option-not-found",
+    ) -> None:
+        self.seed_polls = seed_polls
+        self.change_polls = change_polls
+        self.installed = set(installed)
+        self.install_error = install_error
+        self.on_install = on_install
+        self.seed_error_kind = seed_error_kind
+        self.changes = {}  # type: Dict[str, Dict[str, Any]]
+        self.requests = collections.Counter()  # type: Dict[str, int]
+        self._lock = threading.Lock()
+
+    def seed_loaded(self) -> bool:
+        with self._lock:
+            self.requests["seed"] += 1
+            return self.requests["seed"] > self.seed_polls
+
+    def start_install(self, name: str) -> "Optional[str]":
+        """Return a new install change id or None if name is installed."""
+        with self._lock:
+            self.requests["install"] += 1
+            if name in self.installed:
+                return None
+            change_id = str(len(self.changes) + 1)
+            self.changes[change_id] = {"snap": name, "polls": 0}
+            return change_id
+
+    def poll_change(self, change_id: str) -> "Optional[Dict[str, Any]]":
+        """Return the snapd representation of change_id, advancing it."""
+        with self._lock:
+            self.requests["change"] += 1
+            change = self.changes.get(change_id)
+            if change is None:
+                return None
+            change["polls"] += 1
+            ready = change["polls"] > self.change_polls
+            completed = ready and not change.get("ready")
+            change["ready"] = ready
+        name = change["snap"]
+        result = {
+            "id": change_id,
+            "kind": "install-snap",
+            "summary": 'Install "{}" snap'.format(name),
+            "status": "Doing",
+            "ready": ready,
+            "tasks": [
+                {
+                    "summary": 'Download snap "{}"'.format(name),
+                    "status": "Done" if ready else "Doing",
+                    "progress": {
+                        "label": name,
+                        "done": change["polls"],
+                        "total": self.change_polls + 1,
+                    },
+                }
+            ],
+        }
+        if not ready:
+            return result
+        if self.install_error:
+            result["status"] = "Error"
+            result["err"] = self.install_error
+            return result
+        result["status"] = "Done"
+        if completed:
+            with self._lock:
+                self.installed.add(name)
+            if self.on_install:
+                self.on_install(name)
+        return result
+
+
+class SnapdRequestHandler(server.BaseHTTPRequestHandler):
+    """Route snapd API requests to handlers using the server's state."""
+
+    protocol_version = "HTTP/1.1"
+
+    @property
+    def state(self) -> SnapdServerState:
+        return self.server.state
+
+    def address_string(self):
+        return "snapd"  # client_address is empty on Unix sockets
+
+    def log_message(self, format, *args):
+        pass  # Keep test output readable
+
+    def do_GET(self):
+        self._dispatch("GET")
+
+    def do_POST(self):
+        self._dispatch("POST")
+
+    def _dispatch(self, method: str) -> None:
+        parsed = urllib.parse.urlsplit(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length) if length else b""
+        try:
+            data = json.loads(body.decode("utf-8")) if body else {}
+        except ValueError:
+            return self._send_error(400, "bad-request", "cannot decode body")
+        if method == "GET" and parsed.path == "/v2/snaps/system/conf":
+            return self._system_conf(urllib.parse.parse_qs(parsed.query))
+        match = RE_SNAP.match(parsed.path)
+        if method == "POST" and match:
+            return self._snap_action(match.group("name"), data)
+        match = RE_CHANGE.match(parsed.path)
+        if method == "GET" and match:
+            return self._change(match.group("id"))
+        self._send_error(404, "not-found", "not found")
+
+    def _system_conf(self, query):
+        if query.get("keys") != ["seed.loaded"]:
+            return self._send_error(400, "bad-request", "unsupported keys")
+        if not self.state.seed_loaded():
+            return self._send_error(
+                400,
+                self.state.seed_error_kind,
+                'snap "core" has no "seed.loaded" configuration option',
+            )
+        self._send_sync({"seed.loaded": True})
+
+    def _snap_action(self, name, data):
+        if data.get("action") != "install":
+            return self._send_error(400, "bad-request", "unsupported action")
+        change_id = self.state.start_install(name)
+        if change_id is None:
+            return self._send_error(
+                400,
+                "snap-already-installed",
+                'snap "{}" is already installed'.format(name),
+            )
+        self._send_json(
+            202,
+            {
+                "type": "async",
+                "status-code": 202,
+                "status": "Accepted",
+                "change": change_id,
+                "result": None,
+            },
+        )
+
+    def _change(self, change_id):
+        change = self.state.poll_change(change_id)
+        if change is None:
+            return self._send_error(
+                404, "", 'cannot find change with id "{}"'.format(change_id)
+            )
+        self._send_sync(change)
+
+    def _send_sync(self, result):
+        self._send_json(
+            200,
+            {
+                "type": "sync",
+                "status-code": 200,
+                "status": "OK",
+                "result": result,
+            },
+        )
+
+    def _send_error(self, code, kind, message):
+        result = {"message": message}
+        if kind:
+            result["kind"] = kind
+        self._send_json(
+            code,
+            {
+                "type": "error",
+                "status-code": code,
+                "status": self.responses.get(code, ("",))[0],
+                "result": result,
+            },
+        )
+
+    def _send_json(self, code, content):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class SnapdServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Threaded snapd stand-in bound to a socket in a private temp dir.
+
+    Use as a context manager to serve from a background thread:
+
+        with SnapdServer() as srv:
+            client = snapd.SnapdClient(srv.socket_path)
+    """
+
+    daemon_threads = True
+
+    def __init__(
+        self,
+        state: "Optional[SnapdServerState]" = None,
+        socket_path: "Optional[str]" = None,
+    ) -> None:
+        self._tmp_dir = None  # type: Optional[str]
+        if socket_path is None:
+            self._tmp_dir = tempfile.mkdtemp(prefix="uaclient-snapd-")
+            socket_path = os.path.join(self._tmp_dir, "snapd.socket")
+        super().__init__(socket_path, SnapdRequestHandler)
+        self.socket_path = socket_path
+        self.state = state or SnapdServerState()
+        self._thread = None  # type: Optional[threading.Thread]
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread:
+            self._thread.join()
+        if self._tmp_dir:
+            shutil.rmtree(self._tmp_dir, ignore_errors=True)
+        elif os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop()
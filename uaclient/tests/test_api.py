@@ -0,0 +1,208 @@
+import datetime
+import os
+
+import mock
+import pytest
+
+from uaclient import api, exceptions
+
+RESOURCES = [
+    {"name": "esm-apps", "available": True},
+    {"name": "esm-infra", "available": True},
+    {"name": "fips", "available": False},
+]
+CACHED_STATUS = {
+    "attached": True,
+    "account": "test_account",
+    "account-id": "acct-1",
+    "subscription": "test_contract",
+    "subscription-id": "cid",
+    "origin": "free",
+    "expires": datetime.datetime(2030, 1, 1),
+    "techSupportLevel": "n/a",
+    "services": [
+        {
+            "name": "livepatch",
+            "description": "Canonical Livepatch service",
+            "entitled": "yes",
+            "status": "enabled",
+            "statusDetails": "",
+            "description_override": None,
+        },
+        {
+            "name": "esm-apps",
+            "description": "UA Apps",
+            "entitled": "yes",
+            "status": "disabled",
+            "statusDetails": "",
+            "description_override": None,
+        },
+    ],
+}
+
+
+@pytest.fixture
+def m_request_resources():
+    with mock.patch(
+        "uaclient.contract.UAContractClient.request_resources",
+        return_value={"resources": RESOURCES},
+    ) as m_request_resources:
+        yield m_request_resources
+
+
+@mock.patch("uaclient.api.os.getuid", return_value=0)
+class TestGetStatus:
+    @mock.patch("uaclient.config.os.getuid", return_value=0)
+    @mock.patch("uaclient.contract.os.getuid", return_value=0)
+    def test_fresh_status_writes_no_cache(
+        self,
+        _m_c_getuid,
+        _m_getuid,
+        _m_api_getuid,
+        m_request_resources,
+        FakeConfig,
+    ):
+        cfg = FakeConfig()
+        cfg.write_cache("status-cache", CACHED_STATUS)
+
+        status = api.get_status(cfg, cache=api.CachePolicy.FRESH)
+
+        assert False is status.attached
+        assert None is status.account
+        assert [("esm-infra", "yes")] == [
+            (service.name, service.available) for service in status.services
+        ]
+        assert 1 == m_request_resources.call_count
+        assert None is cfg.read_cache("available-resources")
+        assert CACHED_STATUS == cfg.read_cache("status-cache")
+
+    def test_cached_status_is_typed(self, _m_getuid, FakeConfig):
+        cfg = FakeConfig()
+        cfg.write_cache("status-cache", CACHED_STATUS)
+
+        status = api.get_status(cfg)
+
+        assert True is status.attached
+        assert "cid" == status.subscription_id
+        assert datetime.datetime(2030, 1, 1) == status.expires
+        assert "inactive" == status.config_status
+        assert (
+            api.ServiceStatus(
+                name="livepatch",
+                description="Canonical Livepatch service",
+                entitled="yes",
+                status="enabled",
+                status_details="",
+                available=None,
+            ),
+        ) == status.services
+
+    def test_show_beta_includes_beta_services_sorted(
+        self, _m_getuid, FakeConfig
+    ):
+        cfg = FakeConfig()
+        cfg.write_cache("status-cache", CACHED_STATUS)
+
+        status = api.get_status(cfg, show_beta=True)
+
+        assert ["esm-apps", "livepatch"] == [s.name for s in status.services]
+
+    @pytest.mark.parametrize("age,computed", ((10, False), (100, True)))
+    @mock.patch("uaclient.config.UAConfig.status")
+    def test_max_age_policy(
+        self, m_status, _m_getuid, age, computed, FakeConfig
+    ):
+        cfg = FakeConfig()
+        cfg.write_cache("status-cache", CACHED_STATUS)
+        mtime = os.stat(cfg.data_path("status-cache")).st_mtime
+        m_status.return_value = dict(CACHED_STATUS, services=[])
+
+        with mock.patch("uaclient.api.time.time", return_value=mtime + age):
+            status = api.get_status(
+                cfg, cache=api.CachePolicy.MAX_AGE, max_age=60
+            )
+
+        assert computed is (m_status.call_count == 1)
+        assert computed is (status.services == ())
+
+    def test_max_age_policy_requires_max_age(self, _m_getuid, FakeConfig):
+        with pytest.raises(ValueError):
+            api.get_status(FakeConfig(), cache=api.CachePolicy.MAX_AGE)
+
+    @mock.patch("uaclient.config.UAConfig.status")
+    def test_non_root_fresh_status_raises(
+        self, m_status, m_getuid, FakeConfig
+    ):
+        m_getuid.return_value = 1000
+        cfg = FakeConfig()
+        cfg.write_cache("status-cache", CACHED_STATUS)
+
+        with pytest.raises(exceptions.NonRootUserError):
+            api.get_status(cfg, cache=api.CachePolicy.FRESH)
+        with pytest.raises(exceptions.NonRootUserError):
+            api.get_service_status(
+                "esm-infra", cfg, cache=api.CachePolicy.FRESH
+            )
+
+        assert 0 == m_status.call_count
+
+    @mock.patch("uaclient.config.UAConfig.status")
+    def test_non_root_cached_status_uses_cache(
+        self, m_status, m_getuid, FakeConfig
+    ):
+        m_getuid.return_value = 1000
+        cfg = FakeConfig()
+        cfg.write_cache("status-cache", CACHED_STATUS)
+
+        status = api.get_status(cfg, cache=api.CachePolicy.CACHED)
+
+        assert "test_contract" == status.subscription
+        assert 0 == m_status.call_count
+
+
+@mock.patch("uaclient.api.os.getuid", return_value=0)
+class TestGetServiceStatus:
+    @mock.patch(
+        "uaclient.config.UAConfig.attached_service_status",
+        side_effect=lambda ent, inapplicable: {
+            "name": ent.name,
+            "description": ent.description,
+            "entitled": "yes",
+            "status": "enabled",
+            "statusDetails": "",
+        },
+    )
+    def test_fresh_attached_status_evaluates_one_service(
+        self, m_service_status, _m_getuid, m_request_resources, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine()
+
+        service = api.get_service_status(
+            "esm-infra", cfg, cache=api.CachePolicy.FRESH
+        )
+
+        assert "enabled" == service.status
+        assert ["esm-infra"] == [
+            call[0][0].name for call in m_service_status.call_args_list
+        ]
+        assert {"fips": None} == m_service_status.call_args[0][1]
+
+    def test_cached_service_status(self, _m_getuid, FakeConfig):
+        cfg = FakeConfig()
+        cfg.write_cache("status-cache", CACHED_STATUS)
+
+        assert "disabled" == api.get_service_status("esm-apps", cfg).status
+
+    def test_service_missing_from_status(self, _m_getuid, FakeConfig):
+        cfg = FakeConfig()
+        cfg.write_cache("status-cache", CACHED_STATUS)
+
+        service = api.get_service_status("fips", cfg)
+
+        assert (None, None) == (service.status, service.available)
+
+    def test_unknown_service_raises(self, _m_getuid, FakeConfig):
+        with pytest.raises(exceptions.UserFacingError) as excinfo:
+            api.get_service_status("nope", FakeConfig())
+
+        assert excinfo.value.msg.startswith("Unknown service 'nope'.")
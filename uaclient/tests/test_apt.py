@@ -5,6 +5,7 @@ import mock
 import os
 import stat
 import subprocess
+import threading
 from textwrap import dedent
 
 import pytest
@@ -18,12 +19,14 @@ from uaclient.apt import (
     add_ppa_pinning,
     clean_apt_files,
     find_apt_list_files,
+    get_dpkg_installed_packages,
     get_installed_packages,
     remove_apt_list_files,
     remove_auth_apt_repo,
     remove_repo_from_apt_auth_file,
     assert_valid_apt_credentials,
     run_apt_command,
+    update_apt_auth_credentials,
 )
 from uaclient import apt, exceptions, util, status
 from uaclient.entitlements.tests.test_repo import RepoTestEntitlement
@@ -544,6 +547,34 @@ class TestAddAptAuthConfEntry:
         assert expected_content == util.load_file(auth_file)
 
 
+class TestUpdateAptAuthCredentials:
+    @pytest.mark.parametrize(
+        "credentials,login,password",
+        (("user:pass", "user", "pass"), ("token", "bearer", "token")),
+    )
+    @mock.patch("uaclient.apt.get_apt_auth_file_from_apt_config")
+    def test_replaces_only_the_auth_entry_of_repo(
+        self, m_get_apt_auth_file, credentials, login, password, tmpdir
+    ):
+        auth_file = tmpdir.join("auth.conf").strpath
+        util.write_file(
+            auth_file,
+            "machine fakerepo/ login bearer password old\n"
+            "machine otherrepo/ login bearer password other\n",
+        )
+        m_get_apt_auth_file.return_value = auth_file
+
+        update_apt_auth_credentials("http://fakerepo/", credentials)
+
+        expected_content = (
+            "machine fakerepo/ login {} password {}{}\n"
+            "machine otherrepo/ login bearer password other\n".format(
+                login, password, APT_AUTH_COMMENT
+            )
+        )
+        assert expected_content == util.load_file(auth_file)
+
+
 class TestCleanAptFiles:
     @pytest.fixture(params=[RepoEntitlement, UAEntitlement])
     def mock_apt_entitlement(self, request, tmpdir):
@@ -846,6 +877,35 @@ class TestGetInstalledPackages:
         assert ["a", "b"] == get_installed_packages()
 
 
+class TestGetDpkgInstalledPackages:
+    def test_only_installed_packages_are_returned(self, tmpdir):
+        status_file = tmpdir.join("status")
+        status_file.write(
+            dedent(
+                """\
+                Package: ubuntu-fips
+                Status: install ok installed
+                Architecture: amd64
+
+                Package: removed-pkg
+                Status: deinstall ok config-files
+
+                Package: held-pkg
+                Status: hold ok installed
+                Description: a package
+                 Status: install ok installed
+                """
+            )
+        )
+
+        with mock.patch("uaclient.apt.DPKG_STATUS_FILE", status_file.strpath):
+            with mock.patch("uaclient.apt.util.subp") as m_subp:
+                installed = get_dpkg_installed_packages()
+
+        assert {"ubuntu-fips", "held-pkg"} == installed
+        assert 0 == m_subp.call_count
+
+
 class TestRunAptCommand:
     @pytest.mark.parametrize(
         "error_list, output_list",
@@ -911,3 +971,93 @@ class TestRunAptCommand:
 
         expected_message = "\n".join(output_list)
         assert expected_message == excinfo.value.msg
+
+
+@mock.patch("uaclient.apt.run_apt_command")
+class TestBatchedAptUpdate:
+    def test_run_apt_update_runs_immediately_outside_batch(
+        self, m_run_apt_command, capsys
+    ):
+        apt.run_apt_update()
+
+        assert [
+            mock.call(["apt-get", "update"], status.MESSAGE_APT_UPDATE_FAILED)
+        ] == m_run_apt_command.call_args_list
+        assert status.MESSAGE_APT_UPDATING_LISTS in capsys.readouterr()[0]
+
+    def test_updates_within_batch_run_once_on_exit(self, m_run_apt_command):
+        with apt.batched_apt_update():
+            apt.run_apt_update()
+            apt.run_apt_update()
+            with apt.batched_apt_update():  # Nested batches join the outer
+                apt.run_apt_update()
+            assert 0 == m_run_apt_command.call_count
+
+        assert 1 == m_run_apt_command.call_count
+
+    def test_no_update_when_none_requested(self, m_run_apt_command):
+        with apt.batched_apt_update():
+            pass
+
+        assert 0 == m_run_apt_command.call_count
+
+    def test_flush_runs_pending_update_once(self, m_run_apt_command):
+        with apt.batched_apt_update():
+            apt.run_apt_update()
+            apt.flush_apt_update()
+            assert 1 == m_run_apt_command.call_count
+            apt.flush_apt_update()
+
+        assert 1 == m_run_apt_command.call_count
+
+    def test_failed_update_rolls_back_every_requester(self, m_run_apt_command):
+        m_run_apt_command.side_effect = exceptions.UserFacingError("failed")
+        rolled_back = []
+
+        with pytest.raises(exceptions.UserFacingError):
+            with apt.batched_apt_update():
+                apt.run_apt_update(on_failure=lambda: rolled_back.append(1))
+                apt.run_apt_update()
+                apt.run_apt_update(on_failure=lambda: rolled_back.append(2))
+
+        assert [2, 1] == rolled_back
+        assert 1 == m_run_apt_command.call_count
+
+    def test_pending_update_runs_when_batch_body_raises(
+        self, m_run_apt_command
+    ):
+        with pytest.raises(RuntimeError):
+            with apt.batched_apt_update():
+                apt.run_apt_update()
+                raise RuntimeError("boom")
+
+        assert 1 == m_run_apt_command.call_count
+        apt.run_apt_update()  # The batch is gone, so this runs immediately
+        assert 2 == m_run_apt_command.call_count
+
+    def test_flush_waits_for_update_running_in_another_lane(
+        self, m_run_apt_command
+    ):
+        """A lane must not install before an update covering it finished."""
+        update_started = threading.Event()
+        release_update = threading.Event()
+
+        def slow_update(*args, **kwargs):
+            update_started.set()
+            release_update.wait(5)
+
+        m_run_apt_command.side_effect = slow_update
+        with apt.batched_apt_update():
+            apt.run_apt_update()
+            flushing_lane = threading.Thread(target=apt.flush_apt_update)
+            flushing_lane.start()
+            update_started.wait(5)
+            waiting_lane = threading.Thread(target=apt.flush_apt_update)
+            waiting_lane.start()
+            waiting_lane.join(0.1)
+            assert waiting_lane.is_alive()
+            release_update.set()
+            flushing_lane.join(5)
+            waiting_lane.join(5)
+
+        assert 1 == m_run_apt_command.call_count
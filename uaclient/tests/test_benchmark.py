@@ -0,0 +1,85 @@
+from uaclient.testing import benchmark
+
+
+class TestRunScenario:
+    def test_status_scenario_counts_subprocesses_and_http_calls(self):
+        """The status scenario reports forks made and no contract calls."""
+        result = benchmark.run_scenario(
+            "status", rounds=1, latency=0, http_latency=0
+        )
+
+        assert "status" == result["name"]
+        assert 0 == result["http"]
+        assert result["subprocesses"] == sum(
+            result["subprocess_calls"].values()
+        )
+        assert result["subprocess_calls"]["apt-cache policy"] > 0
+        assert result["wall_median"] > 0
+
+    def test_refresh_scenario_calls_the_contract_server_once(self):
+        result = benchmark.run_scenario(
+            "refresh", rounds=1, latency=0, http_latency=0
+        )
+
+        assert 1 == result["http"]
+        assert result["subprocess_calls"]["apt-get update"] > 0
+
+
+class TestCompareResults:
+    def test_no_regressions_within_tolerance(self):
+        baseline = [
+            {
+                "name": "status",
+                "wall_median": 1.0,
+                "subprocesses": 5,
+                "http": 1,
+            }
+        ]
+        results = [
+            {
+                "name": "status",
+                "wall_median": 1.2,
+                "subprocesses": 5,
+                "http": 1,
+            }
+        ]
+
+        assert [] == benchmark.compare_results(results, baseline, 0.25)
+
+    def test_slower_wall_time_and_extra_calls_are_regressions(self):
+        baseline = [
+            {
+                "name": "status",
+                "wall_median": 1.0,
+                "subprocesses": 5,
+                "http": 1,
+            }
+        ]
+        results = [
+            {
+                "name": "status",
+                "wall_median": 2.0,
+                "subprocesses": 6,
+                "http": 2,
+            }
+        ]
+
+        regressions = benchmark.compare_results(results, baseline, 0.25)
+
+        assert [
+            "status: wall time 2.000s > 1.000s (+100%)",
+            "status: subprocess calls 6 > 5",
+            "status: http calls 2 > 1",
+        ] == regressions
+
+    def test_scenarios_missing_from_baseline_are_ignored(self):
+        results = [
+            {
+                "name": "attach",
+                "wall_median": 2.0,
+                "subprocesses": 6,
+                "http": 2,
+            }
+        ]
+
+        assert [] == benchmark.compare_results(results, [], 0.25)
@@ -0,0 +1,223 @@
+import json
+
+import mock
+import pytest
+
+from uaclient import exceptions, status, util
+from uaclient.bundle import create_contract_bundle, read_contract_bundle
+from uaclient.testing import fakes
+
+M_PATH = "uaclient.bundle."
+
+VALID_TOKEN = {
+    "machineTokenInfo": {"accountInfo": {}, "contractInfo": {"id": "cid"}}
+}
+
+
+@pytest.fixture
+def bundle_path(tmpdir):
+    def write(bundle):
+        path = tmpdir.join("contract-bundle.json")
+        path.write(json.dumps(bundle))
+        return path.strpath
+
+    return write
+
+
+class TestCreateContractBundle:
+    def test_defaults_resources_to_machine_token_available_resources(self):
+        machine_token = fakes.fake_machine_token(["esm-infra"])
+
+        bundle = create_contract_bundle(machine_token)
+
+        assert 1 == bundle["bundleVersion"]
+        assert machine_token == bundle["content"]["machineToken"]
+        assert (
+            machine_token["availableResources"]
+            == bundle["content"]["availableResources"]
+        )
+
+
+class TestReadContractBundle:
+    def test_returns_verified_bundle_content(self, bundle_path):
+        machine_token = fakes.fake_machine_token(["esm-infra"])
+        resources = fakes.fake_available_resources(["esm-infra"])
+        path = bundle_path(create_contract_bundle(machine_token, resources))
+
+        content = read_contract_bundle(path, allow_unsigned=True)
+
+        assert {
+            "machineToken": machine_token,
+            "availableResources": resources,
+        } == content
+
+    @pytest.mark.parametrize(
+        "bundle,reason",
+        (
+            ("not json", "invalid JSON"),
+            ({"bundleVersion": 2}, "unsupported bundleVersion 2"),
+            ({"bundleVersion": 1, "content": {}}, "missing machineToken"),
+            (
+                {"bundleVersion": 1, "content": {"machineToken": "x"}},
+                "missing machineToken",
+            ),
+            (
+                {"bundleVersion": 1, "content": {"machineToken": {}}},
+                "missing machineTokenInfo",
+            ),
+            (
+                {
+                    "bundleVersion": 1,
+                    "content": {
+                        "machineToken": {
+                            "machineTokenInfo": {"contractInfo": {}}
+                        }
+                    },
+                },
+                "missing machineTokenInfo accountInfo",
+            ),
+            (
+                {
+                    "bundleVersion": 1,
+                    "content": {
+                        "machineToken": {
+                            "machineTokenInfo": {
+                                "accountInfo": {},
+                                "contractInfo": "x",
+                            }
+                        }
+                    },
+                },
+                "missing machineTokenInfo contractInfo",
+            ),
+            (
+                {
+                    "bundleVersion": 1,
+                    "content": {
+                        "machineToken": {
+                            "machineTokenInfo": {
+                                "accountInfo": {},
+                                "contractInfo": {
+                                    "id": "cid",
+                                    "effectiveTo": "tomorrow",
+                                },
+                            }
+                        }
+                    },
+                },
+                "invalid contractInfo effectiveTo",
+            ),
+            (
+                {"bundleVersion": 1, "content": {"machineToken": VALID_TOKEN}},
+                "missing availableResources",
+            ),
+            (
+                {
+                    "bundleVersion": 1,
+                    "content": {
+                        "machineToken": VALID_TOKEN,
+                        "availableResources": [],
+                    },
+                    "sha256": "0123",
+                },
+                "sha256 mismatch",
+            ),
+        ),
+    )
+    def test_invalid_bundles_raise_user_facing_error(
+        self, bundle, reason, bundle_path
+    ):
+        path = bundle_path(bundle)
+
+        with pytest.raises(exceptions.UserFacingError) as excinfo:
+            read_contract_bundle(path)
+
+        assert (
+            status.MESSAGE_INVALID_CONTRACT_BUNDLE_TMPL.format(
+                path=path, reason=reason
+            )
+            == excinfo.value.msg
+        )
+
+    def test_tampered_content_fails_sha256_check(self, bundle_path):
+        bundle = create_contract_bundle(fakes.fake_machine_token())
+        bundle["content"]["machineToken"]["machineToken"] = "stolen"
+        path = bundle_path(bundle)
+
+        with pytest.raises(exceptions.UserFacingError) as excinfo:
+            read_contract_bundle(path)
+
+        assert "sha256 mismatch" in excinfo.value.msg
+
+    def test_unsigned_bundles_require_explicit_opt_out(self, bundle_path):
+        path = bundle_path(create_contract_bundle(fakes.fake_machine_token()))
+
+        with pytest.raises(exceptions.UserFacingError) as excinfo:
+            read_contract_bundle(path)
+
+        assert "no contract_bundle_keyring configured" in excinfo.value.msg
+        assert read_contract_bundle(path, allow_unsigned=True)
+
+    @mock.patch(M_PATH + "util.subp")
+    def test_keyring_requires_signature_file(self, m_subp, bundle_path):
+        path = bundle_path(create_contract_bundle(fakes.fake_machine_token()))
+
+        with pytest.raises(exceptions.UserFacingError) as excinfo:
+            read_contract_bundle(path, keyring="/keyring.gpg")
+
+        assert "missing signature {}.gpg".format(path) in excinfo.value.msg
+        assert 0 == m_subp.call_count
+
+    @pytest.mark.parametrize("verified", (True, False))
+    @mock.patch(M_PATH + "util.subp")
+    def test_keyring_verifies_detached_signature(
+        self, m_subp, verified, bundle_path
+    ):
+        path = bundle_path(create_contract_bundle(fakes.fake_machine_token()))
+        util.write_file(path + ".gpg", "signature")
+        verified_data = []
+
+        def gpg_verify(args):
+            verified_data.append(util.load_file(args[-1]))
+            if not verified:
+                raise util.ProcessExecutionError("gpg --verify")
+
+        m_subp.side_effect = gpg_verify
+
+        if verified:
+            read_contract_bundle(path, keyring="/keyring.gpg")
+        else:
+            with pytest.raises(exceptions.UserFacingError) as excinfo:
+                read_contract_bundle(path, keyring="/keyring.gpg")
+            assert "signature verification failed" in excinfo.value.msg
+
+        assert [
+            mock.call(
+                [
+                    "gpg",
+                    "--batch",
+                    "--no-default-keyring",
+                    "--keyring",
+                    "/keyring.gpg",
+                    "--verify",
+                    path + ".gpg",
+                    mock.ANY,
+                ]
+            )
+        ] == m_subp.call_args_list
+        assert [util.load_file(path)] == verified_data
+
+    @mock.patch(M_PATH + "util.subp")
+    def test_verified_bytes_are_the_parsed_bytes(self, m_subp, bundle_path):
+        """Replacing the bundle file during verification has no effect."""
+        machine_token = fakes.fake_machine_token()
+        path = bundle_path(create_contract_bundle(machine_token))
+        util.write_file(path + ".gpg", "signature")
+        replaced = create_contract_bundle(fakes.fake_machine_token(["x"]))
+        m_subp.side_effect = lambda args: util.write_file(
+            path, json.dumps(replaced)
+        )
+
+        content = read_contract_bundle(path, keyring="/keyring.gpg")
+
+        assert machine_token == content["machineToken"]
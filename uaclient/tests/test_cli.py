@@ -2,6 +2,7 @@ import contextlib
 import io
 import json
 import logging
+import logging.handlers
 import mock
 import os
 import socket
@@ -12,6 +13,7 @@ import textwrap
 import pytest
 
 from uaclient.cli import (
+    _daemon_serves,
     action_help,
     assert_attached,
     assert_not_attached,
@@ -20,6 +22,7 @@ from uaclient.cli import (
     main,
     get_valid_entitlement_names,
     setup_logging,
+    stop_file_logging,
 )
 
 from uaclient.exceptions import (
@@ -305,6 +308,51 @@ class TestCLIParser:
         assert 1 == m_service_name.call_count
         assert 1 == m_available_resources.call_count
 
+    @mock.patch("uaclient.cli.config.UAConfig.help")
+    @mock.patch("uaclient.cli.daemon.query")
+    @mock.patch("uaclient.cli._daemon_serves", return_value=True)
+    def test_help_command_uses_daemon_when_running(
+        self, _m_daemon_serves, m_query, m_help, capsys
+    ):
+        """Help is read from the ua daemon without computing it."""
+        m_query.return_value = [["name", "test"], ["help", "Test service"]]
+        m_args = mock.MagicMock(service="test", format="tabular")
+
+        assert 0 == action_help(m_args, None)
+
+        assert "Name:\ntest\n\nHelp:\nTest service\n\n" == (
+            capsys.readouterr()[0]
+        )
+        assert [mock.call("help", {"name": "test"})] == m_query.call_args_list
+        assert 0 == m_help.call_count
+
+
+class TestDaemonServes:
+    @pytest.mark.parametrize(
+        "environ,data_dir,serves",
+        (
+            ({}, "/var/lib/ubuntu-advantage", True),
+            ({}, "/tmp/other", False),
+            ({"UA_CONFIG_FILE": "/tmp/uaclient.conf"}, None, False),
+            ({"UA_DATA_DIR": "/tmp/other"}, None, False),
+        ),
+    )
+    def test_only_the_default_config_is_served(
+        self, environ, data_dir, serves, tmpdir
+    ):
+        cfg = mock.MagicMock(data_dir=data_dir)
+        with mock.patch.dict("os.environ", environ, clear=True):
+            with mock.patch("os.getcwd", return_value=tmpdir.strpath):
+                assert serves is _daemon_serves(cfg)
+
+    def test_config_file_in_working_directory_is_not_served(self, tmpdir):
+        tmpdir.join("uaclient.conf").write("")
+        cfg = mock.MagicMock(data_dir="/var/lib/ubuntu-advantage")
+
+        with mock.patch.dict("os.environ", {}, clear=True):
+            with mock.patch("os.getcwd", return_value=tmpdir.strpath):
+                assert not _daemon_serves(cfg)
+
 
 class TestAssertRoot:
     def test_assert_root_when_root(self):
@@ -421,6 +469,7 @@ class TestMain:
         expected_log,
     ):
         m_args = m_get_parser.return_value.parse_args.return_value
+        m_args.events_fd = m_args.events_file = m_args.profile = None
         m_args.action.side_effect = exception
 
         with pytest.raises(SystemExit) as excinfo:
@@ -457,6 +506,7 @@ class TestMain:
         expected_exit_code,
     ):
         m_args = m_get_parser.return_value.parse_args.return_value
+        m_args.events_fd = m_args.events_file = m_args.profile = None
         m_args.action.side_effect = exception
         expected_msg = exception.msg
 
@@ -511,6 +561,7 @@ class TestMain:
     ):
 
         m_args = m_get_parser.return_value.parse_args.return_value
+        m_args.events_fd = m_args.events_file = m_args.profile = None
         m_args.action.side_effect = util.UrlError(
             socket.gaierror(-2, "Name or service not known"), url=error_url
         )
@@ -533,14 +584,98 @@ class TestMain:
     @mock.patch("uaclient.cli.setup_logging")
     @mock.patch("uaclient.cli.get_parser")
     def test_command_line_is_logged(
-        self, _m_get_parser, _m_setup_logging, logging_sandbox, caplog_text
+        self, m_get_parser, _m_setup_logging, logging_sandbox, caplog_text
     ):
+        m_args = m_get_parser.return_value.parse_args.return_value
+        m_args.events_fd = m_args.events_file = m_args.profile = None
         main(["some", "args"])
 
         log = caplog_text()
 
         assert "['some', 'args']" in log
 
+    @pytest.mark.parametrize("ret,outcome", ((0, "succeeded"), (1, "failed")))
+    @mock.patch("uaclient.cli.os.getuid", return_value=0)
+    @mock.patch("uaclient.cli.journal.record_operation")
+    @mock.patch("uaclient.cli.metrics.record_operation")
+    @mock.patch("uaclient.cli.setup_logging")
+    @mock.patch("uaclient.cli.get_parser")
+    def test_events_file_wraps_the_command(
+        self,
+        m_get_parser,
+        _m_setup_logging,
+        m_record_operation,
+        m_journal_operation,
+        _m_getuid,
+        ret,
+        outcome,
+        tmpdir,
+    ):
+        events_file = tmpdir.join("events")
+        m_args = m_get_parser.return_value.parse_args.return_value
+        m_args.events_fd = None
+        m_args.events_file = events_file.strpath
+        m_args.command = "refresh"
+        m_args.skipped = False
+        m_args.action.return_value = ret
+
+        assert ret == main(["ua", "refresh"])
+
+        lines = [json.loads(line) for line in events_file.readlines()]
+        assert [("phase-start", "refresh"), ("phase-end", "refresh")] == [
+            (line["event"], line["phase"]) for line in lines
+        ]
+        assert outcome == lines[-1]["outcome"]
+        [call] = m_record_operation.call_args_list
+        assert "refresh" == call[0][1]
+        assert outcome == call[0][2]["outcome"]
+        assert lines[-1]["duration"] == call[0][2]["duration"]
+        [call] = m_journal_operation.call_args_list
+        assert "refresh" == call[0][1]
+        assert [lines[-1]] == call[0][3]
+
+    @mock.patch("uaclient.cli.os.getuid", return_value=0)
+    @mock.patch("uaclient.cli.journal.record_operation")
+    @mock.patch("uaclient.cli.metrics.record_operation")
+    @mock.patch("uaclient.cli.setup_logging")
+    @mock.patch("uaclient.cli.get_parser")
+    def test_skipped_scheduled_refreshes_are_not_timed_or_journaled(
+        self,
+        m_get_parser,
+        _m_setup_logging,
+        m_record_operation,
+        m_journal_operation,
+        _m_getuid,
+    ):
+        m_args = m_get_parser.return_value.parse_args.return_value
+        m_args.events_fd = m_args.events_file = m_args.profile = None
+        m_args.command = "refresh"
+
+        def skip(args, cfg):
+            args.skipped = True
+            return 0
+
+        m_args.action.side_effect = skip
+
+        assert 0 == main(["ua", "refresh", "--scheduled"])
+
+        assert 0 == m_record_operation.call_count
+        assert 0 == m_journal_operation.call_count
+
+    @pytest.mark.parametrize(
+        "cli_args,profile",
+        (
+            (["status"], None),
+            (["--profile", "status"], "cpu"),
+            (["--profile-memory", "status"], "memory"),
+        ),
+    )
+    def test_profile_flags_leave_the_subcommand_alone(self, cli_args, profile):
+        args = get_parser().parse_args(cli_args)
+
+        assert "status" == args.command
+        assert profile == args.profile
+
     def test_argparse_errors_well_formatted(self, capsys):
         parser = get_parser()
         with mock.patch("sys.argv", ["ua", "enable"]):
@@ -613,9 +748,29 @@ class TestSetupLogging:
 
         setup_logging(logging.INFO, logging.INFO, log_file=log_file.strpath)
         logging.info("after setup")
+        stop_file_logging()
 
         assert "after setup" in log_file.read()
 
+    @mock.patch("uaclient.cli.os.getuid", return_value=0)
+    def test_file_log_is_written_from_a_queue(
+        self, _m_getuid, logging_sandbox, tmpdir
+    ):
+        log_file = tmpdir.join("queued.log")
+
+        setup_logging(logging.INFO, logging.DEBUG, log_file=log_file.strpath)
+        setup_logging(logging.INFO, logging.DEBUG, log_file=log_file.strpath)
+        logging.debug("queued %s", "message")
+        stop_file_logging()
+
+        [file_handler] = [
+            handler
+            for handler in logging.getLogger().handlers
+            if handler.get_name() == "file"
+        ]
+        assert isinstance(file_handler, logging.handlers.QueueHandler)
+        assert 1 == log_file.read().count("queued message")
+
     @pytest.mark.parametrize("pre_existing", (True, False))
     @mock.patch("uaclient.cli.os.getuid", return_value=0)
     @mock.patch("uaclient.cli.config")
@@ -631,6 +786,7 @@ class TestSetupLogging:
 
         setup_logging(logging.INFO, logging.INFO, log_file=log_path)
         logging.info("after setup")
+        stop_file_logging()
 
         assert 0o600 == stat.S_IMODE(os.lstat(log_path).st_mode)
         log_content = log_file.read()
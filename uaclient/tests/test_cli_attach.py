@@ -107,6 +107,7 @@ class TestActionAttach:
         """When missing the required token argument, raise a UserFacingError"""
         args = mock.MagicMock()
         args.token = None
+        args.bundle = None
         with pytest.raises(UserFacingError) as e:
             action_attach(args, FakeConfig())
         assert status.MESSAGE_ATTACH_REQUIRES_TOKEN == str(e.value)
@@ -203,6 +204,59 @@ class TestActionAttach:
         expected_call = mock.call(mock.ANY, mock.ANY, allow_enable=auto_enable)
         assert [expected_call] == m_ruc.call_args_list
 
+    @pytest.mark.parametrize("from_config", (True, False))
+    @mock.patch(M_PATH + "action_status")
+    @mock.patch(M_PATH + "contract.attach_with_contract_bundle")
+    def test_attach_from_bundle_without_token(
+        self,
+        attach_with_contract_bundle,
+        action_status,
+        _m_getuid,
+        from_config,
+        capsys,
+        FakeConfig,
+    ):
+        """Without a token, attach from --bundle or the configured bundle."""
+        cfg = FakeConfig()
+        if from_config:
+            cfg.cfg["contract_bundle"] = "/bundle.json"
+            args = mock.MagicMock(token=None, bundle=None)
+        else:
+            args = mock.MagicMock(token=None, bundle="/bundle.json")
+
+        def fake_attach(cfg, bundle_path, allow_enable, allow_unsigned):
+            cfg.write_cache("machine-token", BASIC_MACHINE_TOKEN)
+
+        attach_with_contract_bundle.side_effect = fake_attach
+
+        assert 0 == action_attach(args, cfg)
+        assert [
+            mock.call(
+                cfg,
+                "/bundle.json",
+                allow_enable=args.auto_enable,
+                allow_unsigned=args.allow_unsigned,
+            )
+        ] == attach_with_contract_bundle.call_args_list
+        assert (
+            status.MESSAGE_ATTACH_SUCCESS_TMPL.format(
+                contract_name="mycontract"
+            )
+            in capsys.readouterr()[0]
+        )
+
+    @mock.patch(M_PATH + "contract.attach_with_contract_bundle")
+    def test_invalid_bundle_raises_user_facing_error(
+        self, attach_with_contract_bundle, _m_getuid, FakeConfig
+    ):
+        attach_with_contract_bundle.side_effect = UserFacingError("Invalid")
+        args = mock.MagicMock(token=None, bundle="/bundle.json")
+
+        with pytest.raises(UserFacingError) as excinfo:
+            action_attach(args, FakeConfig())
+
+        assert "Invalid" == excinfo.value.msg
+
 
 class TestParser:
     def test_attach_parser_usage(self):
@@ -253,3 +307,12 @@ class TestParser:
         with mock.patch("sys.argv", ["ua", "attach", "token"]):
             args = full_parser.parse_args()
         assert args.auto_enable
+
+    def test_attach_parser_rejects_token_with_bundle(self, capsys):
+        full_parser = get_parser()
+        with mock.patch(
+            "sys.argv", ["ua", "attach", "token", "--bundle", "/bundle.json"]
+        ):
+            with pytest.raises(SystemExit):
+                full_parser.parse_args()
+        assert "not allowed with argument" in capsys.readouterr()[1]
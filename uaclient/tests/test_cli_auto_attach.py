@@ -147,24 +147,26 @@ class TestGetContractTokenFromCloudIdentity:
         assert 1 == get_instance_id.call_count
         assert "my-iid" == cfg.read_cache("instance-id")
 
-    @pytest.mark.parametrize(
-        "iid_response,calls_detach", (("old-iid", False), ("new-iid", True))
-    )
+    @pytest.mark.parametrize("iid_response", ("old-iid", "new-iid"))
+    @mock.patch(M_PATH + "_detach")
     @mock.patch(M_ID_PATH + "get_instance_id")
     @mock.patch(
         M_PATH + "contract.UAContractClient.request_auto_attach_contract_token"
     )
     @mock.patch(M_ID_PATH + "cloud_instance_factory")
-    def test_delta_in_instance_id_forces_detach(
+    def test_delta_in_instance_id_keeps_services_attached(
         self,
         cloud_instance_factory,
         request_auto_attach_contract_token,
         get_instance_id,
+        m_detach,
         iid_response,
-        calls_detach,
         FakeConfig,
     ):
-        """When instance-id changes since last attach, call detach."""
+        """When instance-id changes since last attach, return a new token.
+
+        Services are not detached; the caller swaps the machine token.
+        """
 
         get_instance_id.return_value = iid_response
         cloud_instance_factory.side_effect = self.fake_instance_factory
@@ -179,56 +181,18 @@ class TestGetContractTokenFromCloudIdentity:
         # persist old instance-id value
         cfg.write_cache("instance-id", "old-iid")
 
-        if calls_detach:
-            with mock.patch(M_PATH + "_detach") as m_detach:
-                m_detach.return_value = 0
-                assert (
-                    "myPKCS7-token"
-                    == _get_contract_token_from_cloud_identity(cfg)
-                )
-            assert [mock.call(cfg, assume_yes=True)] == m_detach.call_args_list
+        if iid_response == "new-iid":
+            assert "myPKCS7-token" == _get_contract_token_from_cloud_identity(
+                cfg
+            )
+            assert cfg.is_attached
         else:
             with pytest.raises(AlreadyAttachedError):
                 _get_contract_token_from_cloud_identity(cfg)
+        assert 0 == m_detach.call_count
         # current instance-id is persisted for next auto-attach call
         assert iid_response == cfg.read_cache("instance-id")
 
-    @mock.patch(M_PATH + "_detach")
-    @mock.patch(M_ID_PATH + "get_instance_id")
-    @mock.patch(
-        M_PATH + "contract.UAContractClient.request_auto_attach_contract_token"
-    )
-    @mock.patch(M_ID_PATH + "cloud_instance_factory")
-    def test_failed_detach_on_changed_instance_id_raises_errors(
-        self,
-        cloud_instance_factory,
-        request_auto_attach_contract_token,
-        get_instance_id,
-        m_detach,
-        FakeConfig,
-    ):
-        """When instance-id changes since last attach, call detach."""
-
-        get_instance_id.return_value = "new-iid"
-        cloud_instance_factory.side_effect = self.fake_instance_factory
-
-        def fake_contract_token(instance):
-            return {"contractToken": "myPKCS7-token"}
-
-        request_auto_attach_contract_token.side_effect = fake_contract_token
-        m_detach.return_value = 1  # Failure to auto-detach
-
-        account_name = "test_account"
-        cfg = FakeConfig.for_attached_machine(account_name=account_name)
-        # persist old instance-id value
-        cfg.write_cache("instance-id", "old-iid")
-
-        with pytest.raises(UserFacingError) as err:
-            assert "myPKCS7-token" == _get_contract_token_from_cloud_identity(
-                cfg
-            )
-        assert status.MESSAGE_DETACH_AUTOMATION_FAILURE == str(err.value)
-
 
 # For all of these tests we want to appear as root, so mock on the class
 @mock.patch(M_PATH + "os.getuid", return_value=0)
@@ -313,6 +277,60 @@ class TestActionAutoAttach:
         assert 0 == ret
         assert expected_calls == request_updated_contract.call_args_list
 
+    @mock.patch(M_PATH + "contract.reattach_with_contract_token")
+    @mock.patch(M_PATH + "contract.request_updated_contract")
+    @mock.patch(M_PATH + "_get_contract_token_from_cloud_identity")
+    @mock.patch(M_PATH + "action_status")
+    def test_attached_machine_on_new_instance_swaps_machine_token(
+        self,
+        action_status,
+        get_contract_token_from_cloud_identity,
+        request_updated_contract,
+        reattach_with_contract_token,
+        _m_getuid,
+        FakeConfig,
+    ):
+        cfg = FakeConfig.for_attached_machine()
+        get_contract_token_from_cloud_identity.return_value = "myPKCS7-token"
+
+        ret = action_auto_attach(mock.MagicMock(), cfg)
+
+        assert 0 == ret
+        assert [
+            mock.call(cfg, "myPKCS7-token", allow_enable=True)
+        ] == reattach_with_contract_token.call_args_list
+        assert 0 == request_updated_contract.call_count
+
+    @mock.patch(M_PATH + "contract.reattach_with_contract_token")
+    @mock.patch(M_PATH + "identity.get_instance_id", return_value="new-iid")
+    @mock.patch(
+        M_PATH + "contract.UAContractClient.request_auto_attach_contract_token"
+    )
+    @mock.patch(M_PATH + "identity.cloud_instance_factory")
+    def test_refused_reattach_is_retried_on_next_boot(
+        self,
+        cloud_instance_factory,
+        request_auto_attach_contract_token,
+        _get_instance_id,
+        reattach_with_contract_token,
+        _m_getuid,
+        FakeConfig,
+    ):
+        """Restore the old instance-id when the new token was refused."""
+        cfg = FakeConfig.for_attached_machine()
+        cfg.write_cache("instance-id", "old-iid")
+        orig_token = cfg.machine_token
+        request_auto_attach_contract_token.return_value = {
+            "contractToken": "myPKCS7-token"
+        }
+        reattach_with_contract_token.side_effect = UserFacingError("refused")
+
+        with mock.patch.object(cfg, "status"):
+            assert 1 == action_auto_attach(mock.MagicMock(), cfg)
+
+        assert orig_token == cfg.machine_token
+        assert "old-iid" == cfg.read_cache("instance-id")
+
 
 class TestParser:
     def test_auto_attach_parser_updates_parser_config(self):
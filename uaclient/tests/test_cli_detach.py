@@ -4,6 +4,7 @@ from textwrap import dedent
 import pytest
 
 from uaclient.cli import action_detach, detach_parser, get_parser
+from uaclient import apt
 from uaclient import exceptions
 from uaclient import status
 from uaclient.testing.fakes import FakeContractClient
@@ -234,6 +235,41 @@ class TestActionDetach:
 
         assert expected_message in out
 
+    @mock.patch("uaclient.apt.run_apt_command")
+    @mock.patch("uaclient.cli.entitlements")
+    @mock.patch("uaclient.contract.UAContractClient")
+    def test_single_apt_update_after_all_services_are_disabled(
+        self,
+        m_client,
+        m_entitlements,
+        m_run_apt_command,
+        m_getuid,
+        _m_prompt,
+        FakeConfig,
+        tmpdir,
+    ):
+        m_getuid.return_value = 0
+
+        def fake_disable(silent):
+            apt.run_apt_update()
+            assert 0 == m_run_apt_command.call_count
+            return True
+
+        classes = [entitlement_cls_mock_factory(True) for _ in range(3)]
+        for ent_cls in classes:
+            ent_cls.return_value.disable.side_effect = fake_disable
+        m_entitlements.ENTITLEMENT_CLASSES = classes
+        m_client.return_value = FakeContractClient(
+            FakeConfig.for_attached_machine()
+        )
+        m_cfg = mock.MagicMock()
+        m_cfg.data_path.return_value = tmpdir.join("lock").strpath
+
+        assert 0 == action_detach(mock.MagicMock(assume_yes=True), m_cfg)
+        assert [
+            mock.call(["apt-get", "update"], status.MESSAGE_APT_UPDATE_FAILED)
+        ] == m_run_apt_command.call_args_list
+
 
 class TestParser:
     def test_detach_parser_usage(self):
@@ -3,6 +3,7 @@ import pytest
 import textwrap
 
 from uaclient.cli import action_disable
+from uaclient import apt
 from uaclient import entitlements
 from uaclient import exceptions
 from uaclient import status
@@ -71,7 +72,7 @@ class TestDisable:
             ] == m_entitlement.disable.call_args_list
 
         assert return_code == ret
-        assert len(entitlements_cls) == m_cfg.status.call_count
+        assert 1 == m_cfg.update_status_cache.call_count
 
     @pytest.mark.parametrize("assume_yes", (True, False))
     @mock.patch("uaclient.cli.entitlements")
@@ -79,7 +80,7 @@ class TestDisable:
         self, m_entitlements, _m_getuid, assume_yes, tmpdir
     ):
         expected_error_tmpl = status.MESSAGE_INVALID_SERVICE_OP_FAILURE_TMPL
-        num_calls = 2
+        num_calls = 1
 
         m_ent1_cls = mock.Mock()
         m_ent1_obj = m_ent1_cls.return_value
@@ -126,7 +127,32 @@ class TestDisable:
             assert [expected_disable_call] == m_ent.disable.call_args_list
 
         assert 0 == m_ent1_obj.call_count
-        assert num_calls == m_cfg.status.call_count
+        assert num_calls == m_cfg.update_status_cache.call_count
+
+    @mock.patch("uaclient.apt.run_apt_command")
+    @mock.patch("uaclient.cli.entitlements")
+    def test_single_apt_update_after_all_services_are_disabled(
+        self, m_entitlements, m_run_apt_command, _m_getuid, tmpdir
+    ):
+        def fake_disable():
+            apt.run_apt_update()
+            assert 0 == m_run_apt_command.call_count
+            return True
+
+        m_entitlements.ENTITLEMENT_CLASS_BY_NAME = {}
+        for name in ("ent1", "ent2", "ent3"):
+            m_entitlement_cls = mock.Mock()
+            m_entitlement_cls.return_value.disable.side_effect = fake_disable
+            m_entitlements.ENTITLEMENT_CLASS_BY_NAME[name] = m_entitlement_cls
+        m_cfg = mock.Mock()
+        m_cfg.data_path.return_value = tmpdir.join("lock").strpath
+        args_mock = mock.Mock(service=["ent1", "ent2", "ent3"])
+
+        assert 0 == action_disable(args_mock, m_cfg)
+        assert [
+            mock.call(["apt-get", "update"], status.MESSAGE_APT_UPDATE_FAILED)
+        ] == m_run_apt_command.call_args_list
+        assert 1 == m_cfg.update_status_cache.call_count
 
     @pytest.mark.parametrize(
         "uid,expected_error_template",
@@ -2,6 +2,7 @@ import contextlib
 import io
 import mock
 import textwrap
+import threading
 
 import pytest
 
@@ -125,6 +126,7 @@ class TestActionEnable:
         m_entitlement_cls = mock.MagicMock()
         m_ent_is_beta = mock.PropertyMock(return_value=False)
         type(m_entitlement_cls).is_beta = m_ent_is_beta
+        m_entitlements.package_system_lanes.side_effect = lambda names: [names]
         m_entitlements.ENTITLEMENT_CLASS_BY_NAME = {
             "testitlement": m_entitlement_cls
         }
@@ -176,6 +178,7 @@ class TestActionEnable:
         m_ent3_obj = m_ent3_cls.return_value
         m_ent3_obj.enable.return_value = True
 
+        m_entitlements.package_system_lanes.side_effect = lambda names: [names]
         m_entitlements.ENTITLEMENT_CLASS_BY_NAME = {
             "ent2": m_ent2_cls,
             "ent3": m_ent3_cls,
@@ -254,6 +257,7 @@ class TestActionEnable:
         m_ent3_obj = m_ent3_cls.return_value
         m_ent3_obj.enable.return_value = True
 
+        m_entitlements.package_system_lanes.side_effect = lambda names: [names]
         m_entitlements.ENTITLEMENT_CLASS_BY_NAME = {
             "ent2": m_ent2_cls,
             "ent3": m_ent3_cls,
@@ -349,6 +353,82 @@ class TestActionEnable:
             == err.value.msg
         )
 
+    @mock.patch("uaclient.cli._perform_enable")
+    def test_snap_and_apt_services_are_enabled_concurrently(
+        self,
+        m_perform_enable,
+        _m_request_updated_contract,
+        m_getuid,
+        FakeConfig,
+    ):
+        """Livepatch installs its snap while repo services run apt."""
+        m_getuid.return_value = 0
+        esm_started = threading.Event()
+        threads = {}
+
+        def fake_perform_enable(name, cfg, **kwargs):
+            threads[name] = threading.current_thread()
+            if name == "livepatch":
+                assert esm_started.wait(5), "esm-infra was not concurrent"
+            else:
+                esm_started.set()
+            return name != "cc-eal"
+
+        m_perform_enable.side_effect = fake_perform_enable
+        cfg = FakeConfig.for_attached_machine()
+        args = mock.MagicMock(
+            service=["livepatch", "esm-infra", "cc-eal"], assume_yes=True
+        )
+
+        with mock.patch.object(cfg, "update_status_cache") as m_update:
+            assert 1 == action_enable(args, cfg)
+
+        assert threads["esm-infra"] == threads["cc-eal"]
+        assert threads["esm-infra"] != threads["livepatch"]
+        assert [
+            mock.call(["livepatch", "esm-infra", "cc-eal"])
+        ] == m_update.call_args_list
+        assert [
+            mock.call(
+                name,
+                cfg,
+                assume_yes=True,
+                allow_beta=args.beta,
+                update_status=False,
+            )
+            for name in ("cc-eal", "esm-infra", "livepatch")
+        ] == sorted(
+            m_perform_enable.call_args_list, key=lambda call: call[0][0]
+        )
+
+    @mock.patch("uaclient.cli._perform_enable")
+    def test_unexpected_errors_in_lanes_are_reraised(
+        self,
+        m_perform_enable,
+        _m_request_updated_contract,
+        m_getuid,
+        FakeConfig,
+    ):
+        m_getuid.return_value = 0
+
+        def fake_perform_enable(name, cfg, **kwargs):
+            if name == "livepatch":
+                raise KeyError("boom")
+            return True
+
+        m_perform_enable.side_effect = fake_perform_enable
+        cfg = FakeConfig.for_attached_machine()
+        args = mock.MagicMock(service=["livepatch", "esm-infra"])
+
+        with mock.patch.object(cfg, "update_status_cache") as m_update:
+            with pytest.raises(KeyError):
+                action_enable(args, cfg)
+
+        assert 2 == m_perform_enable.call_count
+        assert [
+            mock.call(["livepatch", "esm-infra"])
+        ] == m_update.call_args_list
+
 
 class TestPerformEnable:
     @mock.patch("uaclient.cli.entitlements")
@@ -405,7 +485,7 @@ class TestPerformEnable:
         assert [expected_enable_call] == m_entitlement.enable.call_args_list
         assert ret == m_entitlement.enable.return_value
 
-        assert 1 == m_cfg.status.call_count
+        assert 1 == m_cfg.update_status_cache.call_count
         assert 1 == m_user_cfg.call_count
         assert beta_call_count == m_is_beta.call_count
 
@@ -475,6 +555,6 @@ class TestPerformEnable:
         assert [expected_enable_call] == m_entitlement.enable.call_args_list
         assert ret == m_entitlement.enable.return_value
 
-        assert 1 == m_cfg.status.call_count
+        assert 1 == m_cfg.update_status_cache.call_count
         assert 0 == m_is_beta.call_count
         assert 1 == m_cfg_dict.call_count
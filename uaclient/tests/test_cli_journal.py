@@ -0,0 +1,51 @@
+import json
+
+import mock
+
+from uaclient import journal
+from uaclient.cli import action_journal
+
+ENTRY = {
+    "operation": "refresh",
+    "finished": "2020-07-01T12:00:04.000000Z",
+    "duration": 1.5,
+    "outcome": "succeeded",
+    "phases": [
+        {"phase": "contract-request", "duration": 1.25, "outcome": "succeeded"}
+    ],
+}
+
+
+class TestActionJournal:
+    def test_tabular_summary(self, capsys, FakeConfig):
+        cfg = FakeConfig()
+        journal.append_entry(cfg, ENTRY)
+
+        assert 0 == action_journal(mock.MagicMock(format="tabular"), cfg)
+
+        out, _err = capsys.readouterr()
+        assert (
+            "\n".join(
+                [
+                    journal.OPERATION_HEADER,
+                    "refresh                   1       0     1.50s     1.50s"
+                    "  2020-07-01T12:00:04.000000Z",
+                    "",
+                    journal.PHASE_HEADER,
+                    "contract-request          1       0     1.25s     1.25s",
+                ]
+            )
+            + "\n"
+            == out
+        )
+
+    def test_json_summary(self, capsys, FakeConfig):
+        cfg = FakeConfig()
+        journal.append_entry(cfg, ENTRY)
+
+        action_journal(mock.MagicMock(format="json"), cfg)
+
+        out, _err = capsys.readouterr()
+        summary = json.loads(out)
+        assert 1 == summary["operations"]["refresh"]["runs"]
+        assert 1.25 == summary["phases"]["contract-request"]["max"]
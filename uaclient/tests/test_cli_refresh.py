@@ -2,7 +2,7 @@ import mock
 
 import pytest
 
-from uaclient import exceptions
+from uaclient import exceptions, util
 
 try:
     from typing import Any, Dict, Optional  # noqa: F401
@@ -24,14 +24,14 @@ class TestActionRefresh:
 
         cfg = FakeConfig.for_attached_machine()
         with pytest.raises(exceptions.NonRootUserError):
-            action_refresh(mock.MagicMock(), cfg)
+            action_refresh(mock.MagicMock(scheduled=False), cfg)
 
     def test_not_attached_errors(self, getuid, FakeConfig):
         """Check that an unattached machine emits message and exits 1"""
         cfg = FakeConfig()
 
         with pytest.raises(exceptions.UnattachedError):
-            action_refresh(mock.MagicMock(), cfg)
+            action_refresh(mock.MagicMock(scheduled=False), cfg)
 
     @mock.patch("uaclient.cli.util.subp")
     def test_lock_file_exists(self, m_subp, _getuid, FakeConfig):
@@ -40,7 +40,7 @@ class TestActionRefresh:
         with open(cfg.data_path("lock"), "w") as stream:
             stream.write("123:ua disable")
         with pytest.raises(exceptions.LockHeldError) as err:
-            action_refresh(mock.MagicMock(), cfg)
+            action_refresh(mock.MagicMock(scheduled=False), cfg)
         assert [mock.call(["ps", "123"])] == m_subp.call_args_list
         assert (
             "Unable to perform: ua refresh.\n"
@@ -60,7 +60,7 @@ class TestActionRefresh:
         cfg = FakeConfig.for_attached_machine()
 
         with pytest.raises(exceptions.UserFacingError) as excinfo:
-            action_refresh(mock.MagicMock(), cfg)
+            action_refresh(mock.MagicMock(scheduled=False), cfg)
 
         assert "Failure to refresh" == excinfo.value.msg
 
@@ -72,8 +72,45 @@ class TestActionRefresh:
         request_updated_contract.return_value = True
 
         cfg = FakeConfig.for_attached_machine()
-        ret = action_refresh(mock.MagicMock(), cfg)
+        ret = action_refresh(mock.MagicMock(scheduled=False), cfg)
 
         assert 0 == ret
         assert status.MESSAGE_REFRESH_SUCCESS in capsys.readouterr()[0]
         assert [mock.call(cfg)] == request_updated_contract.call_args_list
+
+    @pytest.mark.parametrize(
+        "refreshed,expected_stdout",
+        ((True, status.MESSAGE_REFRESH_SUCCESS + "\n"), (False, "")),
+    )
+    @mock.patch(M_PATH + "contract.scheduled_refresh")
+    def test_scheduled_refresh_only_reports_performed_refreshes(
+        self,
+        scheduled_refresh,
+        getuid,
+        refreshed,
+        expected_stdout,
+        capsys,
+        FakeConfig,
+    ):
+        scheduled_refresh.return_value = refreshed
+
+        cfg = FakeConfig.for_attached_machine()
+        args = mock.MagicMock(scheduled=True, skipped=False)
+        ret = action_refresh(args, cfg)
+
+        assert 0 == ret
+        assert expected_stdout == capsys.readouterr()[0]
+        assert [mock.call(cfg)] == scheduled_refresh.call_args_list
+        assert refreshed is not args.skipped
+
+    @mock.patch(M_PATH + "contract.scheduled_refresh")
+    def test_scheduled_refresh_connectivity_failure(
+        self, scheduled_refresh, getuid, FakeConfig
+    ):
+        scheduled_refresh.side_effect = util.UrlError("Too many", code=429)
+
+        cfg = FakeConfig.for_attached_machine()
+        with pytest.raises(exceptions.UserFacingError) as excinfo:
+            action_refresh(mock.MagicMock(scheduled=True), cfg)
+
+        assert status.MESSAGE_REFRESH_FAILURE == excinfo.value.msg
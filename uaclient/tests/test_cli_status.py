@@ -58,7 +58,7 @@ class TestActionStatus:
     ):
         """Check that root and non-root will emit attached status"""
         cfg = FakeConfig.for_attached_machine()
-        assert 0 == action_status(mock.MagicMock(), cfg)
+        assert 0 == action_status(mock.MagicMock(local_only=False), cfg)
         # capsys already converts colorized non-printable chars to space
         # Strip non-printables from output
         printable_stdout = capsys.readouterr()[0].replace(" " * 17, " " * 8)
@@ -79,7 +79,7 @@ class TestActionStatus:
         """Check that unattached status is emitted to console"""
         cfg = FakeConfig()
 
-        assert 0 == action_status(mock.MagicMock(), cfg)
+        assert 0 == action_status(mock.MagicMock(local_only=False), cfg)
         assert UNATTACHED_STATUS == capsys.readouterr()[0]
 
     @mock.patch("uaclient.util.subp")
@@ -104,7 +104,7 @@ class TestActionStatus:
 
         m_sleep.side_effect = fake_sleep
 
-        assert 0 == action_status(mock.MagicMock(), cfg)
+        assert 0 == action_status(mock.MagicMock(local_only=False), cfg)
         assert [mock.call(1)] * 3 == m_sleep.call_args_list
         assert "...\n" + UNATTACHED_STATUS == capsys.readouterr()[0]
 
@@ -120,7 +120,7 @@ class TestActionStatus:
         """Check that unattached status json output is emitted to console"""
         cfg = FakeConfig()
 
-        args = mock.MagicMock(format="json")
+        args = mock.MagicMock(format="json", local_only=False)
         assert 0 == action_status(args, cfg)
 
         expected = {
@@ -155,7 +155,58 @@ class TestActionStatus:
         cfg = FakeConfig()
 
         with pytest.raises(util.UrlError):
-            action_status(mock.MagicMock(), cfg)
+            action_status(mock.MagicMock(local_only=False), cfg)
+
+    @mock.patch(M_PATH + "daemon.query")
+    @mock.patch(M_PATH + "_daemon_serves", return_value=True)
+    def test_status_uses_daemon_when_running(
+        self,
+        _m_daemon_serves,
+        m_query,
+        m_getuid,
+        m_get_avail_resources,
+        capsys,
+        FakeConfig,
+    ):
+        """Status is read from the ua daemon without computing it."""
+        cfg = FakeConfig()
+        m_query.return_value = cfg.status(show_beta=True)
+        m_get_avail_resources.reset_mock()
+
+        assert 0 == action_status(mock.MagicMock(local_only=False), cfg)
+
+        assert UNATTACHED_STATUS == capsys.readouterr()[0]
+        assert [
+            mock.call("status", {"show_beta": True, "local_only": False})
+        ] == m_query.call_args_list
+        assert 0 == m_get_avail_resources.call_count
+
+    @mock.patch(M_PATH + "daemon.query")
+    def test_status_of_other_configs_is_not_read_from_daemon(
+        self, m_query, m_getuid, m_get_avail_resources, capsys, FakeConfig
+    ):
+        """The daemon only serves the default config, not FakeConfig's."""
+        cfg = FakeConfig()
+
+        assert 0 == action_status(mock.MagicMock(local_only=False), cfg)
+
+        assert 0 == m_query.call_count
+
+    def test_local_only_survives_connectivity_errors(
+        self, m_getuid, m_get_avail_resources, capsys, FakeConfig
+    ):
+        """--local-only reports unknown availability without the network"""
+        m_get_avail_resources.side_effect = util.UrlError(
+            socket.gaierror(-2, "Name or service not known")
+        )
+
+        cfg = FakeConfig()
+
+        args = mock.MagicMock(format="json", local_only=True)
+        assert 0 == action_status(args, cfg)
+        services = json.loads(capsys.readouterr()[0])["services"]
+        assert services
+        assert set(["unknown"]) == set(s["available"] for s in services)
 
     @pytest.mark.parametrize(
         "encoding,expected_dash",
@@ -175,7 +226,10 @@ class TestActionStatus:
         fake_stdout = io.TextIOWrapper(underlying_stdout, encoding=encoding)
 
         with mock.patch("sys.stdout", fake_stdout):
-            action_status(mock.MagicMock(), FakeConfig.for_attached_machine())
+            action_status(
+                mock.MagicMock(local_only=False),
+                FakeConfig.for_attached_machine(),
+            )
 
         fake_stdout.flush()  # Make sure all output is in underlying_stdout
         out = underlying_stdout.getvalue().decode(encoding)
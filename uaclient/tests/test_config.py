@@ -109,6 +109,73 @@ class TestEntitlements:
         }
         assert expected == cfg.entitlements
 
+    @mock.patch(
+        "uaclient.util.get_platform_info", return_value={"series": "xenial"}
+    )
+    def test_entitlements_views_cached_per_series(self, m_platform, tmpdir):
+        """Compile each series view once, leaving the machine token as is."""
+        cfg = UAConfig({"data_dir": tmpdir.strpath})
+        token = {
+            "machineTokenInfo": {
+                "contractInfo": {
+                    "resourceEntitlements": [
+                        {
+                            "type": "entitlement1",
+                            "entitled": True,
+                            "series": {"bionic": {"entitled": False}},
+                        }
+                    ]
+                }
+            }
+        }
+        cfg.write_cache("machine-token", token)
+
+        xenial_view = cfg.entitlements
+        bionic_view = cfg.entitlements_for_series("bionic")
+
+        assert xenial_view is cfg.entitlements
+        assert bionic_view is cfg.entitlements_for_series("bionic")
+        assert [mock.call()] == m_platform.call_args_list
+        assert xenial_view["entitlement1"]["entitlement"]["entitled"]
+        assert not bionic_view["entitlement1"]["entitlement"]["entitled"]
+        assert token == cfg.machine_token
+        cfg.write_cache("machine-token", token)
+        assert xenial_view is not cfg.entitlements
+
+    def test_empty_entitlements_view_is_cached(self, tmpdir):
+        """A token without entitlements is not compiled on each access."""
+        cfg = UAConfig({"data_dir": tmpdir.strpath})
+        token = {
+            "machineTokenInfo": {"contractInfo": {"resourceEntitlements": []}}
+        }
+        cfg.write_cache("machine-token", token)
+
+        assert {} == cfg.entitlements
+        with mock.patch("uaclient.config._compile_entitlements") as m_compile:
+            assert {} == cfg.entitlements
+        assert 0 == m_compile.call_count
+
+    def test_entitlements_are_read_only(self, tmpdir):
+        """Views are shared, so changes must be made to a copy."""
+        cfg = UAConfig({"data_dir": tmpdir.strpath}, series="xenial")
+        token = {
+            "machineTokenInfo": {
+                "contractInfo": {
+                    "resourceEntitlements": [
+                        {"type": "entitlement1", "directives": {"a": 1}}
+                    ]
+                }
+            }
+        }
+        cfg.write_cache("machine-token", token)
+        entitlement = cfg.entitlements["entitlement1"]
+
+        with pytest.raises(TypeError):
+            entitlement["entitlement"]["directives"]["a"] = 2
+        entitlement_copy = copy.deepcopy(entitlement)
+        entitlement_copy["entitlement"]["directives"]["a"] = 2
+        assert 1 == entitlement["entitlement"]["directives"]["a"]
+
 
 class TestAccounts:
     def test_accounts_returns_empty_list_when_no_cached_account_value(
@@ -460,7 +527,7 @@ class TestStatus:
         expected = copy.deepcopy(DEFAULT_STATUS)
         expected["services"] = expected_services
         with mock.patch(
-            "uaclient.config.UAConfig._get_config_status"
+            "uaclient.config.UAConfig.get_config_status"
         ) as m_get_cfg_status:
             m_get_cfg_status.return_value = DEFAULT_CFG_STATUS
             assert expected == cfg.status(show_beta=show_beta)
@@ -574,7 +641,7 @@ class TestStatus:
             }
         )
         with mock.patch(
-            "uaclient.config.UAConfig._get_config_status"
+            "uaclient.config.UAConfig.get_config_status"
         ) as m_get_cfg_status:
             m_get_cfg_status.return_value = DEFAULT_CFG_STATUS
             assert expected == cfg.status(show_beta=show_beta)
@@ -584,7 +651,7 @@ class TestStatus:
             assert m_get_avail_resources.call_count == 1
         # cfg.status() idempotent
         with mock.patch(
-            "uaclient.config.UAConfig._get_config_status"
+            "uaclient.config.UAConfig.get_config_status"
         ) as m_get_cfg_status:
             m_get_cfg_status.return_value = DEFAULT_CFG_STATUS
             assert expected == cfg.status(show_beta=show_beta)
@@ -744,7 +811,7 @@ class TestStatus:
                 }
             )
         with mock.patch(
-            "uaclient.config.UAConfig._get_config_status"
+            "uaclient.config.UAConfig.get_config_status"
         ) as m_get_cfg_status:
             m_get_cfg_status.return_value = DEFAULT_CFG_STATUS
             assert expected == cfg.status(show_beta=show_beta)
@@ -805,6 +872,166 @@ class TestStatus:
         )
         assert status == cfg.status()
 
+    @mock.patch("uaclient.contract.get_available_resources")
+    @mock.patch("uaclient.config.os.getuid", return_value=0)
+    def test_local_only_without_cached_resources_reports_unknown(
+        self, _m_getuid, m_get_available_resources, FakeConfig
+    ):
+        cfg = FakeConfig()
+
+        response = cfg.status(show_beta=True, local_only=True)
+
+        assert 0 == m_get_available_resources.call_count
+        assert [
+            (ent_cls.name, "unknown")
+            for ent_cls in sorted(ENTITLEMENT_CLASSES, key=lambda c: c.name)
+        ] == [
+            (service["name"], service["available"])
+            for service in response["services"]
+        ]
+        assert None is cfg.read_cache("status-cache")
+
+    @mock.patch("uaclient.contract.os.getuid", return_value=0)
+    @mock.patch("uaclient.contract.UAContractClient.request_resources")
+    @mock.patch("uaclient.config.os.getuid", return_value=0)
+    def test_local_only_uses_resources_cached_by_online_status(
+        self, _m_getuid, m_request_resources, _m_contract_getuid, FakeConfig
+    ):
+        m_request_resources.return_value = {
+            "resources": [
+                {"name": "esm-infra", "available": True},
+                {"name": "fips", "available": False},
+            ]
+        }
+        cfg = FakeConfig()
+        online = cfg.status(show_beta=True)
+        m_request_resources.reset_mock()
+
+        assert online == cfg.status(show_beta=True, local_only=True)
+        assert 0 == m_request_resources.call_count
+
+    @mock.patch(
+        "uaclient.config.UAConfig.attached_service_status",
+        side_effect=lambda ent, inapplicable: {"name": ent.name},
+    )
+    @mock.patch("uaclient.contract.get_available_resources")
+    @mock.patch("uaclient.config.os.getuid", return_value=0)
+    def test_local_only_attached_never_fetches_resources(
+        self,
+        _m_getuid,
+        m_get_available_resources,
+        m_service_status,
+        FakeConfig,
+    ):
+        cfg = FakeConfig.for_attached_machine()
+
+        response = cfg.status(show_beta=True, local_only=True)
+
+        assert 0 == m_get_available_resources.call_count
+        assert {} == m_service_status.call_args[0][1]
+        assert len(ENTITLEMENT_CLASSES) == len(response["services"])
+
+
+@mock.patch("uaclient.config.os.getuid", return_value=0)
+@mock.patch(
+    "uaclient.config.UAConfig.get_config_status",
+    return_value=DEFAULT_CFG_STATUS,
+)
+@mock.patch(
+    "uaclient.config.UAConfig.attached_service_status",
+    side_effect=lambda ent, inapplicable: {
+        "name": ent.name,
+        "status": "enabled",
+    },
+)
+class TestUpdateStatusCache:
+    def attached_cfg(self, FakeConfig):
+        token = {
+            "availableResources": ALL_RESOURCES_AVAILABLE,
+            "machineTokenInfo": {
+                "accountInfo": {"id": "1", "name": "accountname"},
+                "contractInfo": {
+                    "id": "contract-1",
+                    "name": "contractname",
+                    "resourceEntitlements": [],
+                },
+            },
+        }
+        return FakeConfig.for_attached_machine(
+            account_name="accountname", machine_token=token
+        )
+
+    def test_only_touched_services_are_evaluated(
+        self, m_service_status, _m_cfg_status, _m_getuid, FakeConfig
+    ):
+        cfg = self.attached_cfg(FakeConfig)
+        cfg.status()
+        m_service_status.reset_mock()
+        cached = cfg.read_cache("status-cache")
+        cached["services"][0]["status"] = "kept from cache"
+        cfg.write_cache("status-cache", cached)
+
+        response = cfg.update_status_cache(["esm-infra"], show_beta=True)
+
+        assert [mock.call(mock.ANY, {})] == m_service_status.call_args_list
+        assert "esm-infra" == m_service_status.call_args[0][0].name
+        assert "kept from cache" == response["services"][0]["status"]
+        assert response == cfg.read_cache("status-cache")
+        assert [cls.name for cls in ENTITLEMENT_CLASSES] == [
+            service["name"] for service in response["services"]
+        ]
+
+    @pytest.mark.parametrize(
+        "touched,evaluated",
+        (
+            (["livepatch"], ["fips", "fips-updates", "livepatch"]),
+            (["fips-updates"], ["fips", "fips-updates", "livepatch"]),
+            (
+                ["esm-infra", "fips"],
+                ["esm-infra", "fips", "fips-updates", "livepatch"],
+            ),
+        ),
+    )
+    def test_incompatible_services_are_evaluated_too(
+        self,
+        m_service_status,
+        _m_cfg_status,
+        _m_getuid,
+        touched,
+        evaluated,
+        FakeConfig,
+    ):
+        cfg = self.attached_cfg(FakeConfig)
+        cfg.status()
+        m_service_status.reset_mock()
+
+        cfg.update_status_cache(touched, show_beta=True)
+
+        assert evaluated == sorted(
+            call[0][0].name for call in m_service_status.call_args_list
+        )
+
+    @pytest.mark.parametrize(
+        "cached",
+        (
+            None,
+            {"attached": False, "services": []},
+            {"attached": True, "subscription-id": "other", "services": []},
+            {"attached": True, "subscription-id": "contract-1"},
+        ),
+    )
+    def test_falls_back_to_full_status_without_a_matching_cache(
+        self, m_service_status, _m_cfg_status, _m_getuid, cached, FakeConfig
+    ):
+        cfg = self.attached_cfg(FakeConfig)
+        if cached:
+            cfg.write_cache("status-cache", cached)
+
+        response = cfg.update_status_cache(["livepatch"], show_beta=True)
+
+        assert len(ENTITLEMENT_CLASSES) == m_service_status.call_count
+        assert len(ENTITLEMENT_CLASSES) == len(response["services"])
+
 
 ATTACHED_SERVICE_STATUS_PARAMETERS = [
     # ENTITLED => display the given user-facing status
@@ -851,7 +1078,7 @@ class TestAttachedServiceStatus:
         unavailable_resources = (
             {ent.name: ""} if in_inapplicable_resources else {}
         )
-        ret = FakeConfig()._attached_service_status(ent, unavailable_resources)
+        ret = FakeConfig().attached_service_status(ent, unavailable_resources)
 
         assert expected_status == ret["status"]
 
@@ -1,7 +1,10 @@
 import copy
+import json
+from datetime import datetime, timedelta
 import mock
 import pytest
 import socket
+import threading
 import urllib
 
 from uaclient.contract import (
@@ -11,13 +14,24 @@ from uaclient.contract import (
     API_V1_TMPL_RESOURCE_MACHINE_ACCESS,
     ContractAPIError,
     UAContractClient,
+    _entitlement_delta_lanes,
+    _process_new_machine_token,
+    attach_with_contract_bundle,
+    forget_contract_refresh,
     get_available_resources,
     process_entitlement_delta,
+    process_entitlements_delta,
+    reattach_with_contract_token,
+    refresh_slot,
     request_updated_contract,
+    scheduled_refresh,
 )
+from uaclient import apt
+from uaclient import bundle
 from uaclient import exceptions
 from uaclient import util
 from uaclient.status import (
+    ApplicationStatus,
     MESSAGE_CONTRACT_EXPIRED_ERROR,
     MESSAGE_ATTACH_EXPIRED_TOKEN,
     MESSAGE_ATTACH_FAILURE_DEFAULT_SERVICES,
@@ -26,6 +40,7 @@ from uaclient.status import (
 )
 from uaclient.version import get_version
 
+from uaclient.testing import fakes
 from uaclient.testing.fakes import FakeContractClient
 
 
@@ -152,6 +167,308 @@ class TestProcessEntitlementDeltas:
         assert 0 == m_process_contract_deltas.call_count
 
 
+class TestProcessEntitlementsDelta:
+    @mock.patch("uaclient.apt.run_apt_command")
+    @mock.patch(M_PATH + "process_entitlement_delta")
+    def test_apt_updates_are_batched_across_entitlements(
+        self, m_process_entitlement_delta, m_run_apt_command
+    ):
+        """Deltas requesting apt updates share one apt-get update."""
+
+        def fake_process_entitlement_delta(*args, **kwargs):
+            apt.run_apt_update()
+            assert 0 == m_run_apt_command.call_count
+
+        m_process_entitlement_delta.side_effect = (
+            fake_process_entitlement_delta
+        )
+
+        process_entitlements_delta(
+            {}, {"ent1": {}, "ent2": {}, "ent3": {}}, allow_enable=False
+        )
+
+        assert 3 == m_process_entitlement_delta.call_count
+        assert 1 == m_run_apt_command.call_count
+
+    @mock.patch("uaclient.apt.run_apt_command")
+    @mock.patch(M_PATH + "process_entitlement_delta")
+    def test_failed_batched_apt_update_is_a_delta_error(
+        self, m_process_entitlement_delta, m_run_apt_command
+    ):
+        rollback = mock.Mock()
+
+        def fake_process_entitlement_delta(*args, **kwargs):
+            apt.run_apt_update(on_failure=rollback)
+
+        m_process_entitlement_delta.side_effect = (
+            fake_process_entitlement_delta
+        )
+        m_run_apt_command.side_effect = exceptions.UserFacingError("failed")
+
+        with pytest.raises(exceptions.UserFacingError) as excinfo:
+            process_entitlements_delta(
+                {}, {"ent1": {}, "ent2": {}}, allow_enable=False
+            )
+
+        assert MESSAGE_ATTACH_FAILURE_DEFAULT_SERVICES == excinfo.value.msg
+        assert 2 == rollback.call_count
+
+    @mock.patch(M_PATH + "process_entitlement_delta")
+    def test_snap_and_apt_lanes_are_processed_concurrently(
+        self, m_process_entitlement_delta
+    ):
+        """Livepatch deltas overlap with deltas of apt-based services."""
+        livepatch_started = threading.Event()
+        threads = {}
+
+        def fake_process_entitlement_delta(orig_access, new_access, **kwargs):
+            name = new_access["entitlement"]["type"]
+            threads[name] = threading.current_thread()
+            if name == "livepatch":
+                livepatch_started.set()
+            else:
+                assert livepatch_started.wait(5)
+
+        m_process_entitlement_delta.side_effect = (
+            fake_process_entitlement_delta
+        )
+        new_entitlements = dict(
+            (name, {"entitlement": {"type": name, "entitled": True}})
+            for name in ("esm-infra", "livepatch")
+        )
+
+        process_entitlements_delta({}, new_entitlements, allow_enable=False)
+
+        assert threads["esm-infra"] != threads["livepatch"]
+
+    @mock.patch(M_PATH + "process_entitlement_delta")
+    def test_errors_of_all_lanes_are_aggregated(
+        self, m_process_entitlement_delta
+    ):
+        def fake_process_entitlement_delta(orig_access, new_access, **kwargs):
+            if new_access["entitlement"]["type"] == "livepatch":
+                raise RuntimeError("unexpected")
+            raise exceptions.UserFacingError("failed")
+
+        m_process_entitlement_delta.side_effect = (
+            fake_process_entitlement_delta
+        )
+        new_entitlements = dict(
+            (name, {"entitlement": {"type": name, "entitled": True}})
+            for name in ("esm-infra", "livepatch")
+        )
+
+        with pytest.raises(exceptions.UserFacingError) as excinfo:
+            process_entitlements_delta(
+                {}, new_entitlements, allow_enable=False
+            )
+
+        assert MESSAGE_UNEXPECTED_ERROR == excinfo.value.msg
+        assert 2 == m_process_entitlement_delta.call_count
+
+
+class TestEntitlementDeltaLanes:
+    def entitlements(self, *names):
+        return dict(
+            (name, {"entitlement": {"type": name, "entitled": True}})
+            for name in names
+        )
+
+    def test_livepatch_gets_its_own_lane(self):
+        new = self.entitlements("esm-infra", "livepatch", "support")
+
+        assert [
+            ["esm-infra", "support"],
+            ["livepatch"],
+        ] == _entitlement_delta_lanes({}, new)
+
+    def test_incompatible_services_with_deltas_share_a_lane(self):
+        new = self.entitlements("esm-infra", "fips", "livepatch")
+        past = {"esm-infra": new["esm-infra"]}
+
+        assert [["esm-infra", "fips", "livepatch"]] == (
+            _entitlement_delta_lanes(past, new)
+        )
+
+    def test_incompatible_services_without_deltas_stay_apart(self):
+        new = self.entitlements("fips", "livepatch")
+        past = {"fips": copy.deepcopy(new["fips"])}
+
+        assert [["fips"], ["livepatch"]] == _entitlement_delta_lanes(past, new)
+
+
+@mock.patch(M_PATH + "util.get_machine_id", return_value="new-mid")
+class TestReattachWithContractToken:
+    @mock.patch(M_PATH + "process_entitlements_delta")
+    @mock.patch.object(UAContractClient, "request_contract_machine_attach")
+    @mock.patch.object(UAContractClient, "detach_machine_from_contract")
+    def test_swaps_machine_token_and_applies_its_deltas(
+        self,
+        m_detach,
+        m_attach,
+        m_process_entitlements_delta,
+        _get_machine_id,
+        FakeConfig,
+    ):
+        """The new token is applied as a delta, then the old one detached."""
+        orig_token = fakes.fake_machine_token(["esm-infra"])
+        orig_token["machineTokenInfo"]["machineId"] = "old-mid"
+        new_token = fakes.fake_machine_token(
+            ["esm-infra"], machine_token="new-machine-token"
+        )
+        new_token["resourceTokens"][0]["token"] = "new-esm-infra-token"
+        cfg = FakeConfig.for_attached_machine(machine_token=orig_token)
+        orig_entitlements = copy.deepcopy(cfg.entitlements)
+        calls = []
+        m_detach.side_effect = lambda *args, **kwargs: calls.append("detach")
+
+        def fake_attach(contract_token):
+            calls.append("attach")
+            cfg.write_cache("machine-token", new_token)
+            return new_token
+
+        m_attach.side_effect = fake_attach
+
+        with mock.patch(M_PATH + "_update_machine_token_credentials"):
+            reattach_with_contract_token(cfg, "ctoken", allow_enable=True)
+
+        assert ["attach", "detach"] == calls
+        assert [
+            mock.call("machine-token", "cid", machine_id="old-mid")
+        ] == m_detach.call_args_list
+        assert [
+            mock.call(
+                orig_entitlements,
+                cfg.entitlements,
+                True,
+                series_overrides=False,
+            )
+        ] == m_process_entitlements_delta.call_args_list
+        assert "new-esm-infra-token" == (
+            cfg.entitlements["esm-infra"]["resourceToken"]
+        )
+
+    @pytest.mark.parametrize("orig_machine_id", (None, "new-mid"))
+    @mock.patch(M_PATH + "_process_new_machine_token")
+    @mock.patch.object(UAContractClient, "request_contract_machine_attach")
+    @mock.patch.object(UAContractClient, "detach_machine_from_contract")
+    def test_old_token_of_same_or_unknown_machine_is_not_detached(
+        self,
+        m_detach,
+        m_attach,
+        _process_new_machine_token,
+        _get_machine_id,
+        orig_machine_id,
+        FakeConfig,
+    ):
+        """Detaching it would detach the new attachment of this machine."""
+        orig_token = fakes.fake_machine_token(["esm-infra"])
+        if orig_machine_id:
+            orig_token["machineTokenInfo"]["machineId"] = orig_machine_id
+        cfg = FakeConfig.for_attached_machine(machine_token=orig_token)
+
+        reattach_with_contract_token(cfg, "ctoken")
+
+        assert 0 == m_detach.call_count
+
+    @mock.patch(M_PATH + "_process_new_machine_token")
+    @mock.patch.object(UAContractClient, "request_contract_machine_attach")
+    @mock.patch.object(UAContractClient, "detach_machine_from_contract")
+    def test_failure_to_detach_old_token_is_logged(
+        self,
+        m_detach,
+        m_attach,
+        process_new_machine_token,
+        _get_machine_id,
+        FakeConfig,
+        caplog_text,
+    ):
+        orig_token = fakes.fake_machine_token(["esm-infra"])
+        orig_token["machineTokenInfo"]["machineId"] = "old-mid"
+        cfg = FakeConfig.for_attached_machine(machine_token=orig_token)
+        m_detach.side_effect = util.UrlError("Not found", code=404)
+
+        reattach_with_contract_token(cfg, "ctoken")
+
+        assert 1 == process_new_machine_token.call_count
+        assert "Failed to detach replaced machine token" in caplog_text()
+
+    @mock.patch(M_PATH + "process_entitlements_delta")
+    @mock.patch.object(UAContractClient, "request_contract_machine_attach")
+    @mock.patch.object(UAContractClient, "detach_machine_from_contract")
+    def test_invalid_token_keeps_old_machine_token(
+        self,
+        m_detach,
+        m_attach,
+        m_process_entitlements_delta,
+        _get_machine_id,
+        FakeConfig,
+    ):
+        orig_token = fakes.fake_machine_token(["esm-infra"])
+        orig_token["machineTokenInfo"]["machineId"] = "old-mid"
+        cfg = FakeConfig.for_attached_machine(machine_token=orig_token)
+        m_attach.side_effect = ContractAPIError(
+            util.UrlError("Unauthorized", code=401), error_response={}
+        )
+
+        with pytest.raises(exceptions.UserFacingError) as excinfo:
+            reattach_with_contract_token(cfg, "ctoken")
+
+        assert MESSAGE_ATTACH_INVALID_TOKEN == excinfo.value.msg
+        assert orig_token == cfg.machine_token
+        assert 0 == m_detach.call_count
+        assert 0 == m_process_entitlements_delta.call_count
+
+    def test_unattached_machine_raises_runtime_error(
+        self, _get_machine_id, FakeConfig
+    ):
+        with pytest.raises(RuntimeError):
+            reattach_with_contract_token(FakeConfig(), "ctoken")
+
+
+class TestProcessNewMachineToken:
+    @pytest.mark.parametrize("orig_machine_token", ("old", "new"))
+    @mock.patch("uaclient.apt.update_apt_auth_credentials")
+    @mock.patch(
+        "uaclient.entitlements.repo.RepoEntitlement.application_status",
+        return_value=(ApplicationStatus.ENABLED, ""),
+    )
+    @mock.patch(M_PATH + "process_entitlements_delta")
+    @mock.patch(
+        "uaclient.util.get_platform_info", return_value={"series": "xenial"}
+    )
+    def test_new_machine_token_rewrites_credentials_it_is_used_as(
+        self,
+        _get_platform_info,
+        _process_entitlements_delta,
+        _application_status,
+        update_apt_auth_credentials,
+        orig_machine_token,
+        FakeConfig,
+    ):
+        """Services without a resourceToken use the machine token for auth."""
+        token = fakes.fake_machine_token(
+            ["esm-apps", "esm-infra"], machine_token="new"
+        )
+        token["resourceTokens"] = [
+            t for t in token["resourceTokens"] if t["type"] == "esm-apps"
+        ]
+        cfg = FakeConfig.for_attached_machine(machine_token=token)
+
+        _process_new_machine_token(
+            cfg, {}, token, False, orig_machine_token=orig_machine_token
+        )
+
+        if orig_machine_token == "new":
+            assert 0 == update_apt_auth_credentials.call_count
+        else:
+            assert [
+                mock.call(
+                    fakes.SERVICE_DIRECTIVES["esm-infra"]["aptURL"], "new"
+                )
+            ] == update_apt_auth_credentials.call_args_list
+
+
 class TestGetAvailableResources:
     @mock.patch.object(UAContractClient, "request_resources")
     def test_request_resources_error_on_network_disconnected(
@@ -461,13 +778,13 @@ class TestRequestUpdatedContract:
                     }
                 },
                 allow_enable=False,
-                series_overrides=True,
+                series_overrides=False,
             ),
             mock.call(
                 {"entitlement": {"entitled": False, "type": "ent2"}},
                 {"entitlement": {"entitled": False, "type": "ent2"}},
                 allow_enable=False,
-                series_overrides=True,
+                series_overrides=False,
             ),
         ]
         assert process_calls == process_entitlement_delta.call_args_list
@@ -512,3 +829,402 @@ class TestRequestUpdatedContract:
 
         # No deltas are processed when contract is expired
         assert 0 == process_entitlement_delta.call_count
+
+
+@mock.patch(M_PATH + "_process_new_machine_token")
+@mock.patch(M_PATH + "UAContractClient")
+class TestSingleFlightRefresh:
+    def test_repeated_refreshes_share_the_first(
+        self, m_client, m_process_token, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine()
+        refresh = m_client.return_value.request_machine_token_update
+        refresh.return_value = {"machineToken": "new-token"}
+
+        request_updated_contract(cfg)
+        request_updated_contract(cfg)
+
+        assert 1 == refresh.call_count
+        assert 1 == m_process_token.call_count
+
+    def test_concurrent_refreshes_wait_for_the_one_in_flight(
+        self, m_client, m_process_token, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine()
+        in_flight = threading.Event()
+        release = threading.Event()
+
+        def slow_refresh(machine_token, contract_id):
+            in_flight.set()
+            assert release.wait(5)
+            return {"machineToken": machine_token}
+
+        m_client.return_value.request_machine_token_update.side_effect = (
+            slow_refresh
+        )
+        first = threading.Thread(target=request_updated_contract, args=(cfg,))
+        first.start()
+        assert in_flight.wait(5)
+        second = threading.Thread(target=request_updated_contract, args=(cfg,))
+        second.start()
+        second.join(0.1)
+        assert second.is_alive(), "did not wait for the refresh in flight"
+        release.set()
+        first.join(5)
+        second.join(5)
+
+        assert 1 == m_process_token.call_count
+
+    def test_failures_are_not_reused(
+        self, m_client, m_process_token, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine()
+        refresh = m_client.return_value.request_machine_token_update
+        refresh.side_effect = util.UrlError("offline")
+
+        for _ in range(2):
+            with pytest.raises(util.UrlError):
+                request_updated_contract(cfg)
+
+        assert 2 == refresh.call_count
+        assert 0 == m_process_token.call_count
+
+    @pytest.mark.parametrize("fail_in", ("request", "deltas"))
+    def test_failures_are_shared_with_waiting_callers(
+        self, m_client, m_process_token, fail_in, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine()
+        in_flight = threading.Event()
+        release = threading.Event()
+        error = exceptions.UserFacingError("failed " + fail_in)
+
+        def slow_refresh(machine_token, contract_id):
+            in_flight.set()
+            assert release.wait(5)
+            if fail_in == "request":
+                raise error
+            return {"machineToken": machine_token}
+
+        m_client.return_value.request_machine_token_update.side_effect = (
+            slow_refresh
+        )
+        m_process_token.side_effect = error
+        errors = []
+
+        def refresh():
+            try:
+                request_updated_contract(cfg)
+            except exceptions.UserFacingError as e:
+                errors.append(e)
+
+        first = threading.Thread(target=refresh)
+        first.start()
+        assert in_flight.wait(5)
+        second = threading.Thread(target=refresh)
+        second.start()
+        second.join(0.1)
+        release.set()
+        first.join(5)
+        second.join(5)
+
+        assert [error, error] == errors
+        assert (
+            1 == m_client.return_value.request_machine_token_update.call_count
+        )
+
+    def test_refreshes_during_delta_processing_do_not_block(
+        self, m_client, m_process_token, FakeConfig
+    ):
+        """Entitlements enabled by the delta pass may ask for a refresh."""
+        cfg = FakeConfig.for_attached_machine()
+        refresh = m_client.return_value.request_machine_token_update
+        refresh.return_value = {"machineToken": "new-token"}
+        m_process_token.side_effect = lambda cfg, *args, **kwargs: (
+            request_updated_contract(cfg)
+        )
+
+        request_updated_contract(cfg)
+
+        assert 1 == refresh.call_count
+
+    def test_forgotten_refreshes_are_not_shared(
+        self, m_client, m_process_token, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine()
+        refresh = m_client.return_value.request_machine_token_update
+        refresh.return_value = {"machineToken": "new-token"}
+
+        request_updated_contract(cfg)
+        forget_contract_refresh(cfg)
+        request_updated_contract(cfg)
+
+        assert 2 == refresh.call_count
+
+    def test_completed_refreshes_expire(
+        self, m_client, m_process_token, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine()
+        refresh = m_client.return_value.request_machine_token_update
+        refresh.return_value = {"machineToken": "new-token"}
+
+        with mock.patch(M_PATH + "time.monotonic", return_value=1000):
+            request_updated_contract(cfg)
+        with mock.patch(M_PATH + "time.monotonic", return_value=1060):
+            request_updated_contract(cfg)
+
+        assert 2 == refresh.call_count
+
+
+class TestRefreshSlot:
+    def test_slot_is_stable_and_within_one_interval(self):
+        now = datetime(2020, 6, 1, 12, 0, 0)
+
+        slot = refresh_slot("machine-1", 3600, now)
+
+        assert now - timedelta(seconds=3600) < slot <= now
+        assert slot == refresh_slot("machine-1", 3600, now)
+        assert slot == refresh_slot(
+            "machine-1", 3600, slot + timedelta(seconds=3599)
+        )
+        assert slot + timedelta(seconds=3600) == refresh_slot(
+            "machine-1", 3600, slot + timedelta(seconds=3600)
+        )
+
+    def test_machines_are_spread_across_the_interval(self):
+        now = datetime(2020, 6, 1, 12, 0, 0)
+
+        slots = set(
+            refresh_slot("machine-{}".format(i), 3600, now) for i in range(50)
+        )
+
+        assert len(slots) > 40
+
+
+@mock.patch(M_PATH + "util.get_machine_id", return_value="mid")
+@mock.patch(M_PATH + "request_updated_contract")
+class TestScheduledRefresh:
+
+    now = datetime(2020, 6, 1, 12, 0, 0)
+
+    def test_refresh_when_never_refreshed(
+        self, request_updated_contract, _get_machine_id, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine()
+
+        assert scheduled_refresh(cfg, now=self.now)
+        assert [mock.call(cfg)] == request_updated_contract.call_args_list
+
+    def test_skip_when_refreshed_since_latest_slot(
+        self, request_updated_contract, _get_machine_id, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine()
+        slot = refresh_slot("mid", cfg.refresh_interval, self.now)
+        cfg.write_cache("refresh-state", {"lastSuccess": slot, "failures": 0})
+
+        assert not scheduled_refresh(cfg, now=self.now)
+        assert 0 == request_updated_contract.call_count
+
+    def test_refresh_when_last_success_before_latest_slot(
+        self, request_updated_contract, _get_machine_id, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine()
+        slot = refresh_slot("mid", cfg.refresh_interval, self.now)
+        cfg.write_cache(
+            "refresh-state",
+            {"lastSuccess": slot - timedelta(seconds=1), "failures": 0},
+        )
+
+        assert scheduled_refresh(cfg, now=self.now)
+
+    @pytest.mark.parametrize(
+        "failures,headers,expected_delay",
+        (
+            (0, {}, 300),
+            (2, {}, 1200),
+            (10, {}, 6 * 60 * 60),
+            (0, {"Retry-After": "900"}, 900),
+            (2, {"Retry-After": "60"}, 1200),
+            (0, {"Retry-After": "Mon, 01 Jun 2020 13:00:00 GMT"}, 3600),
+        ),
+    )
+    def test_failures_back_off_and_honour_retry_after(
+        self,
+        request_updated_contract,
+        _get_machine_id,
+        failures,
+        headers,
+        expected_delay,
+        FakeConfig,
+    ):
+        cfg = FakeConfig.for_attached_machine()
+        cfg.write_cache("refresh-state", {"failures": failures})
+        request_updated_contract.side_effect = util.UrlError(
+            "Too many requests", code=429, headers=headers
+        )
+
+        with pytest.raises(util.UrlError):
+            scheduled_refresh(cfg, now=self.now)
+
+        state = cfg.read_cache("refresh-state")
+        assert failures + 1 == state["failures"]
+        assert self.now == state["lastFailure"]
+        assert self.now + timedelta(seconds=expected_delay) == state["retryAt"]
+
+    def test_delta_failures_back_off(
+        self, request_updated_contract, _get_machine_id, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine()
+        request_updated_contract.side_effect = exceptions.UserFacingError(
+            "apt failed"
+        )
+
+        with pytest.raises(exceptions.UserFacingError):
+            scheduled_refresh(cfg, now=self.now)
+
+        state = cfg.read_cache("refresh-state")
+        assert 1 == state["failures"]
+        assert self.now == state["lastFailure"]
+        assert self.now + timedelta(seconds=300) == state["retryAt"]
+
+    def test_skip_while_backing_off(
+        self, request_updated_contract, _get_machine_id, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine()
+        cfg.write_cache(
+            "refresh-state",
+            {"failures": 1, "retryAt": self.now + timedelta(seconds=1)},
+        )
+
+        assert not scheduled_refresh(cfg, now=self.now)
+        assert 0 == request_updated_contract.call_count
+
+
+class TestRecordRefreshSuccess:
+    @mock.patch("uaclient.util.get_machine_id", return_value="mid")
+    @mock.patch(M_PATH + "process_entitlements_delta")
+    @mock.patch(M_PATH + "UAContractClient")
+    def test_successful_refresh_resets_refresh_state(
+        self, client, _process_entitlements_delta, _get_machine_id, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine()
+        cfg.write_cache("refresh-state", {"failures": 3})
+
+        def fake_contract_client(cfg):
+            fake_client = FakeContractClient(cfg)
+            fake_client._responses = {
+                FakeContractClient.refresh_route: cfg.machine_token
+            }
+            return fake_client
+
+        client.side_effect = fake_contract_client
+        request_updated_contract(cfg)
+
+        state = cfg.read_cache("refresh-state")
+        assert 0 == state["failures"]
+        assert isinstance(state["lastSuccess"], datetime)
+
+    @mock.patch(
+        "uaclient.util.get_platform_info",
+        side_effect=lambda: {"series": "xenial", "arch": "amd64"},
+    )
+    @mock.patch("uaclient.util.get_machine_id", return_value="mid")
+    @mock.patch(M_PATH + "process_entitlements_delta")
+    @mock.patch(M_PATH + "UAContractClient")
+    def test_failed_delta_processing_is_not_a_success(
+        self,
+        client,
+        process_entitlements_delta,
+        _get_machine_id,
+        _get_platform_info,
+        FakeConfig,
+    ):
+        cfg = FakeConfig.for_attached_machine()
+        cfg.write_cache("refresh-state", {"failures": 3})
+        process_entitlements_delta.side_effect = exceptions.UserFacingError(
+            "apt failed"
+        )
+
+        def fake_contract_client(cfg):
+            fake_client = FakeContractClient(cfg)
+            fake_client._responses = {
+                FakeContractClient.refresh_route: cfg.machine_token
+            }
+            return fake_client
+
+        client.side_effect = fake_contract_client
+        with pytest.raises(exceptions.UserFacingError):
+            request_updated_contract(cfg)
+
+        assert {"failures": 3} == cfg.read_cache("refresh-state")
+
+
+class TestAttachWithContractBundle:
+    @mock.patch(M_PATH + "process_entitlements_delta")
+    @mock.patch(M_PATH + "UAContractClient")
+    def test_caches_bundled_machine_token_without_network(
+        self, client, process_entitlements_delta, tmpdir, FakeConfig
+    ):
+        machine_token = fakes.fake_machine_token(["esm-infra"])
+        del machine_token["availableResources"]
+        resources = fakes.fake_available_resources(["esm-infra"])
+        path = tmpdir.join("bundle.json")
+        path.write(
+            json.dumps(bundle.create_contract_bundle(machine_token, resources))
+        )
+        cfg = FakeConfig()
+
+        attach_with_contract_bundle(
+            cfg, path.strpath, allow_enable=True, allow_unsigned=True
+        )
+
+        assert 0 == client.call_count
+        assert "machine-token" == cfg.machine_token["machineToken"]
+        assert resources == cfg.machine_token["availableResources"]
+        assert [
+            mock.call({}, cfg.entitlements, True, series_overrides=False)
+        ] == process_entitlements_delta.call_args_list
+
+    def test_invalid_bundle_leaves_machine_unattached(
+        self, tmpdir, FakeConfig
+    ):
+        path = tmpdir.join("bundle.json")
+        path.write("{}")
+        cfg = FakeConfig()
+
+        with pytest.raises(exceptions.UserFacingError):
+            attach_with_contract_bundle(cfg, path.strpath)
+
+        assert not cfg.is_attached
+
+    @pytest.mark.parametrize("machine_token", ("x", {"machineToken": "x"}))
+    def test_malformed_machine_token_leaves_machine_unattached(
+        self, machine_token, tmpdir, FakeConfig
+    ):
+        path = tmpdir.join("bundle.json")
+        path.write(
+            json.dumps(bundle.create_contract_bundle(machine_token, []))
+        )
+        cfg = FakeConfig()
+
+        with pytest.raises(exceptions.UserFacingError):
+            attach_with_contract_bundle(cfg, path.strpath, allow_unsigned=True)
+
+        assert not cfg.is_attached
+
+    @mock.patch(M_PATH + "process_entitlements_delta")
+    def test_expired_bundle_leaves_machine_unattached(
+        self, process_entitlements_delta, tmpdir, FakeConfig
+    ):
+        machine_token = fakes.fake_machine_token(["esm-infra"])
+        contract_info = machine_token["machineTokenInfo"]["contractInfo"]
+        contract_info["effectiveTo"] = "2000-01-01T00:00:00Z"
+        path = tmpdir.join("bundle.json")
+        path.write(json.dumps(bundle.create_contract_bundle(machine_token)))
+        cfg = FakeConfig()
+
+        with pytest.raises(exceptions.UserFacingError) as excinfo:
+            attach_with_contract_bundle(cfg, path.strpath, allow_unsigned=True)
+
+        assert MESSAGE_CONTRACT_EXPIRED_ERROR == excinfo.value.msg
+        assert not cfg.is_attached
+        assert 0 == process_entitlements_delta.call_count
@@ -0,0 +1,187 @@
+import json
+
+import mock
+import pytest
+
+from uaclient import clouds, util
+from uaclient.contract import ContractAPIError, UAContractClient
+from uaclient.testing.contract_server import (
+    ContractServer,
+    ContractServerState,
+    run_load,
+)
+
+PLATFORM_INFO = {
+    "arch": "amd64",
+    "distribution": "Ubuntu",
+    "kernel": "4.4.0-00-generic",
+    "release": "16.04",
+    "series": "xenial",
+    "type": "Linux",
+    "version": "16.04 LTS (Xenial Xerus)",
+}
+
+
+@pytest.fixture(autouse=True)
+def platform_info():
+    with mock.patch(
+        "uaclient.util.get_platform_info",
+        side_effect=lambda: dict(PLATFORM_INFO),
+    ):
+        with mock.patch(
+            "uaclient.serviceclient.version.get_version", return_value="1.0"
+        ):
+            yield
+
+
+@pytest.fixture
+def contract_server():
+    servers = []
+
+    def factory(**kwargs):
+        srv = ContractServer(ContractServerState(**kwargs))
+        srv.start()
+        servers.append(srv)
+        return srv
+
+    yield factory
+    for srv in servers:
+        srv.stop()
+
+
+@pytest.fixture
+def client(FakeConfig):
+    def factory(srv):
+        cfg = FakeConfig()
+        cfg.cfg["contract_url"] = srv.url
+        return UAContractClient(cfg)
+
+    return factory
+
+
+class TestContractServer:
+    def test_attach_refresh_and_detach(self, contract_server, client):
+        srv = contract_server()
+        ua_client = client(srv)
+
+        token = ua_client.request_contract_machine_attach(
+            contract_token="ctoken", machine_id="mid"
+        )
+        contract_id = token["machineTokenInfo"]["contractInfo"]["id"]
+        refreshed = ua_client.request_machine_token_update(
+            machine_token=token["machineToken"],
+            contract_id=contract_id,
+            machine_id="mid",
+        )
+        ua_client.detach_machine_from_contract(
+            machine_token=token["machineToken"],
+            contract_id=contract_id,
+            machine_id="mid",
+        )
+
+        assert "mid" == token["machineTokenInfo"]["machineId"]
+        assert token["machineToken"] == refreshed["machineToken"]
+        assert "Fri, 31 Dec 2999 00:00:00 GMT" == refreshed["expires"]
+        assert {} == srv.state.machines
+        assert {"attach": 1, "refresh": 1, "detach": 1} == dict(
+            srv.state.requests
+        )
+
+    def test_attach_with_invalid_token_is_unauthorized(
+        self, contract_server, client
+    ):
+        srv = contract_server(valid_tokens=["good"])
+
+        with pytest.raises(ContractAPIError) as excinfo:
+            client(srv).request_contract_machine_attach(
+                contract_token="bad", machine_id="mid"
+            )
+
+        assert 401 == excinfo.value.code
+        assert "invalid-token" in excinfo.value
+
+    def test_refresh_of_unknown_machine_is_unauthorized(
+        self, contract_server, client
+    ):
+        srv = contract_server()
+
+        with pytest.raises(ContractAPIError) as excinfo:
+            client(srv).request_machine_token_update(
+                machine_token="mtoken", contract_id="cid", machine_id="mid"
+            )
+
+        assert 401 == excinfo.value.code
+
+    def test_resources_and_auto_attach_token(self, contract_server, client):
+        srv = contract_server()
+        ua_client = client(srv)
+        instance = mock.Mock(
+            spec=clouds.AutoAttachCloudInstance,
+            cloud_type="aws",
+            identity_doc={"pkcs7": "doc"},
+        )
+
+        resources = ua_client.request_resources()
+        token = ua_client.request_auto_attach_contract_token(instance=instance)
+
+        assert {"esm-infra", "livepatch"}.issubset(
+            r["name"] for r in resources["resources"]
+        )
+        assert {"contractToken": "contract-token-aws"} == token
+
+    def test_payload_size_inflates_machine_token(
+        self, contract_server, client
+    ):
+        srv = contract_server(payload_size=20000)
+
+        token = client(srv).request_contract_machine_attach(
+            contract_token="ctoken", machine_id="mid"
+        )
+
+        assert len(json.dumps(token)) >= 20000
+
+    def test_rate_limit_responds_429_once_exceeded(
+        self, contract_server, client
+    ):
+        srv = contract_server(rate_limit=1, retry_after=7)
+        ua_client = client(srv)
+        ua_client.request_resources()
+
+        with pytest.raises(util.UrlError) as excinfo:
+            ua_client.request_resources()
+
+        assert 429 == excinfo.value.code
+        assert {200: 1, 429: 1} == dict(srv.state.responses)
+
+    def test_error_rate_injects_error_code(self, contract_server, client):
+        srv = contract_server(error_rate=1, error_code=500)
+
+        with pytest.raises(util.UrlError) as excinfo:
+            client(srv).request_resources()
+
+        assert 500 == excinfo.value.code
+
+
+class TestRunLoad:
+    @pytest.mark.parametrize("scenario", ("attach", "refresh"))
+    def test_concurrent_clients(self, scenario, contract_server):
+        srv = contract_server()
+
+        result = run_load(srv.url, clients=3, requests=2, scenario=scenario)
+
+        assert 6 == result["succeeded"]
+        assert {} == result["errors"]
+        assert result["latency_max"] >= result["latency_median"]
+        assert 6 == srv.state.requests[scenario]
+
+    def test_errors_are_counted_by_status_code(self, contract_server):
+        srv = contract_server(error_rate=1)
+
+        result = run_load(srv.url, clients=2, requests=2)
+
+        assert 0 == result["succeeded"]
+        assert {"503": 4} == result["errors"]
+
+    def test_unknown_scenario_raises_value_error(self):
+        with pytest.raises(ValueError):
+            run_load("http://127.0.0.1:1", scenario="nope")
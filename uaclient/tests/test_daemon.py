@@ -0,0 +1,186 @@
+import datetime
+import os
+import threading
+
+import mock
+import pytest
+
+from uaclient import daemon, exceptions
+
+
+class FakeStatusConfig:
+    """Count status and help computations, writing the status-cache."""
+
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.calls = []
+
+    def data_path(self, key):
+        return os.path.join(self.data_dir, key)
+
+    def status(self, show_beta=False, local_only=False):
+        self.calls.append(("status", show_beta, local_only))
+        with open(self.data_path("status-cache"), "w") as stream:
+            stream.write(str(len(self.calls)))
+        return {
+            "calls": len(self.calls),
+            "expires": datetime.datetime(2020, 1, 2, 3, 4, 5),
+        }
+
+    def help(self, name):
+        self.calls.append(("help", name))
+        if name == "nope":
+            raise exceptions.UserFacingError("No help available for 'nope'")
+        if name == "broken":
+            raise RuntimeError("broken")
+        return {"name": name, "available": "yes"}
+
+
+@pytest.fixture
+def state(tmpdir):
+    configs = []
+
+    def cfg_factory():
+        configs.append(FakeStatusConfig(tmpdir.strpath))
+        return configs[-1]
+
+    config_file = tmpdir.join("uaclient.conf")
+    config_file.write("data_dir: {}\n".format(tmpdir.strpath))
+    with mock.patch.object(daemon, "DEFAULT_CONFIG_FILE", config_file.strpath):
+        with mock.patch.object(daemon, "WATCHED_FILES", []):
+            with mock.patch.object(daemon, "WATCHED_GLOBS", []):
+                state = daemon.DaemonState(cfg_factory)
+                state.configs = configs
+                yield state
+
+
+@pytest.fixture
+def server(state, tmpdir):
+    srv = daemon.DaemonServer(state, tmpdir.join("run", "ua.socket").strpath)
+    thread = threading.Thread(target=srv.serve_forever, args=(0.05,))
+    thread.start()
+    yield srv
+    srv.shutdown()
+    srv.server_close()
+    thread.join()
+
+
+class TestDaemonState:
+    def test_responses_are_kept_per_query(self, state):
+        first = state.query("status", {})
+
+        assert first == state.query("status", {})
+        assert 1 == first["calls"]
+        assert 2 == state.query("status", {"show_beta": True})["calls"]
+        assert 1 == len(state.configs)
+
+    def test_watched_file_changes_start_over(self, state, tmpdir):
+        state.query("status", {})
+        tmpdir.join("machine-token").write("{}")
+
+        assert 1 == state.query("status", {})["calls"]
+        assert 2 == len(state.configs)
+
+    def test_other_writers_of_the_status_cache_start_over(self, state, tmpdir):
+        state.query("status", {})
+        tmpdir.join("status-cache").write("written by ua enable")
+
+        state.query("status", {})
+
+        assert 2 == len(state.configs)
+
+    def test_new_livepatch_modules_start_over(self, state, tmpdir):
+        sysfs_dir = tmpdir.mkdir("livepatch")
+        pattern = sysfs_dir.join("*").strpath
+        with mock.patch.object(daemon, "WATCHED_GLOBS", [pattern]):
+            state.query("status", {})
+            sysfs_dir.mkdir("lkp_Ubuntu_5_4_0_1_generic_70")
+
+            state.query("status", {})
+
+        assert 2 == len(state.configs)
+
+    def test_responses_expire_after_max_age(self, state):
+        state.max_age = 10
+        with mock.patch("uaclient.daemon.time.monotonic", return_value=100):
+            state.query("status", {})
+        with mock.patch("uaclient.daemon.time.monotonic", return_value=111):
+            state.query("status", {})
+
+        assert 2 == len(state.configs)
+
+    def test_unknown_query_raises(self, state):
+        with pytest.raises(exceptions.UserFacingError) as excinfo:
+            state.query("attach", {})
+
+        assert "Unknown ua daemon query: attach" == excinfo.value.msg
+
+    @pytest.mark.parametrize(
+        "method,params,invalid",
+        (
+            ("help", {"unexpected": "param"}, "unexpected"),
+            ("status", {"show_beta": "yes"}, "show_beta"),
+            ("status", {"cfg": None}, "cfg"),
+        ),
+    )
+    def test_unexpected_params_raise(self, method, params, invalid, state):
+        with pytest.raises(exceptions.UserFacingError) as excinfo:
+            state.query(method, params)
+
+        assert (
+            "Invalid ua daemon {} query parameter: {}".format(method, invalid)
+            == excinfo.value.msg
+        )
+        assert [] == state.configs
+
+
+class TestQuery:
+    def test_status_is_served_with_datetimes(self, server):
+        result = daemon.query(
+            "status", {"show_beta": True}, socket_path=server.socket_path
+        )
+
+        assert datetime.datetime(2020, 1, 2, 3, 4, 5) == result["expires"]
+        assert [("status", True, False)] == server.state.configs[0].calls
+        assert 0o600 == os.stat(server.socket_path).st_mode & 0o777
+
+    def test_help_is_served_as_ordered_pairs(self, server):
+        assert [["name", "esm-infra"], ["available", "yes"]] == daemon.query(
+            "help", {"name": "esm-infra"}, socket_path=server.socket_path
+        )
+
+    def test_user_facing_errors_are_raised(self, server):
+        with pytest.raises(exceptions.UserFacingError) as excinfo:
+            daemon.query(
+                "help", {"name": "nope"}, socket_path=server.socket_path
+            )
+
+        assert "No help available for 'nope'" == excinfo.value.msg
+
+    @pytest.mark.parametrize(
+        "method,params", (("help", {"name": "broken"}), ("help", {}))
+    )
+    def test_failed_queries_are_unavailable(self, method, params, server):
+        with pytest.raises(daemon.DaemonUnavailable):
+            daemon.query(method, params, socket_path=server.socket_path)
+
+    def test_missing_socket_is_unavailable(self, tmpdir):
+        with pytest.raises(daemon.DaemonUnavailable):
+            daemon.query("status", socket_path=tmpdir.join("no").strpath)
+
+    def test_socket_of_other_users_is_not_trusted(self, server):
+        st_mode = os.stat(server.socket_path).st_mode
+        with mock.patch("uaclient.daemon.os.getuid", return_value=1000):
+            with mock.patch("uaclient.daemon.os.stat") as m_stat:
+                m_stat.return_value.st_mode = st_mode
+                m_stat.return_value.st_uid = 1001
+                with pytest.raises(daemon.DaemonUnavailable):
+                    daemon.query("status", socket_path=server.socket_path)
+
+        assert [] == server.state.configs
+
+    def test_server_close_removes_socket(self, state, tmpdir):
+        srv = daemon.DaemonServer(state, tmpdir.join("ua.socket").strpath)
+        srv.server_close()
+
+        assert not os.path.exists(srv.socket_path)
@@ -0,0 +1,128 @@
+import json
+import os
+import threading
+
+import mock
+import pytest
+
+from uaclient import events, exceptions
+
+
+@pytest.fixture
+def event_file(tmpdir):
+    path = tmpdir.join("events.ndjson")
+    events.start_stream(path=path.strpath)
+    yield path
+    events.stop_stream()
+
+
+def read_events(path):
+    return [json.loads(line) for line in path.read().splitlines()]
+
+
+class TestEmit:
+    def test_nothing_is_written_without_stream(self, tmpdir):
+        with events.phase("enable", service="esm-infra"):
+            pass
+
+        assert [] == tmpdir.listdir()
+
+    def test_events_are_json_lines(self, event_file):
+        events.emit("phase-start", phase="enable", service=None)
+
+        [event] = read_events(event_file)
+        assert "phase-start" == event["event"]
+        assert "enable" == event["phase"]
+        assert "service" not in event
+        assert os.getpid() == event["pid"]
+        assert event["timestamp"].endswith("Z")
+
+    def test_events_are_written_to_fd(self, tmpdir):
+        path = tmpdir.join("events.ndjson")
+        fd = os.open(path.strpath, os.O_WRONLY | os.O_CREAT)
+        events.start_stream(fd=fd)
+        try:
+            events.emit("phase-start", phase="attach")
+        finally:
+            events.stop_stream()
+
+        os.write(fd, b"fd still open\n")
+        os.close(fd)
+        event, line = path.read().splitlines()
+        assert "phase-start" == json.loads(event)["event"]
+        assert "fd still open" == line
+
+    def test_write_failures_are_ignored(self, event_file):
+        with mock.patch.object(events, "_stream") as m_stream:
+            m_stream.write.side_effect = OSError("broken pipe")
+            events.emit("phase-start", phase="attach")
+
+
+class TestPhase:
+    def test_nested_phases_report_service_and_outcome(self, event_file):
+        with mock.patch(
+            "uaclient.events.time.monotonic", side_effect=[1, 2, 3.5, 10]
+        ):
+            with events.phase("enable", service="esm-infra"):
+                with events.phase("apt-update") as result:
+                    result["outcome"] = events.OUTCOME_FAILED
+
+        assert [
+            ("phase-start", "enable", "esm-infra", None, None),
+            ("phase-start", "apt-update", "esm-infra", None, None),
+            ("phase-end", "apt-update", "esm-infra", "failed", 1.5),
+            ("phase-end", "enable", "esm-infra", "succeeded", 9),
+        ] == [
+            (
+                event["event"],
+                event["phase"],
+                event.get("service"),
+                event.get("outcome"),
+                event.get("duration"),
+            )
+            for event in read_events(event_file)
+        ]
+
+    @pytest.mark.parametrize(
+        "exc,error",
+        (
+            (exceptions.UserFacingError("apt failed"), "apt failed"),
+            (RuntimeError("token s3cr3t"), "RuntimeError"),
+        ),
+    )
+    def test_exceptions_fail_the_phase(self, exc, error, event_file):
+        with pytest.raises(type(exc)):
+            with events.phase("install-packages", service="cc-eal"):
+                raise exc
+
+        end = read_events(event_file)[-1]
+        assert ("failed", error) == (end["outcome"], end["error"])
+
+    def test_successful_exit_keeps_outcome(self, event_file):
+        with pytest.raises(SystemExit):
+            with events.phase("status"):
+                raise SystemExit(0)
+
+        end = read_events(event_file)[-1]
+        assert "succeeded" == end["outcome"]
+        assert "error" not in end
+
+    def test_service_is_kept_per_thread(self, event_file):
+        def other_phase():
+            with events.phase("install-snap"):
+                pass
+
+        with events.phase("enable", service="esm-infra"):
+            thread = threading.Thread(target=other_phase)
+            thread.start()
+            thread.join()
+
+        assert [
+            ("enable", "esm-infra"),
+            ("install-snap", None),
+            ("install-snap", None),
+            ("enable", "esm-infra"),
+        ] == [
+            (event["phase"], event.get("service"))
+            for event in read_events(event_file)
+        ]
@@ -0,0 +1,89 @@
+import json
+import os
+import sys
+
+import mock
+import pytest
+
+from uaclient import help_index
+
+HELP_YAML = """\
+esm-infra:
+    help: |
+      esm-infra help
+livepatch:
+    help: livepatch help
+"""
+
+
+@pytest.fixture(autouse=True)
+def clear_index():
+    help_index.clear_help_index()
+    yield
+    help_index.clear_help_index()
+
+
+@pytest.fixture
+def help_files(tmpdir):
+    help_file = tmpdir.join("help_data.yaml")
+    help_file.write(HELP_YAML)
+    index_file = tmpdir.join("help_data.json")
+    with mock.patch.object(help_index, "DEFAULT_HELP_FILE", help_file.strpath):
+        with mock.patch.object(
+            help_index, "DEFAULT_HELP_INDEX_FILE", index_file.strpath
+        ):
+            yield help_file, index_file
+
+
+class TestHelpIndex:
+    def test_compile_help_index(self, help_files):
+        help_file, _index_file = help_files
+
+        assert {
+            "esm-infra": "esm-infra help\n",
+            "livepatch": "livepatch help",
+        } == help_index.compile_help_index(help_file.strpath)
+
+    def test_main_writes_json_index(self, help_files):
+        help_file, index_file = help_files
+
+        assert 0 == help_index.main([help_file.strpath, index_file.strpath])
+
+        assert help_index.compile_help_index(help_file.strpath) == json.loads(
+            index_file.read()
+        )
+
+    def test_compiled_index_is_read_without_yaml(self, help_files):
+        help_file, index_file = help_files
+        index_file.write(json.dumps({"esm-infra": "compiled help"}))
+
+        with mock.patch.dict(sys.modules, {"yaml": None}):
+            assert "compiled help" == help_index.get_help("esm-infra")
+
+    def test_yaml_is_parsed_when_index_is_stale(self, help_files):
+        help_file, index_file = help_files
+        index_file.write(json.dumps({"esm-infra": "stale help"}))
+        os.utime(index_file.strpath, (0, 0))
+
+        assert "esm-infra help\n" == help_index.get_help("esm-infra")
+
+    def test_yaml_is_parsed_when_index_is_invalid(self, help_files):
+        help_file, index_file = help_files
+        index_file.write("{")
+
+        assert "livepatch help" == help_index.get_help("livepatch")
+
+    def test_no_help_without_help_files(self, help_files):
+        help_file, _index_file = help_files
+        help_file.remove()
+
+        assert "" == help_index.get_help("esm-infra")
+
+    def test_index_is_loaded_once_per_process(self, help_files):
+        with mock.patch.object(
+            help_index, "_load_help_index", return_value={"cis": "cis help"}
+        ) as m_load:
+            assert "cis help" == help_index.get_help("cis")
+            assert "" == help_index.get_help("esm-infra")
+
+        assert 1 == m_load.call_count
@@ -0,0 +1,131 @@
+import json
+import os
+
+import mock
+
+from uaclient import journal
+
+PHASES = [
+    {
+        "event": "phase-end",
+        "phase": "apt-update",
+        "service": "esm-infra",
+        "duration": 3.0,
+        "outcome": "succeeded",
+        "pid": 1,
+        "timestamp": "2020-07-01T12:00:03.000000Z",
+    },
+    {
+        "event": "phase-end",
+        "phase": "enable",
+        "duration": 4.0,
+        "outcome": "failed",
+        "error": "apt failed",
+        "pid": 1,
+        "timestamp": "2020-07-01T12:00:04.000000Z",
+    },
+]
+
+
+class TestRecordOperation:
+    def test_entry_summarises_phases(self, FakeConfig):
+        cfg = FakeConfig()
+
+        journal.record_operation(
+            cfg, "enable", "2020-07-01T12:00:00.000000Z", PHASES
+        )
+
+        [entry] = journal.read_entries(cfg)
+        assert {
+            "operation": "enable",
+            "started": "2020-07-01T12:00:00.000000Z",
+            "finished": "2020-07-01T12:00:04.000000Z",
+            "duration": 4.0,
+            "outcome": "failed",
+            "error": "apt failed",
+            "phases": [
+                {
+                    "phase": "apt-update",
+                    "service": "esm-infra",
+                    "duration": 3.0,
+                    "outcome": "succeeded",
+                }
+            ],
+        } == entry
+        path = journal.journal_path(cfg)
+        assert 0o644 == os.stat(path).st_mode & 0o777
+
+    def test_journal_survives_detach(self, FakeConfig):
+        cfg = FakeConfig()
+        journal.append_entry(cfg, {"operation": "attach"})
+
+        cfg.delete_cache()
+
+        assert [{"operation": "attach"}] == journal.read_entries(cfg)
+
+    def test_full_journal_is_rotated(self, FakeConfig):
+        cfg = FakeConfig()
+        with mock.patch.object(journal, "JOURNAL_MAX_BYTES", 30):
+            for operation in ("attach", "enable", "refresh"):
+                journal.append_entry(cfg, {"operation": operation})
+
+        path = journal.journal_path(cfg)
+        assert ["refresh"] == [
+            json.loads(line)["operation"] for line in open(path)
+        ]
+        # Only one rotated file is kept
+        assert ["enable", "refresh"] == [
+            entry["operation"] for entry in journal.read_entries(cfg)
+        ]
+
+    def test_truncated_lines_are_skipped(self, FakeConfig):
+        cfg = FakeConfig()
+        journal.append_entry(cfg, {"operation": "attach"})
+        with open(journal.journal_path(cfg), "a") as stream:
+            stream.write('{"operation": "ena')
+
+        assert [{"operation": "attach"}] == journal.read_entries(cfg)
+
+
+class TestSummarise:
+    def test_operations_and_phases_are_aggregated(self):
+        entries = [
+            {
+                "operation": "enable",
+                "finished": "t1",
+                "duration": 2.0,
+                "outcome": "succeeded",
+                "phases": [{"phase": "apt-update", "duration": 1.0}],
+            },
+            {
+                "operation": "enable",
+                "finished": "t2",
+                "duration": 4.0,
+                "outcome": "failed",
+                "phases": [
+                    {
+                        "phase": "apt-update",
+                        "duration": 3.0,
+                        "outcome": "succeeded",
+                    }
+                ],
+            },
+        ]
+
+        summary = journal.summarise(entries)
+
+        assert {
+            "runs": 2,
+            "failed": 1,
+            "average": 3.0,
+            "max": 4.0,
+            "last": "t2",
+        } == summary["operations"]["enable"]
+        assert {"runs": 2, "failed": 1, "average": 2.0, "max": 3.0} == (
+            summary["phases"]["apt-update"]
+        )
+
+    def test_format_empty_summary(self):
+        assert journal.MESSAGE_JOURNAL_EMPTY == journal.format_summary(
+            journal.summarise([])
+        )
@@ -0,0 +1,189 @@
+import copy
+import json
+import sys
+
+import mock
+import pytest
+
+from uaclient import manifest
+from uaclient.entitlements import ENTITLEMENT_CLASS_BY_NAME
+
+APT_URL = "https://esm.ubuntu.com"
+MACHINE_TOKEN = {
+    "availableResources": [],
+    "machineToken": "not-null",
+    "machineTokenInfo": {
+        "accountInfo": {"id": "acct-1", "name": "test_account"},
+        "contractInfo": {
+            "id": "cid",
+            "name": "test_contract",
+            "resourceEntitlements": [
+                {
+                    "type": "esm-infra",
+                    "entitled": True,
+                    "directives": {"aptURL": APT_URL},
+                }
+            ],
+        },
+    },
+}
+
+
+@pytest.fixture(autouse=True)
+def clear_manifest():
+    manifest.clear_manifest()
+    yield
+    manifest.clear_manifest()
+
+
+@pytest.fixture
+def apt_files(tmpdir):
+    """Point the esm-infra manifest entry at apt files in tmpdir."""
+    list_file = tmpdir.join("ubuntu-esm-infra.list")
+    pref_file = tmpdir.join("ubuntu-esm-infra")
+    entries = {
+        "esm-infra": {"files": [list_file.strpath, pref_file.strpath]},
+        "livepatch": {"files": []},
+    }
+    with mock.patch.object(manifest, "_manifest", entries):
+        yield list_file, pref_file
+
+
+class TestManifest:
+    def test_compile_manifest_describes_all_entitlements(self):
+        entries = manifest.compile_manifest()
+
+        assert sorted(ENTITLEMENT_CLASS_BY_NAME) == sorted(entries)
+        assert {
+            "title": "ESM Infra",
+            "origin": "UbuntuESM",
+            "package_system": "apt",
+            "is_beta": False,
+            "files": [
+                "/etc/apt/sources.list.d/ubuntu-esm-infra.list",
+                "/etc/apt/preferences.d/ubuntu-esm-infra",
+            ],
+        } == entries["esm-infra"]
+        assert [] == entries["livepatch"]["files"]
+        assert "snap" == entries["livepatch"]["package_system"]
+
+    def test_compiled_manifest_is_read_without_entitlements(self, tmpdir):
+        manifest_file = tmpdir.join("entitlements.json")
+        assert 0 == manifest.main(["compile", manifest_file.strpath])
+
+        with mock.patch.object(
+            manifest, "DEFAULT_MANIFEST_FILE", manifest_file.strpath
+        ):
+            with mock.patch.dict(sys.modules, {"uaclient.entitlements": None}):
+                entries = manifest.get_manifest()
+
+        assert json.loads(manifest_file.read()) == entries
+
+    def test_missing_manifest_is_compiled(self, tmpdir):
+        with mock.patch.object(
+            manifest, "DEFAULT_MANIFEST_FILE", tmpdir.join("nope").strpath
+        ):
+            assert manifest.compile_manifest() == manifest.get_manifest()
+
+    def test_main_prints_names(self, apt_files, capsys):
+        assert 0 == manifest.main(["names"])
+
+        assert "esm-infra livepatch\n" == capsys.readouterr()[0]
+
+
+@mock.patch(
+    "uaclient.util.get_platform_info", return_value={"series": "trusty"}
+)
+class TestIsEnabled:
+    @pytest.mark.parametrize(
+        "list_content,pref_content,enabled",
+        (
+            ("deb {}/ubuntu trusty-infra-security main\n", None, True),
+            ("deb {}/ubuntu/ trusty main\n", "", True),
+            ("deb {}/ubuntu trusty main\n", "Pin-Priority: 1001\n", True),
+            ("# deb {}/ubuntu trusty main\n", None, False),
+            ("deb {}/ubuntu trusty main\n", "Pin-Priority: never\n", False),
+            ("deb https://other/ubuntu trusty main\n", None, False),
+            ("deb\ndeb {}/ubuntu trusty main\n", None, True),
+            ("deb [arch=amd64] {}/ubuntu trusty main\n", None, True),
+            ("deb [ arch=amd64 ] {}/ubuntu trusty main\n", None, True),
+            ("deb [arch=amd64]\n", None, False),
+            ("deb-src {}/ubuntu trusty main\n", None, False),
+            (None, None, False),
+        ),
+    )
+    def test_repo_service_is_checked_against_apt_files(
+        self,
+        _m_platform_info,
+        list_content,
+        pref_content,
+        enabled,
+        apt_files,
+        FakeConfig,
+    ):
+        list_file, pref_file = apt_files
+        if list_content is not None:
+            list_file.write(list_content.format(APT_URL))
+        if pref_content is not None:
+            pref_file.write(pref_content)
+        cfg = FakeConfig.for_attached_machine(machine_token=MACHINE_TOKEN)
+
+        assert enabled is manifest.is_enabled("esm-infra", cfg)
+
+    def test_series_apt_url_is_read_without_platform_lookup(
+        self, m_platform_info, apt_files, FakeConfig
+    ):
+        list_file, _pref_file = apt_files
+        list_file.write("deb https://esm.trusty.example/ubuntu trusty main\n")
+        machine_token = copy.deepcopy(MACHINE_TOKEN)
+        contract_info = machine_token["machineTokenInfo"]["contractInfo"]
+        contract_info["resourceEntitlements"][0]["series"] = {
+            "trusty": {"directives": {"aptURL": "https://esm.trusty.example"}}
+        }
+        cfg = FakeConfig.for_attached_machine(machine_token=machine_token)
+
+        with mock.patch("uaclient.util.subp") as m_subp:
+            assert manifest.is_enabled("esm-infra", cfg)
+        assert 0 == m_subp.call_count
+        assert 0 == m_platform_info.call_count
+
+    def test_unattached_machine_has_nothing_enabled(
+        self, _m_platform_info, apt_files, FakeConfig
+    ):
+        list_file, _pref_file = apt_files
+        list_file.write("deb {}/ubuntu trusty main\n".format(APT_URL))
+
+        assert not manifest.is_enabled("esm-infra", FakeConfig())
+
+    @pytest.mark.parametrize(
+        "service_status,enabled", (("enabled", True), ("disabled", False))
+    )
+    def test_other_services_use_the_status_cache(
+        self, _m_platform_info, service_status, enabled, apt_files, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine(machine_token=MACHINE_TOKEN)
+        cfg.write_cache(
+            "status-cache",
+            {"services": [{"name": "livepatch", "status": service_status}]},
+        )
+
+        with mock.patch("uaclient.util.subp") as m_subp:
+            assert enabled is manifest.is_enabled("livepatch", cfg)
+        assert 0 == m_subp.call_count
+
+    def test_unknown_service_is_not_enabled(
+        self, _m_platform_info, apt_files, FakeConfig
+    ):
+        cfg = FakeConfig.for_attached_machine(machine_token=MACHINE_TOKEN)
+
+        assert not manifest.is_enabled("nope", cfg)
+        assert not manifest.is_enabled("livepatch", cfg)
+
+    @pytest.mark.parametrize("enabled,exit_code", ((True, 0), (False, 1)))
+    def test_main_exit_code(self, _m_platform_info, enabled, exit_code):
+        with mock.patch.object(
+            manifest, "is_enabled", return_value=enabled
+        ) as m_is_enabled:
+            assert exit_code == manifest.main(["is-enabled", "esm-infra"])
+
+        assert [mock.call("esm-infra")] == m_is_enabled.call_args_list
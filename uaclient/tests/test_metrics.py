@@ -0,0 +1,152 @@
+import datetime
+import os
+
+import mock
+
+from uaclient import metrics
+
+ATTACHED_STATUS = {
+    "attached": True,
+    "expires": datetime.datetime(2030, 1, 1),
+    "services": [
+        {"name": "esm-infra", "entitled": "yes", "status": "enabled"},
+        {"name": "fips", "entitled": "no", "status": "n/a"},
+    ],
+}
+
+
+def samples(content):
+    """Return the samples of metrics content keyed by series."""
+    return dict(
+        line.rsplit(" ", 1)
+        for line in content.splitlines()
+        if not line.startswith("#")
+    )
+
+
+class TestRenderMetrics:
+    def test_attached_status(self):
+        content = metrics.render_metrics(ATTACHED_STATUS)
+
+        result = samples(content)
+        assert "1.0" == result["ua_attached"]
+        assert "1893456000.0" == result["ua_contract_expiry_timestamp_seconds"]
+        assert "1.0" == result['ua_service_entitled{service="esm-infra"}']
+        assert "0.0" == result['ua_service_entitled{service="fips"}']
+        assert "0.0" == result['ua_service_applicable{service="fips"}']
+        assert (
+            "1.0"
+            == result[
+                'ua_service_status{service="esm-infra",status="enabled"}'
+            ]
+        )
+        assert (
+            "0.0"
+            == result['ua_service_status{service="esm-infra",status="n/a"}']
+        )
+        assert "# TYPE ua_service_status gauge" in content
+        assert "ua_last_refresh_success" not in content
+
+    def test_unattached_status_reports_availability(self):
+        content = metrics.render_metrics(
+            {
+                "attached": False,
+                "expires": "n/a",
+                "services": [{"name": "esm-infra", "available": "yes"}],
+            }
+        )
+
+        assert {
+            "ua_attached": "0.0",
+            'ua_service_applicable{service="esm-infra"}': "1.0",
+        } == samples(content)
+
+    def test_refresh_state_and_timings(self):
+        content = metrics.render_metrics(
+            {"attached": False},
+            refresh_state={
+                "lastSuccess": datetime.datetime(1970, 1, 1, 0, 0, 10),
+                "lastFailure": datetime.datetime(1970, 1, 1, 0, 0, 20),
+            },
+            timings={
+                "enable": {
+                    "duration": 12.5,
+                    "outcome": "failed",
+                    "finished": datetime.datetime(1970, 1, 1, 0, 1),
+                }
+            },
+        )
+
+        result = samples(content)
+        assert "20.0" == result["ua_last_refresh_timestamp_seconds"]
+        assert "0.0" == result["ua_last_refresh_success"]
+        assert (
+            "12.5"
+            == result['ua_operation_duration_seconds{operation="enable"}']
+        )
+        assert "0.0" == result['ua_operation_success{operation="enable"}']
+        assert (
+            "60.0"
+            == result['ua_operation_timestamp_seconds{operation="enable"}']
+        )
+
+
+class TestWriteMetrics:
+    def test_status_cache_writes_publish_metrics(self, tmpdir, FakeConfig):
+        metrics_file = tmpdir.join("node-exporter", "ua.prom")
+        metrics_file.dirpath().ensure(dir=True)
+        cfg = FakeConfig()
+        cfg.cfg["metrics_file"] = metrics_file.strpath
+
+        cfg.write_cache("status-cache", ATTACHED_STATUS)
+
+        assert "ua_attached 1.0" in metrics_file.read()
+        assert 0o644 == os.stat(metrics_file.strpath).st_mode & 0o777
+        assert not os.path.exists(metrics_file.strpath + ".tmp")
+
+    def test_refresh_state_changes_rewrite_metrics(self, tmpdir, FakeConfig):
+        metrics_file = tmpdir.join("ua.prom")
+        cfg = FakeConfig()
+        cfg.cfg["metrics_file"] = metrics_file.strpath
+        cfg.write_cache(
+            "refresh-state",
+            {"lastSuccess": datetime.datetime(2020, 6, 1), "failures": 0},
+        )
+        assert "ua_last_refresh_success 1.0" in metrics_file.read()
+
+        cfg.write_cache(
+            "refresh-state",
+            {
+                "lastSuccess": datetime.datetime(2020, 6, 1),
+                "lastFailure": datetime.datetime(2020, 6, 2),
+                "failures": 1,
+            },
+        )
+
+        assert "ua_last_refresh_success 0.0" in metrics_file.read()
+
+    def test_missing_collector_directory_disables_metrics(
+        self, tmpdir, FakeConfig
+    ):
+        cfg = FakeConfig()
+        cfg.cfg["metrics_file"] = tmpdir.join("missing", "ua.prom").strpath
+
+        cfg.write_cache("status-cache", ATTACHED_STATUS)
+
+        assert not tmpdir.join("missing").exists()
+
+    def test_record_operation_keeps_other_timings(self, tmpdir, FakeConfig):
+        metrics_file = tmpdir.join("ua.prom")
+        cfg = FakeConfig()
+        cfg.cfg["metrics_file"] = metrics_file.strpath
+        cfg.write_cache("operation-timings", {"attach": {"duration": 3}})
+
+        with mock.patch.object(metrics, "write_metrics") as m_write_metrics:
+            metrics.record_operation(
+                cfg, "enable", {"duration": 1.5, "outcome": "succeeded"}
+            )
+
+        timings = cfg.read_cache("operation-timings")
+        assert ["attach", "enable"] == sorted(timings)
+        assert 1.5 == timings["enable"]["duration"]
+        assert [mock.call(cfg)] == m_write_metrics.call_args_list
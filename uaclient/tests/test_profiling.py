@@ -0,0 +1,77 @@
+import os
+import pstats
+
+import mock
+import pytest
+
+from uaclient import profiling
+
+
+def busy():
+    return [str(i) for i in range(1000)]
+
+
+class TestProfileMode:
+    @pytest.mark.parametrize(
+        "flag,env,mode",
+        (
+            (None, None, None),
+            ("cpu", None, "cpu"),
+            (None, "1", "cpu"),
+            (None, "memory", "memory"),
+            ("memory", "cpu", "memory"),
+            (None, "everything", None),
+        ),
+    )
+    def test_flag_or_environment(self, flag, env, mode):
+        environ = {profiling.PROFILE_ENV: env} if env else {}
+        with mock.patch.dict("os.environ", environ, clear=True):
+            assert mode == profiling.profile_mode(mock.MagicMock(profile=flag))
+
+
+class TestProfiled:
+    def test_no_mode_writes_nothing(self, FakeConfig, tmpdir):
+        with profiling.profiled(FakeConfig(), "status", None):
+            busy()
+
+        assert not tmpdir.join(profiling.PROFILE_SUBDIR).exists()
+
+    @pytest.mark.parametrize("mode", ("cpu", "memory"))
+    def test_profile_and_summary_are_written(
+        self, mode, FakeConfig, tmpdir, capsys
+    ):
+        with profiling.profiled(FakeConfig(), "status", mode):
+            busy()
+
+        profile_dir = tmpdir.join(profiling.PROFILE_SUBDIR)
+        assert 0o700 == os.stat(profile_dir.strpath).st_mode & 0o777
+        [summary] = profile_dir.listdir("*.txt")
+        [profile] = profile_dir.listdir("*.prof")
+        assert summary.basename.startswith("status-")
+        assert "busy" in summary.read()
+        assert (mode == "memory") is ("allocation sites" in summary.read())
+        assert pstats.Stats(profile.strpath).total_calls > 0
+        _, err = capsys.readouterr()
+        assert "Profile written to {}\n".format(summary.strpath) == err
+
+    def test_old_profiles_are_pruned(self, FakeConfig, tmpdir):
+        cfg = FakeConfig()
+        with mock.patch.object(profiling, "PROFILE_KEEP", 2):
+            for pid in (1, 2, 3):
+                with mock.patch("uaclient.profiling.os.getpid") as m_getpid:
+                    m_getpid.return_value = pid
+                    with profiling.profiled(cfg, "status", "cpu"):
+                        busy()
+
+        profile_dir = tmpdir.join(profiling.PROFILE_SUBDIR)
+        assert 4 == len(profile_dir.listdir())
+        assert [] == profile_dir.listdir("*-1.*")
+
+    def test_write_failures_are_logged(self, FakeConfig, caplog_text):
+        with mock.patch(
+            "uaclient.profiling.util.write_file", side_effect=OSError("full")
+        ):
+            with profiling.profiled(FakeConfig(), "status", "cpu"):
+                busy()
+
+        assert "Failed to write profile" in caplog_text()
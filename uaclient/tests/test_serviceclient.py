@@ -52,6 +52,19 @@ class TestRequestUrl:
         for attr, expected_value in expected_attrs.items():
             assert expected_value == getattr(excinfo.value, attr)
 
+    @mock.patch("uaclient.serviceclient.util.readurl")
+    def test_httperror_keeps_response_headers(self, m_readurl):
+        """UrlError carries the response headers, such as Retry-After."""
+        m_readurl.side_effect = HTTPError(
+            None, 429, None, {"Retry-After": "30"}, BytesIO()
+        )
+
+        client = OurServiceClient(cfg=mock.Mock(url_attr="http://example.com"))
+        with pytest.raises(util.UrlError) as excinfo:
+            client.request_url("/", headers={"user-agent": "UA-Client/1.0"})
+
+        assert {"Retry-After": "30"} == excinfo.value.headers
+
     @mock.patch("uaclient.serviceclient.util.readurl")
     def test_urlerror_handling(self, m_readurl):
         m_readurl.side_effect = URLError(None)
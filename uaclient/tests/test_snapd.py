@@ -0,0 +1,170 @@
+import logging
+import os
+
+import mock
+import pytest
+
+from uaclient import snapd
+from uaclient.testing.snapd_server import SnapdServer, SnapdServerState
+
+
+@pytest.fixture
+def snapd_server():
+    servers = []
+
+    def factory(**kwargs):
+        srv = SnapdServer(SnapdServerState(**kwargs))
+        srv.start()
+        servers.append(srv)
+        return srv
+
+    with mock.patch("uaclient.snapd.time.sleep") as m_sleep:
+        factory.sleep = m_sleep
+        yield factory
+    for srv in servers:
+        srv.stop()
+
+
+class TestSnapdClientRequest:
+    def test_unreachable_socket_raises_snapd_error(self, tmpdir):
+        socket_path = tmpdir.join("missing.socket").strpath
+        client = snapd.SnapdClient(socket_path)
+
+        with pytest.raises(snapd.SnapdError) as excinfo:
+            client.request("GET", "/v2/changes/1")
+
+        assert excinfo.value.msg.startswith(
+            "Unable to reach snapd at {}: ".format(socket_path)
+        )
+
+    def test_error_responses_raise_with_kind(self, snapd_server):
+        srv = snapd_server()
+        client = snapd.SnapdClient(srv.socket_path)
+
+        with pytest.raises(snapd.SnapdError) as excinfo:
+            client.request("GET", "/v2/nope")
+
+        assert "snapd error: not found" == excinfo.value.msg
+        assert "not-found" == excinfo.value.kind
+
+    def test_default_socket_is_resolved_at_call_time(self):
+        with mock.patch("uaclient.snapd.SNAPD_SOCKET", "/other.socket"):
+            assert "/other.socket" == snapd.SnapdClient().socket_path
+
+
+class TestSnapdClientSeed:
+    @pytest.mark.parametrize("seed_polls,seeded", ((0, True), (1, False)))
+    def test_is_seeded(self, seed_polls, seeded, snapd_server):
+        srv = snapd_server(seed_polls=seed_polls)
+
+        assert seeded is snapd.SnapdClient(srv.socket_path).is_seeded()
+
+    def test_error_without_kind_from_older_snapd_is_unseeded(
+        self, snapd_server
+    ):
+        srv = snapd_server(seed_polls=1, seed_error_kind="")
+
+        assert False is snapd.SnapdClient(srv.socket_path).is_seeded()
+
+    def test_unreachable_snapd_is_not_unseeded(self, tmpdir):
+        client = snapd.SnapdClient(tmpdir.join("missing.socket").strpath)
+
+        with pytest.raises(snapd.SnapdError):
+            client.is_seeded()
+
+    def test_wait_for_seed_polls_with_backoff(self, snapd_server):
+        srv = snapd_server(seed_polls=3)
+
+        snapd.SnapdClient(srv.socket_path).wait_for_seed()
+
+        assert 4 == srv.state.requests["seed"]
+        assert [
+            mock.call(0.1),
+            mock.call(0.2),
+            mock.call(0.4),
+        ] == snapd_server.sleep.call_args_list
+
+    def test_wait_for_seed_times_out(self, snapd_server):
+        srv = snapd_server(seed_polls=1000)
+
+        with mock.patch("uaclient.snapd._poll_sleeps", return_value=iter([1])):
+            with pytest.raises(snapd.SnapdError) as excinfo:
+                snapd.SnapdClient(srv.socket_path).wait_for_seed(timeout=1)
+
+        assert (
+            "Timed out after 1 seconds waiting for snapd to load its seed"
+            == excinfo.value.msg
+        )
+
+
+class TestSnapdClientInstall:
+    def test_install_returns_change_id(self, snapd_server):
+        srv = snapd_server()
+
+        assert "1" == snapd.SnapdClient(srv.socket_path).install("snap-a")
+
+    def test_install_of_installed_snap_returns_none(self, snapd_server):
+        srv = snapd_server(installed=["snap-a"])
+
+        assert None is snapd.SnapdClient(srv.socket_path).install("snap-a")
+
+    @pytest.mark.parametrize("caplog_text", [logging.DEBUG], indirect=True)
+    def test_wait_for_change_logs_progress_until_ready(
+        self, snapd_server, caplog_text
+    ):
+        installed = []
+        srv = snapd_server(change_polls=2, on_install=installed.append)
+        client = snapd.SnapdClient(srv.socket_path)
+
+        change = client.wait_for_change(client.install("snap-a"))
+
+        assert "Done" == change["status"]
+        assert ["snap-a"] == installed
+        assert {"snap-a"} == srv.state.installed
+        assert 3 == srv.state.requests["change"]
+        assert 'snapd change 1: Download snap "snap-a" (1/3)' in caplog_text()
+        assert 'snapd change 1: Download snap "snap-a" (2/3)' in caplog_text()
+
+    def test_wait_for_change_reports_progress_changes(self, snapd_server):
+        srv = snapd_server(change_polls=2)
+        client = snapd.SnapdClient(srv.socket_path)
+        progress = []
+
+        client.wait_for_change(
+            client.install("snap-a"), on_progress=progress.append
+        )
+
+        assert [
+            'Download snap "snap-a" (1/3)',
+            'Download snap "snap-a" (2/3)',
+            "Done",
+        ] == progress
+
+    def test_wait_for_change_raises_change_errors(self, snapd_server):
+        srv = snapd_server(install_error="cannot download")
+        client = snapd.SnapdClient(srv.socket_path)
+
+        with pytest.raises(snapd.SnapdError) as excinfo:
+            client.wait_for_change(client.install("snap-a"))
+
+        assert (
+            'Install "snap-a" snap failed: cannot download'
+            == excinfo.value.msg
+        )
+        assert set() == srv.state.installed
+
+    def test_wait_for_unknown_change_raises(self, snapd_server):
+        srv = snapd_server()
+
+        with pytest.raises(snapd.SnapdError) as excinfo:
+            snapd.SnapdClient(srv.socket_path).wait_for_change("42")
+
+        assert 'cannot find change with id "42"' in excinfo.value.msg
+
+
+class TestSnapdServer:
+    def test_stop_removes_socket(self):
+        with SnapdServer() as srv:
+            assert os.path.exists(srv.socket_path)
+
+        assert not os.path.exists(srv.socket_path)
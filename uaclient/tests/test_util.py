@@ -1,9 +1,14 @@
 """Tests related to uaclient.util module."""
+import copy
 import datetime
+import io
 import json
 import logging
 import posix
 import subprocess
+import sys
+import threading
+import time
 import uuid
 
 import mock
@@ -347,6 +352,68 @@ class TestApplySeriesOverrides:
         assert expected == orig_access
 
 
+class TestWithSeriesOverrides:
+    def test_error_on_non_entitlement_dict(self):
+        """Raise the same error as apply_series_overrides."""
+        with pytest.raises(RuntimeError) as exc:
+            util.with_series_overrides({"some": "dict"}, "xenial")
+        assert 'Missing "entitlement" key' in str(exc.value)
+
+    def test_returns_copy_leaving_orig_access_untouched(self):
+        """Overrides are applied to a copy of orig_access."""
+
+        def make_access():
+            return {
+                "entitlement": {
+                    "a": {"a1": "av1"},
+                    "b": util.DROPPED_KEY,
+                    "series": {"xenial": {"a": {"a1": "xv1"}}},
+                }
+            }
+
+        orig_access = util.freeze(make_access())
+
+        access = util.with_series_overrides(orig_access, "xenial")
+
+        assert {
+            "entitlement": {"a": {"a1": "xv1"}, "b": util.DROPPED_KEY}
+        } == access
+        assert make_access() == orig_access
+
+
+class TestReadOnlyDict:
+    @pytest.mark.parametrize(
+        "change",
+        (
+            lambda d: d.__setitem__("a", 2),
+            lambda d: d.__delitem__("a"),
+            lambda d: d.update(a=2),
+            lambda d: d.setdefault("b", 2),
+            lambda d: d.pop("a"),
+            lambda d: d.clear(),
+        ),
+    )
+    def test_changes_raise_type_error(self, change):
+        frozen = util.freeze({"a": 1})
+        with pytest.raises(TypeError):
+            change(frozen)
+        assert {"a": 1} == frozen
+
+    def test_freeze_nested_values(self):
+        frozen = util.freeze({"a": [{"b": 1}], "c": {"d": 2}})
+        assert isinstance(frozen["a"][0], util.ReadOnlyDict)
+        assert isinstance(frozen["c"], util.ReadOnlyDict)
+
+    def test_copies_are_writable_dicts(self):
+        frozen = util.freeze({"a": {"b": 1}})
+        shallow = copy.copy(frozen)
+        deep = copy.deepcopy(frozen)
+        shallow["c"] = 3
+        deep["a"]["b"] = 2
+        assert type(deep["a"]) is dict
+        assert {"a": {"b": 1}} == frozen
+
+
 class TestGetMachineId:
     def test_get_machine_id_from_etc_machine_id(self, tmpdir):
         """Presence of /etc/machine-id is returned if it exists."""
@@ -453,6 +520,41 @@ class TestReadurl:
         assert data == req.data
 
 
+class TestLogPayload:
+    def test_sensitive_values_are_redacted(self):
+        payload = {
+            "machineToken": "s3cr3t",
+            "machineTokenInfo": {"contractInfo": {"id": "cid"}},
+            "resourceTokens": [{"token": "s3cr3t", "type": "esm-infra"}],
+        }
+
+        rendered = str(util.LogPayload(json.dumps(payload).encode("utf-8")))
+
+        assert "s3cr3t" not in rendered
+        assert {
+            "machineToken": "<REDACTED>",
+            "machineTokenInfo": {"contractInfo": {"id": "cid"}},
+            "resourceTokens": [{"token": "<REDACTED>", "type": "esm-infra"}],
+        } == json.loads(rendered)
+
+    def test_headers_are_redacted(self):
+        rendered = str(util.LogPayload({"Authorization": "Bearer s3cr3t"}))
+
+        assert '{"Authorization": "<REDACTED>"}' == rendered
+
+    def test_long_payloads_are_capped(self):
+        rendered = str(util.LogPayload("x" * 20, max_chars=8))
+
+        assert "xxxxxxxx... (12 more characters)" == rendered
+
+    def test_payloads_are_not_rendered_unless_logged(self, logging_sandbox):
+        logging.getLogger().setLevel(logging.INFO)
+        with mock.patch("uaclient.util.redact") as m_redact:
+            logging.debug("payload %s", util.LogPayload({"a": 1}))
+
+        assert 0 == m_redact.call_count
+
+
 class TestDisableLogToConsole:
     @pytest.mark.parametrize("caplog_text", [logging.DEBUG], indirect=True)
     def test_no_error_if_console_handler_not_found(self, caplog_text):
@@ -503,6 +605,95 @@ class TestDisableLogToConsole:
         assert "test error" in combined_output
         assert "test info" in combined_output
 
+    def test_overlapping_bodies_restore_console_level_last(
+        self, logging_sandbox, capsys
+    ):
+        cli.setup_logging(logging.INFO, logging.INFO)
+        first = util.disable_log_to_console()
+        second = util.disable_log_to_console()
+
+        # Interleaved as by two lanes running in different threads
+        first.__enter__()
+        second.__enter__()
+        first.__exit__(None, None, None)
+        logging.error("while second lane is silent")
+        second.__exit__(None, None, None)
+        logging.error("after both lanes")
+
+        out, err = capsys.readouterr()
+        assert "while second lane is silent" not in out + err
+        assert "after both lanes" in out + err
+
+
+class TestRunInLanes:
+    def test_single_lane_runs_in_calling_thread(self):
+        threads = []
+
+        util.run_in_lanes(
+            [["a", "b"]], lambda lane: threads.append(threading.get_ident())
+        )
+
+        assert [threading.get_ident()] == threads
+
+    def test_lanes_run_concurrently(self):
+        started = threading.Event()
+        processed = []
+
+        def process_lane(lane):
+            if lane == ["a"]:
+                assert started.wait(5), "second lane did not run concurrently"
+            else:
+                started.set()
+            processed.append(lane)
+
+        util.run_in_lanes([["a"], ["b"]], process_lane)
+
+        assert [["b"], ["a"]] == processed
+
+    def test_concurrent_output_is_serialized_by_line(self, capsys):
+        def process_lane(lane):
+            for _ in range(50):
+                print(lane, "start", end="")
+                print("", "end")
+
+        util.run_in_lanes(["a", "b", "c"], process_lane)
+
+        out, _err = capsys.readouterr()
+        lines = out.splitlines()
+        assert 150 == len(lines)
+        assert set(["a start end", "b start end", "c start end"]) == set(lines)
+
+    def test_flush_writes_partial_lines_of_every_thread(self):
+        stream = io.StringIO()
+        serialized = util._LineSerializedStream(stream)
+        other = threading.Thread(target=serialized.write, args=("b",))
+
+        serialized.write("a")
+        other.start()
+        other.join()
+        serialized.flush()
+
+        assert "ab" == stream.getvalue()
+
+    def test_lanes_are_joined_before_first_lane_error_propagates(self):
+        orig_stdout = sys.stdout
+        release = threading.Event()
+        finished = []
+
+        def process_lane(lane):
+            if lane == "a":
+                release.set()
+                raise RuntimeError("first lane failed")
+            assert release.wait(5)
+            time.sleep(0.05)
+            finished.append(lane)
+
+        with pytest.raises(RuntimeError):
+            util.run_in_lanes(["a", "b"], process_lane)
+
+        assert ["b"] == finished
+        assert orig_stdout is sys.stdout
+
 
 JSON_TEST_PAIRS = (
     ("a", '"a"'),
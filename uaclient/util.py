@@ -1,10 +1,13 @@
 from errno import ENOENT
+import copy
 import datetime
 import json
 import logging
 import os
 import re
 import subprocess
+import sys
+import threading
 import time
 from urllib import error, request
 from urllib.parse import urlparse
@@ -40,9 +43,19 @@ ETC_MACHINE_ID = "/etc/machine-id"
 DBUS_MACHINE_ID = "/var/lib/dbus/machine-id"
 DROPPED_KEY = object()
 
+# Serialize console changes and prompts made from concurrent lanes
+_console_lock = threading.Lock()
+_console_disabled = {"depth": 0, "level": None}  # type: Dict[str, Any]
+_prompt_lock = threading.Lock()
+
 # N.B. this relies on the version normalisation we perform in get_platform_info
 REGEX_OS_RELEASE_VERSION = r"(?P<release>\d+\.\d+) (LTS )?\((?P<series>\w+).*"
 
+LOG_PAYLOAD_MAX_CHARS = 2048
+# String values of keys matching this are never logged
+REGEX_SENSITIVE_KEY = re.compile(r"token|authorization|password|secret", re.I)
+REDACTED = "<REDACTED>"
+
 
 class LogFormatter(logging.Formatter):
 
@@ -56,6 +69,64 @@ class LogFormatter(logging.Formatter):
         return logging.Formatter(log_fmt).format(record)
 
 
+def redact(payload: "Any") -> "Any":
+    """Return a copy of payload with the values of sensitive keys redacted."""
+    if isinstance(payload, dict):
+        return dict(
+            (
+                key,
+                REDACTED
+                if isinstance(value, str)
+                and REGEX_SENSITIVE_KEY.search(str(key))
+                else redact(value),
+            )
+            for key, value in payload.items()
+        )
+    if isinstance(payload, list):
+        return [redact(value) for value in payload]
+    return payload
+
+
+class LogPayload:
+    """Log argument which renders payload only when the log record is emitted.
+
+    The payload is redacted and its rendering capped at max_chars, so debug
+    logging of request and response bodies neither leaks credentials nor
+    formats whole machine tokens. Pass instances as logging arguments:
+
+        logging.debug("Response: %s", LogPayload(content))
+    """
+
+    __slots__ = ("payload", "max_chars")
+
+    def __init__(
+        self, payload: "Any", max_chars: int = LOG_PAYLOAD_MAX_CHARS
+    ) -> None:
+        self.payload = payload
+        self.max_chars = max_chars
+
+    def __str__(self) -> str:
+        payload = self.payload
+        if isinstance(payload, bytes):
+            payload = payload.decode("utf-8", "replace")
+        if isinstance(payload, str):
+            try:
+                payload = json.loads(payload)
+            except ValueError:
+                pass
+        elif hasattr(payload, "items"):  # HTTPMessage headers
+            payload = dict(payload.items())
+        if isinstance(payload, (dict, list)):
+            text = json.dumps(redact(payload), default=str, sort_keys=True)
+        else:
+            text = str(payload)
+        if len(text) > self.max_chars:
+            text = "{}... ({} more characters)".format(
+                text[: self.max_chars], len(text) - self.max_chars
+            )
+        return text
+
+
 class UrlError(IOError):
     def __init__(
         self,
@@ -142,6 +213,60 @@ class DatetimeAwareJSONDecoder(json.JSONDecoder):
         return o
 
 
+class ReadOnlyDict(dict):
+    """A dict whose items cannot be changed.
+
+    Copies made with copy.copy or copy.deepcopy are ordinary dicts.
+    """
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("{} is read-only".format(type(self).__name__))
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __copy__(self) -> "Dict[Any, Any]":
+        return dict(self)
+
+    def __deepcopy__(self, memo) -> "Dict[Any, Any]":
+        return dict(
+            (key, copy.deepcopy(value, memo)) for key, value in self.items()
+        )
+
+
+def freeze(value: "Any") -> "Any":
+    """Return a copy of value with every dict in it made a ReadOnlyDict."""
+    if isinstance(value, dict):
+        return ReadOnlyDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return [freeze(item) for item in value]
+    return value
+
+
+def _check_entitlement_access(orig_access: "Dict[str, Any]") -> None:
+    if not all([isinstance(orig_access, dict), "entitlement" in orig_access]):
+        raise RuntimeError(
+            'Expected entitlement access dict. Missing "entitlement" key:'
+            " {}".format(orig_access)
+        )
+
+
+def with_series_overrides(
+    orig_access: "Dict[str, Any]", series: "Optional[str]" = None
+) -> "Dict[str, Any]":
+    """Return a copy of orig_access with its series overrides applied.
+
+    Unlike apply_series_overrides, orig_access is left untouched.
+
+    :raise RuntimeError: when orig_access is not an entitlement access dict.
+    """
+    _check_entitlement_access(orig_access)
+    # Deltas mark dropped keys with the DROPPED_KEY sentinel, keep it as is
+    access = copy.deepcopy(orig_access, {id(DROPPED_KEY): DROPPED_KEY})
+    apply_series_overrides(access, series)
+    return access
+
+
 def apply_series_overrides(
     orig_access: "Dict[str, Any]", series: str = None
 ) -> None:
@@ -159,11 +284,7 @@ def apply_series_overrides(
 
     :param orig_access: Dict with original entitlement access details
     """
-    if not all([isinstance(orig_access, dict), "entitlement" in orig_access]):
-        raise RuntimeError(
-            'Expected entitlement access dict. Missing "entitlement" key:'
-            " {}".format(orig_access)
-        )
+    _check_entitlement_access(orig_access)
     series_name = get_platform_info()["series"] if series is None else series
     orig_entitlement = orig_access.get("entitlement", {})
     overrides = orig_entitlement.pop("series", {}).pop(series_name, {})
@@ -216,16 +337,92 @@ def disable_log_to_console():
         return
 
     console_handler = potential_handlers[0]
-    old_level = console_handler.level
-    if old_level == logging.DEBUG:
+    if console_handler.level == logging.DEBUG:
         yield
         return
 
-    console_handler.setLevel(1000)
+    # Only the outermost of concurrently nested bodies restores the level
+    with _console_lock:
+        if not _console_disabled["depth"]:
+            _console_disabled["level"] = console_handler.level
+            console_handler.setLevel(1000)
+        _console_disabled["depth"] += 1
     try:
         yield
     finally:
-        console_handler.setLevel(old_level)
+        with _console_lock:
+            _console_disabled["depth"] -= 1
+            if not _console_disabled["depth"]:
+                console_handler.setLevel(_console_disabled["level"])
+
+
+class _LineSerializedStream:
+    """Wrap a text stream so concurrent threads only write whole lines.
+
+    Each thread's partial lines are buffered until completed or flushed.
+    """
+
+    def __init__(self, stream) -> None:
+        self._stream = stream
+        self._pending = {}  # type: Dict[int, str]
+
+    def write(self, text: str) -> int:
+        thread_id = threading.get_ident()
+        with _console_lock:
+            pending = self._pending.pop(thread_id, "") + text
+            lines, newline, rest = pending.rpartition("\n")
+            if rest:
+                self._pending[thread_id] = rest
+            if newline:
+                self._stream.write(lines + newline)
+        return len(text)
+
+    def flush(self) -> None:
+        """Write the partial lines pending in every thread, then flush."""
+        with _console_lock:
+            for pending in self._pending.values():
+                self._stream.write(pending)
+            self._pending.clear()
+            self._stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self._stream, name)
+
+
+def run_in_lanes(lanes: "Sequence[Any]", process_lane) -> None:
+    """Call process_lane on each lane, running the lanes concurrently.
+
+    The first lane runs in the calling thread and every other lane in its own
+    thread. While more than one lane runs, output printed to stdout is
+    serialized line by line and prompt_for_confirmation prompts one lane at
+    a time. All lanes are joined before returning, even when the first lane
+    raises.
+
+    :param lanes: Sequence of lanes, for example lists of entitlement names.
+    :param process_lane: Callable receiving a lane. It must handle its own
+        exceptions, as exceptions raised in other threads are lost.
+    """
+    if len(lanes) < 2:
+        for lane in lanes:
+            process_lane(lane)
+        return
+    threads = [
+        threading.Thread(target=process_lane, args=(lane,))
+        for lane in lanes[1:]
+    ]
+    started = []
+    orig_stdout = sys.stdout
+    sys.stdout = _LineSerializedStream(orig_stdout)
+    try:
+        for thread in threads:
+            thread.start()
+            started.append(thread)
+        process_lane(lanes[0])
+    finally:
+        for thread in started:
+            thread.join()
+        sys.stdout.flush()
+        sys.stdout = orig_stdout
 
 
 def retry(exception, retry_sleeps):
@@ -411,7 +608,8 @@ def prompt_for_confirmation(msg: str = "", assume_yes: bool = False) -> bool:
         return True
     if not msg:
         msg = status.PROMPT_YES_NO
-    value = input(msg)
+    with _prompt_lock:
+        value = input(msg)
     if value.lower().strip() in ["y", "yes"]:
         return True
     return False
@@ -430,8 +628,8 @@ def readurl(
         "URL [%s]: %s, headers: %s, data: %s",
         method or "GET",
         url,
-        headers,
-        data,
+        LogPayload(headers),
+        LogPayload(data),
     )
     resp = request.urlopen(req)
     content = resp.read().decode("utf-8")
@@ -441,8 +639,8 @@ def readurl(
         "URL [%s] response: %s, headers: %s, data: %s",
         method or "GET",
         url,
-        resp.headers,
-        content,
+        LogPayload(resp.headers),
+        LogPayload(content),
     )
     return content, resp.headers
 